@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
+
+Serve the project through this module (e.g. ``uvicorn car_hub.asgi:application``)
+to get the pushed notification stream; under WSGI the navbar badge falls
+back to polling. The default database broker (cars/pubsub.py) reaches
+streams in every worker process, so any number of workers can be run;
+the in-process LocalBroker needs a single one, see NOTIFICATION_BROKER in settings.
 """
 
 import os
@@ -14,3 +20,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'car_hub.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings
+
+if settings.DEBUG:
+    # Static files as runserver would serve them
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+    application = ASGIStaticFilesHandler(application)
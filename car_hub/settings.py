@@ -89,11 +89,19 @@ if os.environ.get('USE_MYSQL') == 'True':
             'PORT': '3306',
         }
     }
+    # MySQL has no partial indexes; the conditional indexes in cars/models.py each
+    # have a composite counterpart that MySQL uses instead
+    SILENCED_SYSTEM_CHECKS = ['models.W037']
 else:
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # SQLite ignores select_for_update; taking the write lock when a transaction
+            # starts serializes writers the same way, and they wait instead of failing
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file, not the shared in-memory database, so threaded tests get real locking
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
         }
     }
 
@@ -142,6 +150,30 @@ LOGOUT_REDIRECT_URL = 'welcome'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Exchange rates for the currency adapter: a JSON file path or an http(s) URL
+# returning {"rates": {"USD": 120.0, ...}} (BDT per unit). Unset uses the built-in rates.
+EXCHANGE_RATES_SOURCE = os.environ.get('EXCHANGE_RATES_SOURCE')
+EXCHANGE_RATES_TTL = 60 * 60
+
+# Pub/sub behind the live notification stream. The database broker reaches streams in
+# every process (web workers and the outbox worker), polled once per process every
+# NOTIFICATION_BROKER_POLL seconds; 'cars.pubsub.LocalBroker' only reaches the same process.
+NOTIFICATION_BROKER = 'cars.pubsub.DatabaseBroker'
+NOTIFICATION_BROKER_POLL = 1.0
+
+# Handled outbox messages are deleted by the outbox worker this many hours later
+OUTBOX_RETENTION_HOURS = 24
+
+# Read notifications older than this are moved to the archive by `manage.py archive_notifications`
+NOTIFICATION_RETENTION_DAYS = 90
+
+# Seconds within which repeated alerts of the same kind (e.g. one car's price changes)
+# update the follower's unread notification instead of adding another; 0 disables
+NOTIFICATION_COALESCE_WINDOW = 60 * 60
+
+# Seconds the admin dashboard snapshot is cached for (see cars/dashboard.py)
+ADMIN_DASHBOARD_TTL = 30
+
 # Message tags for CSS classes
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Car, Order, Notification, UserProfile, CarImage
+from .models import Car, Order, Notification, UserProfile, CarImage, OutboxMessage
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
@@ -24,3 +24,9 @@ admin.site.register(Car)
 admin.site.register(Notification)
 admin.site.register(UserProfile)
 admin.site.register(CarImage)
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'topic', 'key', 'status', 'attempts', 'available_at', 'created_at']
+    list_filter = ['status', 'topic']
+    search_fields = ['key']
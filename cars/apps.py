@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CarsConfig(AppConfig):
     name = 'cars'
+
+    def ready(self):
+        # Register signal handlers
+        from . import signals
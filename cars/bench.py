@@ -0,0 +1,116 @@
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks seed their own rows inside a transaction that is rolled back at
+the end, so they can be pointed at a development database without leaving
+anything behind.
+"""
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from .models import Car
+
+MAKES = {
+    'Toyota': ['Corolla', 'Camry', 'Premio', 'Allion', 'Land Cruiser'],
+    'Honda': ['Civic', 'Accord', 'CR-V', 'Vezel'],
+    'Nissan': ['Altima', 'X-Trail', 'Sunny'],
+    'Ford': ['Mustang', 'F-150', 'Ranger'],
+    'BMW': ['M5', 'X5', '320i'],
+    'Audi': ['A4', 'Q7'],
+    'Mitsubishi': ['Lancer', 'Pajero'],
+}
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def scratch_data():
+    """Run the block in a transaction that is always rolled back"""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+@contextmanager
+def run_on_commit():
+    """
+    Run the on-commit callbacks registered in the block when it ends. Inside
+    scratch_data the transaction never commits, so they would otherwise never run.
+    """
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for _, callback, _ in callbacks:
+        callback()
+
+
+def bench_user(username='bench_seller'):
+    user, _ = User.objects.get_or_create(username=username, defaults={'email': f'{username}@carhub.test'})
+    return user
+
+
+def seed_cars(count, owner, approval_status='approved', seed=327, batch_size=2000):
+    """
+    Bulk insert `count` cars with a deterministic spread of makes, prices, years and mileage.
+    `owner` is a user or a list of users to spread the cars over.
+    """
+    rng = random.Random(seed)
+    owners = owner if isinstance(owner, list) else [owner]
+    makes = list(MAKES)
+    car_types = [key for key, _ in Car.CAR_TYPES]
+    cars = []
+    for _ in range(count):
+        make = rng.choice(makes)
+        cars.append(Car(
+            make=make,
+            model=rng.choice(MAKES[make]),
+            year=rng.randint(1995, 2025),
+            price=rng.randint(5, 400) * 50000,
+            mileage=rng.randint(0, 300000),
+            car_type=rng.choice(car_types),
+            status='sold' if rng.random() < 0.2 else 'available',
+            approval_status=approval_status,
+            owner=rng.choice(owners),
+        ))
+    Car.objects.bulk_create(cars, batch_size=batch_size)
+    return count
+
+
+def analyze():
+    """Refresh planner statistics after a bulk insert"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute('ANALYZE TABLE cars_car')
+        else:
+            cursor.execute('ANALYZE')
+
+
+def measure(fn, repeat=20):
+    """Call fn `repeat` times and return the median wall time in milliseconds"""
+    fn()  # warm-up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def bench_users(count, prefix='bench_user'):
+    """Bulk insert `count` users and return them"""
+    User.objects.bulk_create(
+        [User(username=f'{prefix}_{i}', email=f'{prefix}_{i}@carhub.test') for i in range(count)],
+        batch_size=2000,
+    )
+    return list(User.objects.filter(username__startswith=f'{prefix}_'))
@@ -0,0 +1,108 @@
+"""
+Coalescing of repeated alerts.
+
+A seller adjusting a price several times would otherwise add one notification
+per change to every follower. Messages with a group (one car's price changes)
+are instead merged into the follower's unread notification of that group if
+it was touched within NOTIFICATION_COALESCE_WINDOW seconds: it is updated in
+place ("from X to Z") and moved to the top of the inbox, without a new row or
+another unread count.
+
+Users who chose the digest get no notification per alert at all. Their alerts
+are kept as DigestItems (coalesced the same way) and `manage.py
+send_notification_digests`, run periodically, turns each user's pending items
+into one notification.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DigestItem, Notification
+from .notification_kinds import merge_params
+from .notifications import add_unread_many, publish_many
+
+
+def coalesce_window():
+    return timedelta(seconds=getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 60 * 60))
+
+
+def coalesce(queryset, user_ids, message, since=None):
+    """
+    Merge message into the pending rows of its group for the given users.
+    Returns the updated rows; users without one are left for the caller.
+    """
+    if not message.group:
+        return []
+    pending = queryset.filter(user_id__in=user_ids, group=message.group, kind=message.kind)
+    if since is not None:
+        pending = pending.filter(created_at__gte=since)
+    rows = {}
+    for row in pending.order_by('created_at', 'id'):
+        # Normally one per user; keep the newest
+        rows[row.user_id] = row
+    now = timezone.now()
+    for row in rows.values():
+        row.params = merge_params(message.kind, row.params, message.params)
+        row.created_at = now
+    if rows:
+        queryset.model.objects.bulk_update(rows.values(), ['params', 'created_at'])
+    return list(rows.values())
+
+
+def notify_users(user_ids, message):
+    """Notify the (distinct) users at once, coalescing into their unread notifications where possible"""
+    window = coalesce_window()
+    updated = []
+    if window:
+        updated = coalesce(Notification.objects.filter(is_read=False), user_ids, message, timezone.now() - window)
+    merged = {row.user_id for row in updated}
+    new_ids = [user_id for user_id in user_ids if user_id not in merged]
+    # bulk_create sends no post_save, so keep the unread counters and live streams in step here
+    created = Notification.objects.bulk_create(
+        [Notification(user_id=user_id, kind=message.kind, params=message.params, group=message.group) for user_id in new_ids]
+    )
+    if new_ids:
+        add_unread_many(new_ids)
+    publish_many(updated + created)
+
+
+def queue_for_digest(user_ids, message):
+    """Keep the alert for the users' next digest"""
+    merged = {row.user_id for row in coalesce(DigestItem.objects.all(), user_ids, message)}
+    DigestItem.objects.bulk_create(
+        [DigestItem(user_id=user_id, kind=message.kind, params=message.params, group=message.group)
+         for user_id in user_ids if user_id not in merged]
+    )
+
+
+def send_digests(batch_size=500):
+    """Turn every user's pending digest items into one notification. Returns how many were sent."""
+    sent = 0
+    last_user = 0
+    while True:
+        with transaction.atomic():
+            user_ids = list(
+                DigestItem.objects.filter(user_id__gt=last_user).order_by('user_id')
+                .values_list('user_id', flat=True).distinct()[:batch_size]
+            )
+            if not user_ids:
+                return sent
+            items = {}
+            item_ids = []
+            for pk, user_id, kind, params in (
+                DigestItem.objects.select_for_update().filter(user_id__in=user_ids)
+                .order_by('created_at', 'id').values_list('id', 'user_id', 'kind', 'params')
+            ):
+                items.setdefault(user_id, []).append({'kind': kind, 'params': params})
+                item_ids.append(pk)
+            notifications = Notification.objects.bulk_create([
+                Notification(user_id=user_id, kind='digest', params={'count': len(user_items), 'items': user_items})
+                for user_id, user_items in items.items()
+            ])
+            add_unread_many(list(items))
+            publish_many(notifications)
+            DigestItem.objects.filter(id__in=item_ids).delete()
+        sent += len(notifications)
+        last_user = user_ids[-1]
@@ -0,0 +1,136 @@
+"""
+Admin dashboard metrics.
+
+The site totals (users, listings, available and sold cars) are DashboardCounter
+rows that the handlers in signals.py adjust as users and cars are saved or
+deleted, so reading them is one small query however big the tables get.
+Pending and paid orders are counted live, in one conditional aggregate,
+because accept_order moves orders between those states with queryset.update(),
+which sends no signals.
+
+The dashboard itself renders from a snapshot of all of that (plus the recent
+users, cars and orders) cached for ADMIN_DASHBOARD_TTL seconds. Run
+`manage.py refresh_dashboard --interval N` to rebuild it in the background so
+no admin request ever has to; `--rebuild` recomputes the counters from scratch.
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Value, When
+from django.utils import timezone
+
+from .models import Car, DashboardCounter, Order
+
+COUNTERS = ('total_users', 'total_cars', 'available_cars', 'sold_cars')
+SNAPSHOT_KEY = 'admin-dashboard:snapshot'
+RECENT = 10
+
+
+def snapshot_ttl():
+    return getattr(settings, 'ADMIN_DASHBOARD_TTL', 30)
+
+
+def car_counts(values):
+    """What a car with these field values (by attname) adds to the totals"""
+    if values is None:
+        return {}
+    return {
+        'total_cars': 1,
+        'available_cars': int(values['status'] == 'available'),
+        'sold_cars': int(values['status'] == 'sold'),
+    }
+
+
+def user_counts(is_superuser):
+    """What a user adds to the totals; None for no user. Admins are not counted."""
+    return {'total_users': int(is_superuser is False)}
+
+
+def apply_change(before, after):
+    """Add the difference between two count dicts to the counters, in one UPDATE"""
+    deltas = {name: after.get(name, 0) - before.get(name, 0) for name in COUNTERS}
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if _increment(deltas) == len(deltas):
+        return
+    existing = set(DashboardCounter.objects.filter(name__in=deltas).values_list('name', flat=True))
+    missing = {name: delta for name, delta in deltas.items() if name not in existing}
+    try:
+        with transaction.atomic():
+            DashboardCounter.objects.bulk_create([DashboardCounter(name=name, value=delta) for name, delta in missing.items()])
+    except IntegrityError:
+        # Created by a concurrent request in the meantime
+        _increment(missing)
+
+
+def _increment(deltas):
+    return DashboardCounter.objects.filter(name__in=deltas).update(
+        value=F('value') + Case(*(When(name=name, then=Value(delta)) for name, delta in deltas.items()), default=Value(0))
+    )
+
+
+def rebuild_counters():
+    """Recompute the counters with one conditional aggregate over cars and a count of users"""
+    totals = Car.objects.aggregate(
+        total_cars=Count('id'),
+        available_cars=Count('id', filter=Q(status='available')),
+        sold_cars=Count('id', filter=Q(status='sold')),
+    )
+    totals['total_users'] = User.objects.filter(is_superuser=False).count()
+    with transaction.atomic():
+        DashboardCounter.objects.filter(name__in=COUNTERS).delete()
+        DashboardCounter.objects.bulk_create([DashboardCounter(name=name, value=totals[name]) for name in COUNTERS])
+    return totals
+
+
+def build_snapshot():
+    """Everything the dashboard shows, in a fixed number of queries"""
+    snapshot = dict.fromkeys(COUNTERS, 0)
+    snapshot.update(DashboardCounter.objects.filter(name__in=COUNTERS).values_list('name', 'value'))
+    snapshot.update(Order.objects.aggregate(
+        pending_orders=Count('id', filter=Q(status='pending')),
+        paid_orders=Count('id', filter=Q(status='paid')),
+    ))
+
+    recent_users = list(User.objects.filter(is_superuser=False).order_by('-date_joined')[:RECENT])
+    car_counts_by_owner = dict(
+        Car.objects.filter(owner__in=recent_users).order_by().values('owner').annotate(count=Count('id')).values_list('owner', 'count')
+    )
+    snapshot['recent_users'] = [{'user': user, 'car_count': car_counts_by_owner.get(user.pk, 0)} for user in recent_users]
+    snapshot['recent_cars'] = list(Car.objects.select_related('owner').order_by('-created_at')[:RECENT])
+    snapshot['recent_orders'] = list(Order.objects.select_related('car__owner', 'buyer').order_by('-created_at')[:RECENT])
+    snapshot['taken_at'] = timezone.now()
+    return snapshot
+
+
+def refresh_snapshot(ttl=None):
+    snapshot = build_snapshot()
+    cache.set(SNAPSHOT_KEY, snapshot, snapshot_ttl() if ttl is None else ttl)
+    return snapshot
+
+
+def get_snapshot():
+    """The cached snapshot, rebuilt when it has expired"""
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        snapshot = refresh_snapshot()
+    return snapshot
+
+
+def invalidate_snapshot():
+    cache.delete(SNAPSHOT_KEY)
+
+
+def run_refresher(interval, iterations=None):
+    """Keep the snapshot fresh every `interval` seconds; it outlives one missed refresh"""
+    done = 0
+    while iterations is None or done < iterations:
+        refresh_snapshot(max(snapshot_ttl(), interval * 2))
+        done += 1
+        if iterations is None or done < iterations:
+            time.sleep(interval)
+    return done
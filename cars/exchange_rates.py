@@ -0,0 +1,172 @@
+"""
+Exchange rates behind the currency adapter.
+
+Rates come from a provider (built-in table, a JSON file or an HTTP endpoint,
+see EXCHANGE_RATES_SOURCE in settings) and are kept in one process-wide
+snapshot. Readers only ever look at the current snapshot, so a page render
+never waits on the provider: when the snapshot is older than its TTL it is
+still served while a background thread fetches a new one, and a failed fetch
+leaves the last good rates in place.
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+import urllib.request
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 1 unit of currency = X BDT. Used until the first fetch completes and by the default provider.
+DEFAULT_RATES = {
+    'BDT': 1.0,
+    'USD': 120.0,
+    'GBP': 150.0,
+    'EUR': 130.0,
+    'INR': 1.45,
+}
+
+DEFAULT_TTL = 60 * 60
+
+
+class RateProvider:
+    def fetch(self):
+        """Return a dict of currency code -> BDT per unit"""
+        raise NotImplementedError
+
+
+class StaticRateProvider(RateProvider):
+    def __init__(self, rates=None):
+        self.rates = dict(rates or DEFAULT_RATES)
+
+    def fetch(self):
+        return dict(self.rates)
+
+
+def parse_rates(data):
+    """Accept either {"rates": {...}} or a bare {code: rate} mapping"""
+    rates = data.get('rates', data)
+    parsed = {str(code).upper(): float(rate) for code, rate in rates.items()}
+    if any(rate <= 0 for rate in parsed.values()):
+        raise ValueError('Exchange rates must be positive')
+    parsed['BDT'] = 1.0
+    return parsed
+
+
+class FileRateProvider(RateProvider):
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self):
+        with open(self.path, encoding='utf-8') as f:
+            return parse_rates(json.load(f))
+
+
+class HTTPRateProvider(RateProvider):
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            return parse_rates(json.load(response))
+
+
+class RateSnapshot:
+    """An immutable set of rates. The version is derived from the rates themselves."""
+
+    def __init__(self, rates, fetched_at):
+        self.rates = dict(rates)
+        self.fetched_at = fetched_at
+        raw = json.dumps(self.rates, sort_keys=True)
+        self.version = hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+    def rate(self, currency):
+        return self.rates.get(currency, 1.0)
+
+
+class RateCache:
+    """
+    Holds the current snapshot and refreshes it in the background.
+
+    A snapshot is fresh for `ttl` seconds. After that it is still returned
+    (stale-while-revalidate) while at most one refresh thread runs. A failed
+    refresh is retried after `retry_after` seconds.
+    """
+
+    def __init__(self, provider, ttl=DEFAULT_TTL, retry_after=60, clock=time.monotonic):
+        self.provider = provider
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._thread = None
+        # Start from the built-in rates, already due for a refresh
+        self._snapshot = RateSnapshot(DEFAULT_RATES, fetched_at=None)
+        self._next_refresh = clock()
+
+    def get(self):
+        """Current snapshot, starting a background refresh if it is due. Never blocks on the provider."""
+        if self.clock() >= self._next_refresh:
+            self._start_refresh()
+        return self._snapshot
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        self._thread = threading.Thread(target=self.refresh, name='exchange-rate-refresh', daemon=True)
+        self._thread.start()
+
+    def refresh(self):
+        """Fetch new rates now. Returns True if the snapshot was replaced."""
+        try:
+            rates = self.provider.fetch()
+        except Exception:
+            # Keep serving the last good rates
+            logger.exception('Exchange rate refresh failed, keeping rates from version %s', self._snapshot.version)
+            self._next_refresh = self.clock() + self.retry_after
+            return False
+        else:
+            now = self.clock()
+            self._snapshot = RateSnapshot(rates, fetched_at=now)
+            self._next_refresh = now + self.ttl
+            return True
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def wait(self, timeout=None):
+        """Wait for a running background refresh (for tests and management commands)"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def build_provider(source):
+    if not source:
+        return StaticRateProvider()
+    if source.startswith(('http://', 'https://')):
+        return HTTPRateProvider(source)
+    return FileRateProvider(source)
+
+
+_rate_cache = None
+_rate_cache_lock = threading.Lock()
+
+
+def get_rate_cache():
+    global _rate_cache
+    if _rate_cache is None:
+        with _rate_cache_lock:
+            if _rate_cache is None:
+                provider = build_provider(getattr(settings, 'EXCHANGE_RATES_SOURCE', None))
+                _rate_cache = RateCache(provider, ttl=getattr(settings, 'EXCHANGE_RATES_TTL', DEFAULT_TTL))
+    return _rate_cache
+
+
+def current_rates():
+    return get_rate_cache().get()
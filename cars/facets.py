@@ -0,0 +1,126 @@
+"""
+Facet counts for the home page filters.
+
+All facets (type, make, year bucket, price band) are computed from a single
+GROUP BY over the filtered cars and cached per normalized filter set.
+The cache is invalidated by bumping a generation number whenever a change
+could move a car between facet values (see signals.py).
+"""
+import hashlib
+import json
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .exchange_rates import current_rates
+from .models import Car
+
+FACET_CACHE_TIMEOUT = 60 * 10
+GENERATION_KEY = 'facets:generation'
+
+# Fields whose change can move an approved car between facet values
+FACET_FIELDS = {'approval_status', 'status', 'make', 'car_type', 'year', 'price'}
+
+# (label, low, high): low <= value < high, None is open-ended. Half-open bands
+# leave no gaps between neighbours, even for fractional prices like 999999.50.
+YEAR_BUCKETS = [
+    ('2020 & newer', 2020, None),
+    ('2015 - 2019', 2015, 2020),
+    ('2010 - 2014', 2010, 2015),
+    ('2000 - 2009', 2000, 2010),
+    ('Before 2000', None, 2000),
+]
+
+# Prices in BDT
+PRICE_BANDS = [
+    ('Under 10 Lakh', None, 1000000),
+    ('10 - 25 Lakh', 1000000, 2500000),
+    ('25 - 50 Lakh', 2500000, 5000000),
+    ('50 Lakh - 1 Crore', 5000000, 10000000),
+    ('1 Crore+', 10000000, None),
+]
+
+
+def band_filter(field, low, high):
+    """Q for low <= field < high; either bound may be None"""
+    condition = Q()
+    if low is not None:
+        condition &= Q(**{f'{field}__gte': low})
+    if high is not None:
+        condition &= Q(**{f'{field}__lt': high})
+    return condition
+
+
+def bucket_case(field, buckets):
+    """CASE expression giving the index of the bucket a row falls into"""
+    whens = [When(band_filter(field, low, high), then=Value(index)) for index, (label, low, high) in enumerate(buckets)]
+    return Case(*whens, default=Value(None), output_field=IntegerField())
+
+
+def compute_facets(queryset):
+    """Count cars per type, make, year bucket and price band in one grouped query"""
+    rows = (
+        queryset.order_by()
+        .annotate(year_bucket=bucket_case('year', YEAR_BUCKETS), price_band=bucket_case('price', PRICE_BANDS))
+        .values('car_type', 'make', 'year_bucket', 'price_band')
+        .annotate(total=Count('id'))
+    )
+
+    counts = {'car_type': Counter(), 'make': Counter(), 'year': Counter(), 'price': Counter()}
+    for row in rows:
+        counts['car_type'][row['car_type']] += row['total']
+        counts['make'][row['make']] += row['total']
+        counts['year'][row['year_bucket']] += row['total']
+        counts['price'][row['price_band']] += row['total']
+
+    type_labels = dict(Car.CAR_TYPES)
+    return {
+        'car_type': [
+            {'value': key, 'label': type_labels[key], 'count': counts['car_type'][key]}
+            for key in type_labels if counts['car_type'][key]
+        ],
+        'make': [
+            {'value': make, 'label': make, 'count': total}
+            for make, total in counts['make'].most_common()
+        ],
+        'year': [
+            {'value': (low, high), 'label': label, 'count': counts['year'][index]}
+            for index, (label, low, high) in enumerate(YEAR_BUCKETS) if counts['year'][index]
+        ],
+        'price': [
+            {'value': index, 'label': label, 'count': counts['price'][index]}
+            for index, (label, low, high) in enumerate(PRICE_BANDS) if counts['price'][index]
+        ],
+    }
+
+
+def facets_cache_key(filters, currency):
+    # A fresh generation starts from the clock so it never reuses an old number
+    generation = cache.get_or_set(GENERATION_KEY, time.time_ns, None)
+    # Price filters in another currency match different cars once the rates change
+    rates = current_rates().version if currency != 'BDT' else None
+    raw = json.dumps({'filters': filters, 'currency': currency, 'rates': rates}, sort_keys=True)
+    return f'facets:{generation}:{hashlib.sha1(raw.encode()).hexdigest()}'
+
+
+def get_facets(queryset, filters, currency):
+    """
+    Facet counts for queryset, which must be the search result for the
+    normalized filters in the given currency (the cache key is built from them).
+    """
+    key = facets_cache_key(filters, currency)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def invalidate_facets():
+    """Make every cached facet set stale"""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
@@ -118,6 +118,7 @@ class EditProfileForm(forms.Form):
     name = forms.CharField(max_length=100, required=True)
     email = forms.EmailField(max_length=254, required=True)
     whatsapp_number = forms.CharField(max_length=20, required=False)
+    notification_digest = forms.BooleanField(required=False, label='Send alerts for followed cars as a periodic digest')
 
     def __init__(self, *args, **kwargs):
         self.instance = kwargs.pop('instance', None)
@@ -128,6 +129,7 @@ class EditProfileForm(forms.Form):
             self.fields['email'].initial = self.instance.email
             if hasattr(self.instance, 'profile'):
                 self.fields['whatsapp_number'].initial = self.instance.profile.whatsapp_number
+                self.fields['notification_digest'].initial = self.instance.profile.notification_digest
 
     def clean_email(self):
         email = self.cleaned_data.get('email')
@@ -167,5 +169,6 @@ class EditProfileForm(forms.Form):
             self.instance.save()
             profile, created = UserProfile.objects.get_or_create(user=self.instance)
             profile.whatsapp_number = self.cleaned_data['whatsapp_number']
+            profile.notification_digest = self.cleaned_data['notification_digest']
             profile.save()
         return self.instance
@@ -0,0 +1,114 @@
+"""
+Append-only payment ledger.
+
+Every movement of money on an order is recorded as a PaymentEvent and never
+changed afterwards: a payment attempt (initiated), the money taken (captured)
+and the money returned when a paid order is cancelled (refunded). Amounts are
+kept as integer poisha.
+
+reconcile() checks the ledger against the orders. It streams the per-order
+totals out of the database alongside the orders, both sorted by order id, and
+walks the two like a merge, so memory use stays flat however many millions
+of rows the ledger has.
+"""
+from collections import namedtuple
+
+from django.db.models import BigIntegerField, Case, F, Sum, Value, When
+
+from .models import Order, PaymentEvent
+from .pricing import to_minor
+
+# Orders whose total must have been captured; every other order must net to zero
+PAID_STATUSES = ('paid', 'completed')
+
+
+def record(order, kind, amount=None, method=''):
+    """Append an event for the order; the amount defaults to the order total"""
+    if amount is None:
+        amount = to_minor(order.total_price)
+    return PaymentEvent.objects.create(order_id=order.pk, kind=kind, amount=amount, method=method or '')
+
+
+# An event's effect on the money held for its order
+SIGNED_AMOUNT = Case(
+    When(kind=PaymentEvent.CAPTURED, then=F('amount')),
+    When(kind=PaymentEvent.REFUNDED, then=-F('amount')),
+    default=Value(0),
+    output_field=BigIntegerField(),
+)
+
+
+def captured_amounts(order_ids):
+    """{order id: captured - refunded} for the orders that have ledger entries"""
+    return dict(
+        PaymentEvent.objects.filter(order_id__in=order_ids).order_by().values('order_id')
+        .annotate(net=Sum(SIGNED_AMOUNT)).values_list('order_id', 'net')
+    )
+
+
+def record_refunds(orders):
+    """
+    Refund what is still held for each of the orders, with one query to look
+    it up and one INSERT. Orders with nothing captured (or already refunded) are skipped.
+    """
+    orders = list(orders)
+    if not orders:
+        return []
+    held = captured_amounts([order.pk for order in orders])
+    return PaymentEvent.objects.bulk_create([
+        PaymentEvent(
+            order_id=order.pk, kind=PaymentEvent.REFUNDED,
+            amount=held[order.pk], method=order.payment_method or '',
+        )
+        for order in orders if held.get(order.pk, 0) > 0
+    ])
+
+
+def net_amounts(chunk_size=2000):
+    """(order id, captured - refunded) for every order in the ledger, by order id"""
+    return (
+        PaymentEvent.objects.order_by('order_id').values('order_id').annotate(net=Sum(SIGNED_AMOUNT))
+        .values_list('order_id', 'net').iterator(chunk_size=chunk_size)
+    )
+
+
+Mismatch = namedtuple('Mismatch', ['order_id', 'status', 'expected', 'net'])
+
+
+def reconcile(chunk_size=2000, stats=None):
+    """
+    Yield a Mismatch for every order whose net captured amount differs from
+    what its status says it should be, and for a deleted order (status None)
+    whose entries don't net to zero. Counts go into the optional stats dict.
+    """
+    if stats is None:
+        stats = {}
+    stats.update(orders=0, mismatches=0)
+    orders = Order.objects.order_by('id').values_list('id', 'status', 'total_price').iterator(chunk_size=chunk_size)
+    ledger = net_amounts(chunk_size)
+    done = object()
+    order = next(orders, done)
+    entry = next(ledger, done)
+    while order is not done or entry is not done:
+        if entry is done or (order is not done and order[0] < entry[0]):
+            (order_id, status, total), net = order, 0
+            order = next(orders, done)
+        elif order is done or entry[0] < order[0]:
+            (order_id, net), status, total = entry, None, None
+            entry = next(ledger, done)
+        else:
+            (order_id, status, total), net = order, entry[1]
+            order = next(orders, done)
+            entry = next(ledger, done)
+
+        if status is None:
+            # Entries of a deleted order only matter if money is still held for it
+            expected = 0
+            mismatch = net != 0
+        else:
+            stats['orders'] += 1
+            expected = to_minor(total) if status in PAID_STATUSES else 0
+            mismatch = net != expected
+        if mismatch:
+            stats['mismatches'] += 1
+            yield Mismatch(order_id, status, expected, net)
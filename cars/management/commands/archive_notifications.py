@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cars.notifications import archive_read
+
+
+class Command(BaseCommand):
+    help = 'Move read notifications older than the retention period into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'NOTIFICATION_RETENTION_DAYS', 90))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(days=options['days'])
+        moved = archive_read(before, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} notifications read and older than {options["days"]} days.'))
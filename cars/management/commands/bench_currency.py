@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+
+from cars.bench import bench_user, measure, scratch_data, seed_cars
+from cars.models import Car
+from cars.patterns.adapter import CurrencyAdapter
+
+
+class Command(BaseCommand):
+    help = 'Compare per-car, batched and in-database currency conversion of a listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=10000)
+        parser.add_argument('--currency', default='USD')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        currency = options['currency']
+
+        with scratch_data():
+            seed_cars(options['listings'], bench_user())
+            queryset = Car.objects.filter(approval_status='approved')
+
+            cars = list(queryset)
+            adapter = CurrencyAdapter()
+
+            def per_car():
+                # What the home view used to do: a new adapter and a symbol lookup for every card
+                for car in cars:
+                    car.display_price = CurrencyAdapter().convert_from_bdt(car.price, currency)
+                    car.currency_symbol = CurrencyAdapter.get_symbol(currency)
+
+            def batched():
+                symbol = adapter.get_currency_symbol(currency)
+                prices = adapter.convert_many_from_bdt([car.price for car in cars], currency)
+                for car, price in zip(cars, prices):
+                    car.display_price = price
+                    car.currency_symbol = symbol
+
+            # Converting in SQL has no Python loop at all; its cost is the extra column in the fetch
+            fetch_ms = measure(lambda: list(queryset.all()), options['repeat'])
+            annotated_ms = measure(lambda: list(adapter.annotate_from_bdt(queryset, currency)), options['repeat'])
+
+            self.stdout.write(f'Converting {len(cars)} prices to {currency}')
+            self.stdout.write(f"{'per-car':<12}  {measure(per_car, options['repeat']):>9.2f} ms")
+            self.stdout.write(f"{'batched':<12}  {measure(batched, options['repeat']):>9.2f} ms")
+            self.stdout.write(f"{'in database':<12}  {annotated_ms - fetch_ms:>9.2f} ms  (fetch {fetch_ms:.2f} ms -> {annotated_ms:.2f} ms)")
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cars.bench import bench_user, bench_users, run_on_commit, scratch_data, seed_cars
+from cars.models import Car, Notification
+from cars.patterns.observer import CarPriceSubject, FollowersObserver, UserObserver
+
+
+class Command(BaseCommand):
+    help = 'Time a price change notifying 1k/10k/100k followers, one INSERT per follower vs chunked bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--per-user-limit', type=int, default=10000,
+                            help='Skip the per-follower observers above this many followers (they are slow)')
+
+    def handle(self, *args, **options):
+        with scratch_data():
+            seed_cars(1, bench_user())
+            car = Car.objects.latest('id')
+            users = bench_users(max(options['followers']), prefix='bench_follower')
+            Through = Car.followers.through
+
+            self.stdout.write(f"{'followers':>10}  {'per follower':>14}  {'bulk':>12}")
+            followed = 0
+            for count in sorted(options['followers']):
+                Through.objects.bulk_create(
+                    [Through(car_id=car.id, user_id=user.id) for user in users[followed:count]], batch_size=5000,
+                )
+                followed = count
+
+                def change_price(observers):
+                    # Each run is rolled back so they all start from the same state
+                    with scratch_data():
+                        subject = CarPriceSubject(car)
+                        for observer in observers():
+                            subject.attach(observer)
+                        start = time.perf_counter()
+                        # Including the publishing to live streams, which waits for the commit
+                        with run_on_commit():
+                            subject.change_price(car.price + 1000)
+                        elapsed = (time.perf_counter() - start) * 1000
+                        assert Notification.objects.filter(user__in=car.followers.all()).count() == count
+                    return elapsed
+
+                per_user = '-'
+                if count <= options['per_user_limit']:
+                    per_user_ms = change_price(lambda: [UserObserver(user) for user in car.followers.all()])
+                    per_user = f'{per_user_ms:.0f} ms'
+                bulk_ms = change_price(lambda: [FollowersObserver(car, options['chunk_size'])])
+                self.stdout.write(f'{count:>10}  {per_user:>14}  {bulk_ms:>9.0f} ms')
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from cars.bench import analyze, bench_user, measure, scratch_data, seed_cars
+from cars.models import Car
+from cars.patterns.strategy import BrandSearchStrategy, FullTextSearchStrategy, ModelSearchStrategy
+from cars.search_index import get_search_backend
+
+# (label, icontains strategy, query) pairs; the full-text strategy gets the same query
+QUERIES = [
+    ('make "toyota"', BrandSearchStrategy, 'toyota'),
+    ('model "land cruiser"', ModelSearchStrategy, 'land cruiser'),
+    ('model prefix "coro"', ModelSearchStrategy, 'coro'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare the full-text search strategy against the icontains strategies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+
+        with scratch_data():
+            seed_cars(options['listings'], bench_user())
+            # bulk_create sends no post_save signals, so index the seeded rows in one pass
+            get_search_backend().rebuild()
+            analyze()
+
+            fulltext = FullTextSearchStrategy()
+            self.stdout.write(f"{'query':>22}  {'matches':>8}  {'icontains':>12}  {'full-text':>12}  {'ranked':>12}")
+            for label, strategy_class, query in QUERIES:
+                strategy = strategy_class()
+                matches = strategy.search(query).count()
+                icontains_ms = measure(lambda: list(strategy.search(query).values_list('id', flat=True)), repeat)
+                fulltext_ms = measure(lambda: list(Car.objects.filter(fulltext.build_filter(query)).values_list('id', flat=True)), repeat)
+                ranked_ms = measure(lambda: list(fulltext.search(query).values_list('id', flat=True)), repeat)
+                self.stdout.write(f'{label:>22}  {matches:>8}  {icontains_ms:>9.2f} ms  {fulltext_ms:>9.2f} ms  {ranked_ms:>9.2f} ms')
+
+            # Typo tolerance: the icontains path finds nothing for a misspelt make
+            typo_matches = fulltext.search('toyta').count()
+            self.stdout.write(f'\n"toyta": icontains {Car.objects.filter(make__icontains="toyta").count()} matches, '
+                              f'full-text {typo_matches} matches')
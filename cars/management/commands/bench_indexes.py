@@ -0,0 +1,104 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from cars.bench import analyze, bench_users, measure, scratch_data, seed_cars
+from cars.models import Car, Notification, Order
+
+INDEXED_MODELS = [Car, Order, Notification]
+
+
+class Command(BaseCommand):
+    help = ('Seed cars, orders and notifications, then print EXPLAIN plans and latencies of the '
+            'hot queries without and with the indexes declared on Car, Order and Notification')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--orders', type=int, default=100000)
+        parser.add_argument('--notifications', type=int, default=300000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            # Dropping indexes commits the transaction on MySQL, so the scratch data could not be rolled back
+            raise CommandError('bench_indexes toggles indexes inside a rolled-back transaction and only runs on SQLite.')
+
+        with scratch_data():
+            self.seed(options)
+            user = Notification.objects.values_list('user', flat=True).first()
+            seller = Car.objects.values_list('owner', flat=True).first()
+            order = Order.objects.filter(status='pending').first()
+            queries = self.hot_queries(user, seller, order)
+
+            self.drop_indexes()
+            analyze()
+            before = self.run(queries, 'without indexes', options['repeat'])
+
+            self.create_indexes()
+            analyze()
+            after = self.run(queries, 'with indexes', options['repeat'])
+
+            self.stdout.write(f"\n{'query':<34}  {'before':>10}  {'after':>10}")
+            for label in queries:
+                self.stdout.write(f'{label:<34}  {before[label]:>7.2f} ms  {after[label]:>7.2f} ms')
+
+    def drop_indexes(self):
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX "{index.name}"')
+
+    def create_indexes(self):
+        # The SQLite schema editor cannot be entered inside the scratch transaction,
+        # so run the CREATE INDEX statements it generates directly
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(str(index.create_sql(model, editor)))
+
+    def seed(self, options):
+        rng = random.Random(327)
+        users = bench_users(options['users'])
+        seed_cars(options['listings'], users)
+        car_ids = list(Car.objects.values_list('id', flat=True))
+        statuses = ['pending'] * 3 + ['paid', 'completed', 'cancelled', 'cancelled']
+        Order.objects.bulk_create(
+            [Order(buyer=rng.choice(users), car_id=rng.choice(car_ids), status=rng.choice(statuses), total_price=0)
+             for _ in range(options['orders'])],
+            batch_size=2000,
+        )
+        Notification.objects.bulk_create(
+            [Notification(user=rng.choice(users), message='Price changed', is_read=rng.random() < 0.8)
+             for _ in range(options['notifications'])],
+            batch_size=2000,
+        )
+
+    def hot_queries(self, user, seller, order):
+        # Mirrors the queries in views.py and templatetags/notification_tags.py
+        approved = Car.objects.filter(approval_status='approved')
+        return {
+            'home grid': approved.order_by('-created_at', '-id')[:24],
+            'home price range': approved.filter(price__gte=15000000, price__lte=16000000).order_by('-created_at', '-id')[:24],
+            'home year range': approved.filter(year__gte=2024).order_by('-created_at', '-id')[:24],
+            'seller listings': Car.objects.filter(owner=seller).order_by('-created_at'),
+            'seller sold count': Car.objects.filter(owner=seller, status='sold').values('id'),
+            'admin available count': Car.objects.filter(status='available').values('id'),
+            'buy requests for seller': Order.objects.filter(car__owner=seller).order_by('-created_at'),
+            'my purchase requests': Order.objects.filter(buyer=user).order_by('-created_at'),
+            'pending order exists': Order.objects.filter(buyer=order.buyer_id, car=order.car_id, status='pending').values('id')[:1],
+            'other pending orders': Order.objects.filter(car=order.car_id, status='pending').exclude(id=order.id),
+            'admin pending orders': Order.objects.filter(status='pending').values('id'),
+            'unread count': Notification.objects.filter(user=user, is_read=False).values('id'),
+            'inbox': Notification.objects.filter(user=user).order_by('-created_at'),
+        }
+
+    def run(self, queries, title, repeat):
+        self.stdout.write(f'\n=== {title} ===')
+        timings = {}
+        for label, queryset in queries.items():
+            self.stdout.write(f'\n{label}:\n{queryset.explain()}')
+            timings[label] = measure(lambda: list(queryset.all()), repeat)
+        return timings
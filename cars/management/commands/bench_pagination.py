@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from cars.bench import analyze, bench_user, measure, scratch_data, seed_cars
+from cars.models import Car
+from cars.pagination import KeysetPaginator
+
+
+class Command(BaseCommand):
+    help = 'Compare OFFSET and keyset pagination of the home grid at increasing page depths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--pages', nargs='+', type=int, default=[1, 10, 100, 1000, 4000])
+        parser.add_argument('--page-size', type=int, default=24)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+
+        with scratch_data():
+            seed_cars(options['listings'], bench_user())
+            analyze()
+
+            queryset = Car.objects.filter(approval_status='approved')
+            paginator = KeysetPaginator(queryset, page_size)
+            ordered = paginator.queryset
+
+            # Walk the keyset pages once to collect the cursor that opens each page
+            cursors = {1: None}
+            cursor, number = None, 1
+            while number < max(options['pages']):
+                page = paginator.get_page(cursor)
+                if not page.has_next:
+                    break
+                cursor, number = page.next_cursor, number + 1
+                cursors[number] = cursor
+
+            self.stdout.write(f"{'page':>6}  {'OFFSET':>12}  {'keyset':>12}")
+            for number in options['pages']:
+                if number not in cursors:
+                    continue
+                offset = (number - 1) * page_size
+                offset_ms = measure(lambda: list(ordered[offset:offset + page_size]), options['repeat'])
+                keyset_ms = measure(lambda: paginator.get_page(cursors[number]), options['repeat'])
+                self.stdout.write(f'{number:>6}  {offset_ms:>9.2f} ms  {keyset_ms:>9.2f} ms')
@@ -0,0 +1,55 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from cars.bench import bench_user, scratch_data, seed_cars
+from cars.ledger import reconcile
+from cars.models import Car, Order, PaymentEvent
+
+
+class Command(BaseCommand):
+    help = 'Time reconcile_payments and its peak memory as the ledger grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', nargs='+', type=int, default=[10000, 100000, 500000])
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        with scratch_data():
+            seller = bench_user()
+            buyer = bench_user('bench_buyer')
+            seed_cars(1, seller)
+            car = Car.objects.latest('id')
+
+            self.stdout.write(f"{'orders':>8}  {'ledger rows':>12}  {'time':>9}  {'peak memory':>12}  mismatches")
+            seeded = 0
+            for count in sorted(options['orders']):
+                # Every order paid (initiated + captured); every tenth one cancelled and refunded
+                first = Order.objects.bulk_create(
+                    [Order(buyer=buyer, car=car, status='cancelled' if i % 10 == 0 else 'paid', total_price=2500000)
+                     for i in range(seeded, count)],
+                    batch_size=5000,
+                )[0].pk
+                ids = Order.objects.filter(pk__gte=first).values_list('id', flat=True)
+                events = []
+                for order_id in ids.iterator(chunk_size=5000):
+                    events.append(PaymentEvent(order_id=order_id, kind=PaymentEvent.INITIATED, amount=250000000))
+                    events.append(PaymentEvent(order_id=order_id, kind=PaymentEvent.CAPTURED, amount=250000000))
+                    if order_id % 10 == first % 10:
+                        events.append(PaymentEvent(order_id=order_id, kind=PaymentEvent.REFUNDED, amount=250000000))
+                    if len(events) >= 10000:
+                        PaymentEvent.objects.bulk_create(events)
+                        events = []
+                PaymentEvent.objects.bulk_create(events)
+                seeded = count
+
+                tracemalloc.start()
+                start = time.perf_counter()
+                stats = {}
+                mismatches = sum(1 for _ in reconcile(options['chunk_size'], stats))
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                rows = PaymentEvent.objects.count()
+                self.stdout.write(f'{count:>8}  {rows:>12}  {elapsed:>7.1f} s  {peak / 2**20:>9.1f} MB  {mismatches}')
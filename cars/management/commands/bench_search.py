@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from cars.bench import analyze, bench_user, measure, scratch_data, seed_cars
+from cars.patterns.strategy import CarSearchContext, CompositeSearchStrategy
+
+SCENARIOS = {
+    'no filters': {},
+    'price + year': {'min_price': 1000000, 'max_price': 5000000, 'min_year': 2015, 'max_year': 2022},
+    'all filters': {
+        'make': 'toyota', 'car_type': 'sedan',
+        'min_price': 500000, 'max_price': 15000000,
+        'min_year': 2005, 'max_year': 2025,
+        'min_mileage': 0, 'max_mileage': 200000,
+    },
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the composite car search against a growing number of approved listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000])
+        parser.add_argument('--page-size', type=int, default=24)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        context = CarSearchContext(CompositeSearchStrategy('BDT'))
+
+        self.stdout.write('Compiled query for "all filters":')
+        self.stdout.write(str(context.execute_search(SCENARIOS['all filters'])[:page_size].query))
+        self.stdout.write('')
+
+        with scratch_data():
+            owner = bench_user()
+            seeded = 0
+            self.stdout.write(f"{'listings':>10}  " + '  '.join(f'{name:>14}' for name in SCENARIOS))
+            for size in sorted(options['sizes']):
+                seeded += seed_cars(size - seeded, owner, seed=size)
+                analyze()
+                row = []
+                for filters in SCENARIOS.values():
+                    elapsed = measure(lambda: list(context.execute_search(filters)[:page_size]), options['repeat'])
+                    row.append(f'{elapsed:>11.2f} ms')
+                self.stdout.write(f'{size:>10}  ' + '  '.join(row))
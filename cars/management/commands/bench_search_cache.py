@@ -0,0 +1,69 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from cars.bench import analyze, bench_user, scratch_data, seed_cars
+from cars.models import Car
+from cars.pagination import KeysetPaginator
+from cars.patterns.adapter import CurrencyAdapter
+from cars.patterns.strategy import CarSearchContext, CompositeSearchStrategy
+from cars.search_cache import SearchResultCache
+
+# A few popular searches dominate real traffic
+POPULAR = [
+    {},
+    {'make': 'toyota'},
+    {'make': 'honda'},
+    {'q': 'corolla'},
+    {'car_type': 'suv'},
+    {'min_price': 1000000, 'max_price': 2500000},
+    {'make': 'toyota', 'min_year': 2015, 'max_year': 2025},
+]
+
+
+class Command(BaseCommand):
+    help = 'Replay a mix of popular first-page searches with and without the search result cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=100000)
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--page-size', type=int, default=24)
+
+    def handle(self, *args, **options):
+        page_size = options['page_size']
+        rng = random.Random(327)
+        # Skewed toward the first searches in POPULAR
+        mix = rng.choices(POPULAR, weights=[2 ** -i for i in range(len(POPULAR))], k=options['requests'])
+        context = CarSearchContext(CompositeSearchStrategy('BDT'))
+        adapter = CurrencyAdapter()
+        rows = Car.objects.all()
+
+        def paginator(filters):
+            return KeysetPaginator(context.execute_search(filters), page_size)
+
+        def uncached(filters):
+            return paginator(filters).get_page()
+
+        def cached(filters):
+            pages = paginator(filters)
+            results = cache.get(filters, 'BDT', adapter.rates_version, pages.keys)
+            return pages.get_page_from_keys(results.keys, results.complete, rows) or pages.get_page()
+
+        with scratch_data():
+            seed_cars(options['listings'], bench_user())
+            analyze()
+
+            cache = SearchResultCache()
+            for name, fn in [('uncached', uncached), ('cached', cached)]:
+                start = time.perf_counter()
+                for filters in mix:
+                    fn(filters)
+                elapsed = (time.perf_counter() - start) * 1000
+                self.stdout.write(f'{name:<10}  {elapsed / len(mix):>8.2f} ms per request')
+
+            stats = cache.stats()
+            self.stdout.write(
+                f"hits {stats['hits']}, misses {stats['misses']}, hit rate {stats['hit_rate']:.0%}, "
+                f"{stats['entries']} entries"
+            )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from cars.models import Car
+from cars.search_index import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index from the cars table'
+
+    def handle(self, *args, **kwargs):
+        get_search_backend().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Search index rebuilt for {Car.objects.count()} cars.'))
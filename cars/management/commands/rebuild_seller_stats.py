@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cars.seller_stats import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the materialized seller statistics from cars and completed orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per INSERT')
+
+    def handle(self, *args, **options):
+        count = rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {count} sellers.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Check every order total against the captured amounts in the payment ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at a time')
+        parser.add_argument('--show', type=int, default=100, help='Mismatches to list (all are counted)')
+
+    def handle(self, *args, **options):
+        stats = {}
+        for mismatch in reconcile(options['chunk_size'], stats):
+            if stats['mismatches'] <= options['show']:
+                status = mismatch.status or 'deleted'
+                self.stdout.write(
+                    f'Order {mismatch.order_id} ({status}): expected ৳{mismatch.expected / 100:.2f}, '
+                    f'ledger has ৳{mismatch.net / 100:.2f}'
+                )
+        if stats['mismatches']:
+            raise CommandError(f'{stats["mismatches"]} of {stats["orders"]} orders do not match the ledger.')
+        self.stdout.write(self.style.SUCCESS(f'All {stats["orders"]} orders match the ledger.'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from cars.dashboard import rebuild_counters, refresh_snapshot, run_refresher
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the cached admin dashboard snapshot, once or every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep refreshing every this many seconds')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the counters from the tables first')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            totals = rebuild_counters()
+            self.stdout.write(', '.join(f'{name}: {value}' for name, value in sorted(totals.items())))
+        if options['interval'] is None:
+            refresh_snapshot()
+            self.stdout.write(self.style.SUCCESS('Dashboard snapshot refreshed.'))
+            return
+        try:
+            run_refresher(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,50 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from cars.outbox import purge_done, run_batch
+
+
+# Seconds between deletions of old handled messages
+PURGE_EVERY = 60
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notifications from the outbox (see cars/outbox.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the outbox is drained')
+
+    def handle(self, *args, **options):
+        if options['pool'] == 'process':
+            # Children are forked with the parent's state, so they must not share its connections
+            connections.close_all()
+            executor = ProcessPoolExecutor(options['workers'], mp_context=multiprocessing.get_context('fork'))
+        else:
+            executor = ThreadPoolExecutor(options['workers'], thread_name_prefix='outbox')
+
+        delivered = purged = 0
+        purge_at = 0
+        try:
+            with executor:
+                while True:
+                    if time.monotonic() >= purge_at:
+                        purged += purge_done()
+                        purge_at = time.monotonic() + PURGE_EVERY
+                    claimed = run_batch(options['batch_size'], executor)
+                    delivered += claimed
+                    if claimed:
+                        continue
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Handled {delivered} outbox messages, deleted {purged} old ones.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cars.coalescing import send_digests
+
+
+class Command(BaseCommand):
+    help = 'Send each user who chose the digest one notification with their pending alerts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users per transaction')
+
+    def handle(self, *args, **options):
+        sent = send_digests(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Sent {sent} notification digests.'))
@@ -0,0 +1,19 @@
+# Generated by Django 6.0 on 2026-10-17 19:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0012_order_payment_completed_at_order_payment_method_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(fields=['approval_status', 'created_at', 'id'], name='car_approval_recent_idx'),
+        ),
+    ]
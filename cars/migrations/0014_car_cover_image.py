@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-17 19:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_cover_images(apps, schema_editor):
+    # Use each car's oldest image as its cover, in a single UPDATE
+    Car = apps.get_model('cars', 'Car')
+    CarImage = apps.get_model('cars', 'CarImage')
+    first_image = CarImage.objects.filter(car=OuterRef('pk')).order_by('id').values('id')[:1]
+    Car.objects.update(cover_image=Subquery(first_image))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0013_car_approval_recent_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='car',
+            name='cover_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='cars.carimage'),
+        ),
+        migrations.RunPython(set_cover_images, migrations.RunPython.noop),
+    ]
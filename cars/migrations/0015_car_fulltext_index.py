@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-17 20:05
+
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE cars_car_fts USING fts5("
+            "make, model, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+        # Rank by bm25 with make weighted above model above description
+        schema_editor.execute("INSERT INTO cars_car_fts (cars_car_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')")
+        schema_editor.execute("CREATE VIRTUAL TABLE cars_car_fts_vocab USING fts5vocab(cars_car_fts, 'row')")
+        schema_editor.execute(
+            "INSERT INTO cars_car_fts (rowid, make, model, description) "
+            "SELECT id, make, model, COALESCE(description, '') FROM cars_car"
+        )
+    elif vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE cars_car ADD FULLTEXT INDEX car_fulltext_idx (make, model, description)')
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS cars_car_fts_vocab')
+        schema_editor.execute('DROP TABLE IF EXISTS cars_car_fts')
+    elif vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE cars_car DROP INDEX car_fulltext_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0014_car_cover_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
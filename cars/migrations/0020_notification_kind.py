@@ -0,0 +1,104 @@
+# Generated by Django 6.0 on 2026-10-17 20:04
+
+import re
+
+from django.db import migrations, models
+
+# The sentences notifications were stored as until now, frozen here so later
+# changes to cars/notification_kinds.py don't change what this migration matches
+TEMPLATES = {
+    'price_changed': "The price of {car} has changed from ৳{old_price} to ৳{new_price}.",
+    'buy_request': "New Buy Request: {buyer} wants to buy your {car}.",
+    'order_accepted': "Congratulations! Your buy request for {car} has been accepted!",
+    'order_cancelled': "Your buy request for {car} was cancelled because the car was sold to another buyer.",
+    'order_rejected': "Your buy request for {car} was rejected by the seller.",
+    'payment_received': "💰 Payment Received!  {buyer} has paid ৳{amount} for your {car}.You can now accept the order.",
+    'payment_sent': "✅ Payment successful! You paid ৳{amount} for {car}.Waiting for seller confirmation.",
+    'listing_approved': "Your listing '{car}' has been approved by admin and is now visible to buyers.",
+    'listing_rejected': "Your car listing '{car}' has been rejected and removed by admin.\n\nReason: {reason}",
+}
+
+
+def template_pattern(template):
+    # "Hello {name}." -> ^Hello (?P<name>.*?)\.$
+    parts = re.split(r'\{(\w+)\}', template)
+    pattern = ''.join(re.escape(part) if i % 2 == 0 else f'(?P<{part}>.*?)' for i, part in enumerate(parts))
+    return re.compile(f'^{pattern}$', re.DOTALL)
+
+
+PATTERNS = [(kind, template_pattern(template)) for kind, template in TEMPLATES.items()]
+
+
+def parse_messages(apps, schema_editor):
+    for model_name in ('Notification', 'ArchivedNotification'):
+        model = apps.get_model('cars', model_name)
+        batch = []
+        for notification in model.objects.filter(kind='').only('id', 'message').iterator(chunk_size=2000):
+            for kind, pattern in PATTERNS:
+                match = pattern.match(notification.message)
+                if match:
+                    notification.kind = kind
+                    notification.params = match.groupdict()
+                    notification.message = ''
+                    batch.append(notification)
+                    break
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['kind', 'params', 'message'])
+                batch = []
+        model.objects.bulk_update(batch, ['kind', 'params', 'message'])
+
+
+def render_messages(apps, schema_editor):
+    for model_name in ('Notification', 'ArchivedNotification'):
+        model = apps.get_model('cars', model_name)
+        batch = []
+        for notification in model.objects.exclude(kind='').only('id', 'kind', 'params').iterator(chunk_size=2000):
+            notification.message = TEMPLATES[notification.kind].format(**notification.params)
+            notification.kind = ''
+            notification.params = {}
+            batch.append(notification)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['kind', 'params', 'message'])
+                batch = []
+        model.objects.bulk_update(batch, ['kind', 'params', 'message'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0019_notification_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivednotification',
+            name='kind',
+            field=models.CharField(blank=True, default='', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='archivednotification',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(blank=True, default='', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='archivednotification',
+            name='message',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='message',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(parse_messages, render_messages),
+    ]
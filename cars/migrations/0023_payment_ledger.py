@@ -0,0 +1,51 @@
+# Generated by Django 6.0 on 2026-10-17 20:14
+
+from decimal import Decimal
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+CAPTURED = 2
+
+
+def capture_paid_orders(apps, schema_editor):
+    # Orders paid before the ledger existed get the capture they would have recorded
+    Order = apps.get_model('cars', 'Order')
+    PaymentEvent = apps.get_model('cars', 'PaymentEvent')
+    batch = []
+    paid = Order.objects.filter(status__in=['paid', 'completed']).order_by('id')
+    for order in paid.only('id', 'total_price', 'payment_method', 'payment_completed_at', 'created_at').iterator(chunk_size=2000):
+        batch.append(PaymentEvent(
+            order_id=order.id, kind=CAPTURED, amount=int(Decimal(order.total_price) * 100),
+            method=order.payment_method or '', created_at=order.payment_completed_at or order.created_at,
+        ))
+        if len(batch) >= 2000:
+            PaymentEvent.objects.bulk_create(batch)
+            batch = []
+    PaymentEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0022_payment_submission'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'Initiated'), (2, 'Captured'), (3, 'Refunded')])),
+                ('amount', models.BigIntegerField()),
+                ('method', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('order', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='payment_events', to='cars.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['order', 'created_at'], name='payment_event_order_idx'), models.Index(fields=['created_at'], name='payment_event_time_idx')],
+            },
+        ),
+        migrations.RunPython(capture_paid_orders, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-17 20:26
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+
+def build_seller_stats(apps, schema_editor):
+    Car = apps.get_model('cars', 'Car')
+    SellerStats = apps.get_model('cars', 'SellerStats')
+    approved = Q(approval_status='approved')
+    completed = Q(orders__status='completed')
+    completed_at = Coalesce('orders__completed_at', 'orders__payment_completed_at', 'orders__created_at')
+    rows = Car.objects.order_by('owner_id').values('owner_id').annotate(
+        listings_count=Count('id', filter=approved, distinct=True),
+        available_count=Count('id', filter=approved & Q(status='available'), distinct=True),
+        sold_count=Count('id', filter=approved & Q(status='sold'), distinct=True),
+        sales_count=Count('orders', filter=completed),
+        revenue_total=Sum('orders__total_price', filter=completed),
+        time_to_sell=Sum(
+            ExpressionWrapper(completed_at - F('created_at'), output_field=DurationField()), filter=completed,
+        ),
+    )
+    SellerStats.objects.bulk_create([
+        SellerStats(
+            seller_id=row['owner_id'],
+            listings=row['listings_count'],
+            available=row['available_count'],
+            sold=row['sold_count'],
+            sales=row['sales_count'],
+            # Revenue is stored in poisha
+            revenue=int(Decimal(str(row['revenue_total'] or 0)) * 100),
+            seconds_to_sell=max(int(row['time_to_sell'].total_seconds()), 0) if row['time_to_sell'] else 0,
+        )
+        for row in rows.iterator(chunk_size=1000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('cars', '0023_payment_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerStats',
+            fields=[
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seller_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('listings', models.IntegerField(default=0)),
+                ('available', models.IntegerField(default=0)),
+                ('sold', models.IntegerField(default=0)),
+                ('sales', models.IntegerField(default=0)),
+                ('revenue', models.BigIntegerField(default=0)),
+                ('seconds_to_sell', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(build_seller_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-17 20:30
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_existing(apps, schema_editor):
+    Car = apps.get_model('cars', 'Car')
+    User = apps.get_model('auth', 'User')
+    DashboardCounter = apps.get_model('cars', 'DashboardCounter')
+    totals = Car.objects.aggregate(
+        total_cars=Count('id'),
+        available_cars=Count('id', filter=Q(status='available')),
+        sold_cars=Count('id', filter=Q(status='sold')),
+    )
+    totals['total_users'] = User.objects.filter(is_superuser=False).count()
+    DashboardCounter.objects.bulk_create([DashboardCounter(name=name, value=value) for name, value in totals.items()])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0024_seller_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounter',
+            fields=[
+                ('name', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0027_drop_duplicate_fk_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BrokerListener',
+            fields=[
+                ('channel', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('expires_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,10 +1,43 @@
-from django.db import models
-from django.contrib.auth.models import User
 from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
+from .notification_kinds import render as render_notification
+
+class TracksChanges(models.Model):
+    """Remembers the values a row was loaded or saved with, so signal handlers can tell what a save changed"""
+    
+    class Meta:
+        abstract = True
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+    
+    def changed_fields(self):
+        """Names of fields that differ from the values last loaded or saved (all fields for a new row)"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return {field.name for field in self._meta.concrete_fields}
+        return {
+            field.name for field in self._meta.concrete_fields
+            if field.attname in loaded and loaded[field.attname] != getattr(self, field.attname)
+        }
+    
+    def previous_values(self):
+        """Field values (by attname) as last loaded or saved, None for a new row; unloaded fields count as unchanged"""
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return None
+        return {field.attname: loaded.get(field.attname, getattr(self, field.attname)) for field in self._meta.concrete_fields}
+
 
-class Car(models.Model):
+class Car(TracksChanges):
     CAR_TYPES = (
         ('sedan', 'Sedan'),
         ('suv', 'SUV'),
@@ -21,7 +54,8 @@ class Car(models.Model):
     description = models.TextField(blank=True)
     status = models.CharField(max_length=20, default='available') # available, sold
     approval_status = models.CharField(max_length=20, default='pending') # pending, approved, rejected
-    owner = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Indexed by the (owner, ...) composites in Meta, which also serve plain owner lookups
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     # Contact Info
@@ -34,8 +68,28 @@ class Car(models.Model):
     # Observer Pattern: Followers
     followers = models.ManyToManyField(User, related_name='followed_cars', blank=True)
     
+    # Cover image shown on listing cards, kept in sync by signals.py so a grid
+    # of cars can load its images with select_related instead of one query per card
+    cover_image = models.ForeignKey('CarImage', on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    
+    class Meta:
+        indexes = [
+            # Listing grid: approved cars, newest first (id breaks ties)
+            models.Index(fields=['approval_status', 'created_at', 'id'], name='car_approval_recent_idx'),
+            # Range filters of the search (approved cars only)
+            models.Index(fields=['approval_status', 'price'], name='car_approval_price_idx'),
+            models.Index(fields=['approval_status', 'year'], name='car_approval_year_idx'),
+            models.Index(fields=['approval_status', 'mileage'], name='car_approval_mileage_idx'),
+            # Profile and seller pages: a seller's cars, newest first, and their status counts
+            models.Index(fields=['owner', 'created_at'], name='car_owner_recent_idx'),
+            models.Index(fields=['owner', 'status'], name='car_owner_status_idx'),
+            # Admin dashboard status counts
+            models.Index(fields=['status'], name='car_status_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.year} {self.make} {self.model}"
+    
 
 class CarImage(models.Model):
     car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='images')
@@ -45,20 +99,133 @@ class CarImage(models.Model):
         return f"Image for {self.car}"
 
 class Notification(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    message = models.TextField()
+    # Indexed by the (user, ...) composites in Meta
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    # Either a kind with its params, rendered when displayed (see notification_kinds.py), or a free-text message
+    kind = models.CharField(max_length=30, blank=True, default='')
+    params = models.JSONField(default=dict, blank=True)
+    message = models.TextField(blank=True, default='')
+    # Unread notifications of the same group are updated in place (see coalescing.py)
+    group = models.CharField(max_length=64, blank=True, default='')
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    
+    @property
+    def text(self):
+        return render_notification(self.kind, self.params, self.message)
+    
+    class Meta:
+        indexes = [
+            # Inbox, newest first
+            models.Index(fields=['user', 'created_at'], name='notif_user_recent_idx'),
+            # Unread badge count
+            models.Index(fields=['user', 'is_read'], name='notif_user_unread_idx'),
+            # Unread rows only (mark all as read); MySQL has no partial indexes and uses the one above
+            models.Index(fields=['user', 'created_at'], condition=models.Q(is_read=False), name='notif_unread_recent_idx'),
+            # Retention job: read rows by age
+            models.Index(fields=['is_read', 'created_at'], name='notif_read_age_idx'),
+            # Pending notification of a group to coalesce into
+            models.Index(fields=['group', 'user'], condition=models.Q(is_read=False) & ~models.Q(group=''), name='notif_unread_group_idx'),
+        ]
+
+class ArchivedNotification(models.Model):
+    """Read notifications moved out of the Notification table by the archive_notifications command"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    kind = models.CharField(max_length=30, blank=True, default='')
+    params = models.JSONField(default=dict, blank=True)
+    message = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField()
+    
+    # Only read notifications are archived
+    is_read = True
+    
+    @property
+    def text(self):
+        return render_notification(self.kind, self.params, self.message)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='archived_notif_recent_idx'),
+        ]
+
+class NotificationCounter(models.Model):
+    """Unread notifications per user, kept up to date so the badge never has to COUNT(*) (see notifications.py)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.user.username}: {self.unread} unread"
+
+class BrokerMessage(models.Model):
+    """A message published on a stream channel, read by the poller of every process (see pubsub.DatabaseBroker)"""
+    channel = models.CharField(max_length=100)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"{self.channel} #{self.pk}"
+
+class BrokerListener(models.Model):
+    """A channel some process has open streams for, renewed by its poller until expires_at (see pubsub.DatabaseBroker)"""
+    channel = models.CharField(max_length=100, primary_key=True)
+    expires_at = models.DateTimeField()
+    
+    def __str__(self):
+        return self.channel
 
-class Order(models.Model):
+class DashboardCounter(models.Model):
+    """A site-wide total shown on the admin dashboard, kept up to date by signals.py (see dashboard.py)"""
+    name = models.CharField(max_length=40, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+class OutboxMessage(models.Model):
+    """
+    A side effect (e.g. a notification) recorded in the same transaction as the
+    change that caused it, and carried out later by the outbox worker (see outbox.py).
+    Messages with the same key are handled one at a time, in id order.
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    topic = models.CharField(max_length=50)
+    key = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            # Worker polling for due messages
+            models.Index(fields=['status', 'available_at', 'id'], name='outbox_due_idx'),
+            # Per-key ordering checks
+            models.Index(fields=['key', 'status', 'id'], name='outbox_key_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic} for {self.key} ({self.status})"
+
+class Order(TracksChanges):
     STATUS_CHOICES = (
         ('pending', 'Pending'),
         ('paid', 'Paid'),
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     )
-    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
-    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='orders')
+    # Indexed by the (buyer, ...) and (car, ...) composites in Meta
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', db_index=False)
+    car = models.ForeignKey(Car, on_delete=models.CASCADE, related_name='orders', db_index=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -70,18 +237,143 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     payment_method = models.CharField(max_length=20, blank=True, null=True)
     payment_completed_at = models.DateTimeField(null=True, blank=True)
+    # When the seller accepted the order
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Seller side: orders for a car by status (buy requests, accept_order)
+            models.Index(fields=['car', 'status', 'created_at'], name='order_car_status_idx'),
+            # Buyer side: my purchase requests, newest first, and completed purchases
+            models.Index(fields=['buyer', 'created_at'], name='order_buyer_recent_idx'),
+            models.Index(fields=['buyer', 'status'], name='order_buyer_status_idx'),
+            # Admin dashboard pending count
+            models.Index(fields=['status', 'created_at'], name='order_status_recent_idx'),
+            # Open buy requests per car (buy_car duplicate check, accept_order cancellations).
+            # Partial index on SQLite; MySQL ignores the condition and uses order_car_status_idx.
+            models.Index(fields=['car', 'buyer'], condition=models.Q(status='pending'), name='order_pending_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} - {self.car} by {self.buyer}"
     
 
+class PaymentSubmission(models.Model):
+    """The outcome of a payment form submission, by idempotency key (see payments.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='payment_submissions')
+    key = models.CharField(max_length=64)
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payment_submissions')
+    outcome = models.CharField(max_length=20)
+    payment_method = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='payment_submission_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Payment submission {self.key} for order {self.order_id}: {self.outcome}"
+    
+
+class PaymentEventQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        raise TypeError("The payment ledger is append-only")
+
+    def delete(self):
+        raise TypeError("The payment ledger is append-only")
+
+
+class PaymentEvent(models.Model):
+    """
+    One entry of the append-only payment ledger (see ledger.py). Amounts are in
+    poisha, and the order reference has no constraint so entries outlive their order.
+    """
+    INITIATED = 1
+    CAPTURED = 2
+    REFUNDED = 3
+    KIND_CHOICES = (
+        (INITIATED, 'Initiated'),
+        (CAPTURED, 'Captured'),
+        (REFUNDED, 'Refunded'),
+    )
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, related_name='payment_events')
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    amount = models.BigIntegerField()
+    method = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = PaymentEventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Reconciliation walks the ledger by order
+            models.Index(fields=['order', 'created_at'], name='payment_event_order_idx'),
+            models.Index(fields=['created_at'], name='payment_event_time_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise TypeError("The payment ledger is append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise TypeError("The payment ledger is append-only")
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ৳{self.amount / 100:.2f} for order {self.order_id}"
+
+
+class SellerStats(models.Model):
+    """
+    Per-seller totals shown on the seller page, kept up to date by signals.py
+    and recomputed by `manage.py rebuild_seller_stats` (see seller_stats.py).
+    Listing counts cover approved cars; revenue is in poisha.
+    """
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='seller_stats')
+    listings = models.IntegerField(default=0)
+    available = models.IntegerField(default=0)
+    sold = models.IntegerField(default=0)
+    sales = models.IntegerField(default=0)
+    revenue = models.BigIntegerField(default=0)
+    seconds_to_sell = models.BigIntegerField(default=0)
+
+    @property
+    def average_days_to_sell(self):
+        if not self.sales:
+            return None
+        return self.seconds_to_sell / self.sales / 86400
+
+    def __str__(self):
+        return f"Stats for {self.seller_id}"
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     whatsapp_number = models.CharField(max_length=20, blank=True, null=True)
+    # Collect alerts for followed cars into a periodic digest instead of one notification each
+    notification_digest = models.BooleanField(default=False)
 
     def __str__(self):
         return f"Profile for {self.user.username}"
 
+
+class DigestItem(models.Model):
+    """An alert waiting for the user's next digest (see coalescing.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='digest_items')
+    kind = models.CharField(max_length=30)
+    params = models.JSONField(default=dict)
+    group = models.CharField(max_length=64, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'user'], name='digest_group_idx'),
+        ]
+
+    def __str__(self):
+        return f"Digest item for {self.user.username}: {self.kind}"
+
 class PurchaseRequest(models.Model):
     """Handles purchase requests from buyers to sellers"""
     STATUS_CHOICES = [
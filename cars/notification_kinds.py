@@ -0,0 +1,70 @@
+"""
+Notification kinds.
+
+A notification stores its kind and the few values that differ between
+messages (car name, prices, ...) instead of the full sentence. The sentence
+is rendered when the notification is displayed, through gettext, so it can
+be translated later without touching stored rows. Notifications without a
+kind fall back to their free-text message.
+"""
+from collections import namedtuple
+
+from django.utils.translation import gettext, gettext_noop
+
+TEMPLATES = {
+    'price_changed': gettext_noop("The price of {car} has changed from ৳{old_price} to ৳{new_price}."),
+    'buy_request': gettext_noop("New Buy Request: {buyer} wants to buy your {car}."),
+    'order_accepted': gettext_noop("Congratulations! Your buy request for {car} has been accepted!"),
+    'order_cancelled': gettext_noop("Your buy request for {car} was cancelled because the car was sold to another buyer."),
+    'order_rejected': gettext_noop("Your buy request for {car} was rejected by the seller."),
+    'payment_received': gettext_noop("💰 Payment Received!  {buyer} has paid ৳{amount} for your {car}.You can now accept the order."),
+    'payment_sent': gettext_noop("✅ Payment successful! You paid ৳{amount} for {car}.Waiting for seller confirmation."),
+    'listing_approved': gettext_noop("Your listing '{car}' has been approved by admin and is now visible to buyers."),
+    'listing_rejected': gettext_noop("Your car listing '{car}' has been rejected and removed by admin.\n\nReason: {reason}"),
+    'digest': gettext_noop("{count} updates on cars you follow:"),
+}
+
+# Params that keep their first value when a newer notification of the same kind is
+# merged into a pending one (see coalescing.py), e.g. the price before the first change
+KEEP_FIRST = {
+    'price_changed': ('old_price',),
+}
+
+
+def render(kind, params, message=''):
+    template = TEMPLATES.get(kind)
+    if template is None:
+        return message
+    try:
+        text = gettext(template).format(**params)
+    except (KeyError, IndexError, ValueError):
+        return message
+    if kind == 'digest':
+        # One line per alert the digest collected
+        text += ''.join('\n• ' + render(item['kind'], item['params']) for item in params.get('items', ()))
+    return text
+
+
+def merge_params(kind, pending, new):
+    """Params of a pending notification after a newer one of the same kind is folded into it"""
+    merged = dict(new)
+    for name in KEEP_FIRST.get(kind, ()):
+        if name in pending:
+            merged[name] = pending[name]
+    return merged
+
+
+class NotificationMessage(namedtuple('NotificationMessage', ['kind', 'params', 'group'], defaults=[''])):
+    """
+    What a notification says, as passed to observers and the outbox. Messages
+    with a group (e.g. one car's price changes) may be merged into an unread
+    notification of the same group instead of adding a new one.
+    """
+
+    def render(self):
+        return render(self.kind, self.params)
+
+
+def car_name(car):
+    """e.g. 2020 Toyota Corolla"""
+    return f"{car.year} {car.make} {car.model}"
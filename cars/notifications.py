@@ -0,0 +1,163 @@
+"""
+Unread notification counts and their live stream.
+
+Each user has a NotificationCounter row that is incremented when a
+notification is created (see signals.py) and decremented when notifications
+are marked read, always with a single UPDATE ... SET unread = unread +/- n so
+concurrent requests never lose a change. Reading the badge is a primary key
+lookup, done at most once per request.
+
+Changes are also published on the user's channel once committed, and
+event_stream turns them into server-sent events for notification_stream.
+"""
+import json
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import ArchivedNotification, Notification, NotificationCounter
+from .pubsub import get_broker
+
+# Seconds between keep-alive comments, and before a stream is closed so the browser reconnects
+STREAM_KEEPALIVE = 15
+STREAM_MAX_AGE = 60 * 5
+
+
+def add_unread(user_id, count=1):
+    """Add `count` unread notifications to a user's counter, creating it if needed"""
+    if NotificationCounter.objects.filter(user_id=user_id).update(unread=F('unread') + count):
+        return
+    try:
+        with transaction.atomic():
+            NotificationCounter.objects.create(user_id=user_id, unread=count)
+    except IntegrityError:
+        # Created by a concurrent request in the meantime
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=F('unread') + count)
+
+
+def add_unread_many(user_ids):
+    """Add one unread notification for each of the (distinct) users"""
+    counters = NotificationCounter.objects.filter(user_id__in=user_ids)
+    existing = set(counters.values_list('user_id', flat=True))
+    missing = [NotificationCounter(user_id=user_id) for user_id in user_ids if user_id not in existing]
+    if missing:
+        # Counters created concurrently in the meantime are skipped, and still incremented below
+        NotificationCounter.objects.bulk_create(missing, ignore_conflicts=True)
+    counters.update(unread=F('unread') + 1)
+
+
+def remove_unread(user_id, count):
+    if count:
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=Greatest(F('unread') - count, 0))
+
+
+def mark_all_read(user):
+    """Mark every unread notification of the user as read. Returns how many were marked."""
+    with transaction.atomic():
+        marked = Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+        remove_unread(user.pk, marked)
+    if marked:
+        publish(user.pk, {'type': 'read'})
+    return marked
+
+
+def unread_count(request):
+    """Unread notifications of the logged in user, memoized on the request"""
+    if not request.user.is_authenticated:
+        return 0
+    if not hasattr(request, '_unread_notifications'):
+        counts = NotificationCounter.objects.filter(user_id=request.user.pk).values_list('unread', flat=True)
+        request._unread_notifications = next(iter(counts), 0)
+    return request._unread_notifications
+
+
+
+def archive_read(before, batch_size=1000):
+    """
+    Move read notifications created before `before` into ArchivedNotification,
+    one batch per transaction so the hot table is never locked for long.
+    Returns how many were moved.
+    """
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                Notification.objects.filter(is_read=True, created_at__lt=before)
+                .order_by('created_at', 'id').values_list('id', 'user_id', 'kind', 'params', 'message', 'created_at')[:batch_size]
+            )
+            if not rows:
+                return moved
+            ArchivedNotification.objects.bulk_create([
+                ArchivedNotification(user_id=user_id, kind=kind, params=params, message=message, created_at=created_at)
+                for _, user_id, kind, params, message, created_at in rows
+            ])
+            Notification.objects.filter(id__in=[row[0] for row in rows]).delete()
+        moved += len(rows)
+
+
+def user_channel(user_id):
+    return f'notifications:{user_id}'
+
+
+def publish(user_id, message):
+    """Send a message to the user's open streams once the current transaction commits"""
+    transaction.on_commit(lambda: get_broker().publish(user_channel(user_id), message))
+
+
+def notification_message(notification):
+    return {
+        'type': 'notification',
+        'notification': {
+            'id': notification.pk,
+            'message': notification.text,
+            'created_at': notification.created_at.isoformat(),
+        },
+    }
+
+
+def publish_notification(notification):
+    publish(notification.user_id, notification_message(notification))
+
+
+def publish_many(notifications):
+    """Publish a batch of notifications with a single on-commit callback"""
+    messages = [(user_channel(n.user_id), notification_message(n)) for n in notifications]
+
+    transaction.on_commit(lambda: get_broker().publish_many(messages))
+
+
+async def aunread_count(user_id):
+    count = await NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).afirst()
+    return count or 0
+
+
+def sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def event_stream(user_id):
+    """
+    Server-sent events for one user: the unread count right away, then again
+    (with the new notification, if any) every time it changes.
+    """
+    # Subscribe before reading the count so no change falls in between
+    subscription = get_broker().subscribe(user_channel(user_id))
+    loop = subscription.loop
+    try:
+        yield 'retry: 5000\n\n'
+        count = await aunread_count(user_id)
+        yield sse('unread', {'count': count})
+        closes_at = loop.time() + STREAM_MAX_AGE
+        while loop.time() < closes_at:
+            # Idle streams only wake up for keep-alives, which don't touch the database
+            message = await subscription.get(min(STREAM_KEEPALIVE, max(closes_at - loop.time(), 0)))
+            if message is None:
+                yield ': keep-alive\n\n'
+                continue
+            data = {'count': await aunread_count(user_id)}
+            if message['type'] == 'notification':
+                data['notification'] = message['notification']
+            yield sse('unread', data)
+    finally:
+        subscription.close()
@@ -0,0 +1,220 @@
+"""
+Transactional outbox for notification delivery.
+
+Request handlers record what has to be sent with notify()/notify_followers()
+inside the same transaction as the change itself, so a rolled back change
+sends nothing and a committed one is never lost, and the request does one
+INSERT however many people end up notified. The run_outbox_worker command
+drains the table in batches on a thread or process pool:
+
+* messages with the same key (one user, or one car's followers) are handled
+  one at a time in id order, different keys in parallel;
+* a failing message is retried with exponential backoff and marked failed
+  after MAX_ATTEMPTS, which lets the messages queued behind it through;
+* claimed messages carry a lease, so the messages of a worker that died are
+  picked up again once it expires;
+* handled messages are kept for OUTBOX_RETENTION_HOURS and then deleted by
+  the worker (purge_done), so the table only holds recent traffic. Failed
+  messages are kept for inspection.
+"""
+import logging
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import Car, Notification, OutboxMessage
+from .notification_kinds import NotificationMessage
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+LEASE = timedelta(minutes=5)
+UNFINISHED = ('pending', 'processing')
+
+HANDLERS = {}
+
+
+def handler(topic):
+    def register(fn):
+        HANDLERS[topic] = fn
+        return fn
+    return register
+
+
+def enqueue(topic, key, payload):
+    return OutboxMessage.objects.create(topic=topic, key=key, payload=payload)
+
+
+def notify(user, message):
+    """Queue a notification (a NotificationMessage) for one user"""
+    user_id = getattr(user, 'pk', user)
+    return enqueue('notification', f'user:{user_id}', {'user_id': user_id, 'kind': message.kind, 'params': message.params})
+
+
+def notify_many(user_ids, message):
+    """Queue the same notification for several users with one INSERT"""
+    return notify_each((user_id, message) for user_id in user_ids)
+
+
+def notify_each(messages):
+    """Queue a notification for each (user id, message) pair with one INSERT"""
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(
+            topic='notification', key=f'user:{user_id}',
+            payload={'user_id': user_id, 'kind': message.kind, 'params': message.params},
+        )
+        for user_id, message in messages
+    ])
+
+
+def notify_followers(car, message):
+    """Queue a notification for every follower of a car; the worker expands it"""
+    return enqueue('followers', f'car:{car.pk}:followers', {
+        'car_id': car.pk, 'kind': message.kind, 'params': message.params, 'group': message.group,
+    })
+
+
+@handler('notification')
+def deliver_notification(payload):
+    Notification.objects.create(user_id=payload['user_id'], kind=payload['kind'], params=payload['params'])
+
+
+@handler('followers')
+def deliver_to_followers(payload):
+    from .patterns.observer import FollowersObserver
+    car = Car.objects.filter(pk=payload['car_id']).first()
+    if car is not None:
+        FollowersObserver(car).update(NotificationMessage(payload['kind'], payload['params'], payload.get('group', '')))
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(2 ** attempts, 600))
+
+
+class LeaseLost(Exception):
+    """The message's lease expired and another worker claimed it"""
+
+
+def claim(batch_size):
+    """
+    Claim up to batch_size due messages and return the claim token and their
+    ids grouped by key, each group in id order. A key is only claimed when its
+    oldest unfinished message is due, so nothing overtakes a message waiting
+    for a retry, and a key held up that way doesn't use up the batch.
+    """
+    now = timezone.now()
+    due = Q(status='pending', available_at__lte=now) | Q(status='processing', locked_until__lt=now)
+
+    def first_unfinished(keys=None):
+        heads = OutboxMessage.objects.filter(status__in=UNFINISHED)
+        if keys is not None:
+            heads = heads.filter(key__in=keys)
+        return heads.order_by().values('key').annotate(first=Min('id'))
+
+    # The due head of each key, oldest first, then what is due behind them
+    ready_keys = set(
+        OutboxMessage.objects.filter(due, id__in=first_unfinished().values('first'))
+        .order_by('id').values_list('key', flat=True)[:batch_size]
+    )
+    if not ready_keys:
+        return None, []
+    ready = list(OutboxMessage.objects.filter(due, key__in=ready_keys).order_by('id').values_list('id', flat=True)[:batch_size])
+
+    token = uuid.uuid4().hex
+    OutboxMessage.objects.filter(due, id__in=ready).update(
+        status='processing', claimed_by=token, locked_until=now + LEASE,
+    )
+    claimed = list(OutboxMessage.objects.filter(claimed_by=token, status='processing').order_by('id').values_list('id', 'key'))
+
+    # Another worker may have claimed an older message of the same key in the meantime
+    heads = dict(first_unfinished({key for _, key in claimed}).values_list('key', 'first'))
+    groups = {}
+    for pk, key in claimed:
+        if key in groups or heads.get(key) == pk:
+            groups.setdefault(key, []).append(pk)
+    released = [pk for pk, key in claimed if pk not in groups.get(key, ())]
+    if released:
+        OutboxMessage.objects.filter(id__in=released, claimed_by=token).update(status='pending', claimed_by='', locked_until=None)
+    return token, list(groups.values())
+
+
+def process_message(pk, token):
+    """Handle one message claimed with token. Returns False if it is waiting for a retry or was lost."""
+    message = OutboxMessage.objects.get(pk=pk)
+    held = Q(pk=pk, claimed_by=token, status='processing')
+    try:
+        with transaction.atomic():
+            if message.claimed_by != token:
+                raise LeaseLost
+            HANDLERS[message.topic](message.payload)
+            # Only the holder of the lease may finish it; otherwise undo the delivery
+            if not OutboxMessage.objects.filter(held).update(
+                status='done', processed_at=timezone.now(), claimed_by='', locked_until=None, last_error='',
+            ):
+                raise LeaseLost
+        return True
+    except LeaseLost:
+        logger.warning('Outbox message %s was claimed by another worker after its lease expired', pk)
+        return False
+    except Exception:
+        attempts = message.attempts + 1
+        failed = attempts >= MAX_ATTEMPTS
+        logger.exception('Outbox message %s (%s) failed, attempt %s', pk, message.topic, attempts)
+        OutboxMessage.objects.filter(held).update(
+            status='failed' if failed else 'pending',
+            attempts=attempts,
+            available_at=timezone.now() + retry_delay(attempts),
+            claimed_by='',
+            locked_until=None,
+            last_error=traceback.format_exc(),
+        )
+        # A message that gave up no longer holds back the rest of its key
+        return failed
+
+
+def process_group(ids, token):
+    """Handle the claimed messages of one key in order, stopping at the first one that must be retried"""
+    for index, pk in enumerate(ids):
+        if not process_message(pk, token):
+            OutboxMessage.objects.filter(id__in=ids[index + 1:], claimed_by=token, status='processing').update(
+                status='pending', claimed_by='', locked_until=None,
+            )
+            return index
+    return len(ids)
+
+
+def process_group_in_pool(ids, token):
+    # Pool threads and processes each use their own connection; don't keep it open between batches
+    try:
+        return process_group(ids, token)
+    finally:
+        connection.close()
+
+
+def run_batch(batch_size=100, executor=None):
+    """Claim and handle one batch. Returns the number of messages claimed."""
+    token, groups = claim(batch_size)
+    if executor is None:
+        for ids in groups:
+            process_group(ids, token)
+    else:
+        list(executor.map(process_group_in_pool, groups, [token] * len(groups)))
+    return sum(len(ids) for ids in groups)
+
+
+def purge_done(retention=None, batch_size=1000):
+    """Delete messages handled more than `retention` ago, in batches. Returns how many were deleted."""
+    if retention is None:
+        retention = timedelta(hours=getattr(settings, 'OUTBOX_RETENTION_HOURS', 24))
+    cutoff = timezone.now() - retention
+    deleted = 0
+    while True:
+        ids = list(OutboxMessage.objects.filter(status='done', processed_at__lt=cutoff).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += OutboxMessage.objects.filter(id__in=ids).delete()[0]
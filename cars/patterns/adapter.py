@@ -1,3 +1,8 @@
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+
+from cars.exchange_rates import DEFAULT_RATES, current_rates
+
+
 # target interface
 class CurrencyConverter:
 
@@ -12,20 +17,19 @@ class CurrencyConverter:
     def get_currency_symbol(self, currency): #to be implemented by adapter
         """Get the symbol for a currency"""
         raise NotImplementedError #make sure derived class implements this method
+    
+    def convert_many_from_bdt(self, amounts_bdt, target_currency): #to be implemented by adapter
+        """Convert a sequence of BDT amounts to any currency"""
+        raise NotImplementedError #make sure derived class implements this method
 
 
 # Adaptee - Third-party service with incompatible interface
 class ThirdPartyCurrencyAPI:
 
     
-    # Exchange rates: 1 unit of currency = X BDT
-    EXCHANGE_RATES = {
-        'BDT': 1.0,
-        'USD': 120.0,   # 1 USD = 120 BDT
-        'GBP': 150.0,   # 1 GBP = 150 BDT
-        'EUR': 130.0,   # 1 EUR = 130 BDT
-        'INR': 1.45     # 1 INR = 1.45 BDT
-    }
+    # Built-in exchange rates: 1 unit of currency = X BDT
+    # Live rates come from the provider configured in settings (see cars/exchange_rates.py)
+    EXCHANGE_RATES = DEFAULT_RATES
     
     CURRENCY_SYMBOLS = {
         'BDT': '৳',
@@ -35,9 +39,13 @@ class ThirdPartyCurrencyAPI:
         'INR': '₹'
     }
     
+    def __init__(self, snapshot=None):
+        # Every conversion through this instance uses the same rate snapshot
+        self.snapshot = snapshot or current_rates()
+    
     def get_exchange_rate(self, currency_code):
         """Third-party API method to get exchange rate"""
-        return self.EXCHANGE_RATES.get(currency_code, 1.0)
+        return self.snapshot.rate(currency_code)
     
     def get_symbol_for_currency(self, currency_code):
         """Third-party API method to get currency symbol"""
@@ -55,9 +63,9 @@ class ThirdPartyCurrencyAPI:
 # Adapter - Makes the adaptee compatible with the target interface
 class CurrencyAdapter(CurrencyConverter):
     
-    def __init__(self):
+    def __init__(self, snapshot=None):
         # Composition: Adapter contains an instance of the adaptee
-        self._api = ThirdPartyCurrencyAPI()
+        self._api = ThirdPartyCurrencyAPI(snapshot)
     
     def convert_to_bdt(self, amount, currency):
         rate = self._api.get_exchange_rate(currency)
@@ -70,6 +78,22 @@ class CurrencyAdapter(CurrencyConverter):
     def get_currency_symbol(self, currency):
         return self._api.get_symbol_for_currency(currency)
     
+    @property
+    def rates_version(self):
+        return self._api.snapshot.version
+    
+    def convert_many_from_bdt(self, amounts_bdt, target_currency):
+        # Look the rate up once for the whole batch instead of once per amount
+        rate = self._api.get_exchange_rate(target_currency)
+        return [float(amount) / rate for amount in amounts_bdt]
+    
+    def annotate_from_bdt(self, queryset, target_currency, field='price', name='display_price'):
+        """Add the converted price as a column computed by the database, e.g. car.display_price"""
+        rate = self._api.get_exchange_rate(target_currency)
+        return queryset.annotate(**{
+            name: ExpressionWrapper(F(field) / Value(rate), output_field=FloatField())
+        })
+    
     # Convenience class methods for backward compatibility
     @classmethod
     def convert_to_bdt_static(cls, amount, from_currency):
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from cars.pricing import get_addon, to_minor
+
 # Component Interface
 class CarComponent(ABC):
     @abstractmethod
@@ -18,6 +20,9 @@ class BasicCar(CarComponent):
     def get_price(self):
         return float(self.car.price)
     
+    def get_price_minor(self):
+        return to_minor(self.car.price)
+    
     def get_description(self):
         return f"{self.car.year} {self.car.make} {self.car.model}"
 
@@ -34,31 +39,39 @@ class CarDecorator(CarComponent):
     def get_description(self):
         pass
 
-# Concrete Decorators
-class WarrantyDecorator(CarDecorator):
-    def get_price(self):
-        return self.car_component.get_price() + 50000.00
+# Decorator for one add-on of the catalogue in cars/pricing.py
+class AddOnDecorator(CarDecorator):
+    code = None
     
-    def get_description(self):
-        return self.car_component.get_description() + " + Extended Warranty"
-
-class DashCamDecorator(CarDecorator):
-    def get_price(self):
-        return self.car_component.get_price() + 15000.00
+    def __init__(self, car_component: CarComponent, addon=None):
+        super().__init__(car_component)
+        self.addon = addon or get_addon(self.code)
     
-    def get_description(self):
-        return self.car_component.get_description() + " + Dash Cam"
-
-class SeatCoversDecorator(CarDecorator):
-    def get_price(self):
-        return self.car_component.get_price() + 20000.00
+    def get_price_minor(self):
+        return self.car_component.get_price_minor() + self.addon.price
     
-    def get_description(self):
-        return self.car_component.get_description() + " + Custom Seat Covers"
-
-class WindowTintingDecorator(CarDecorator):
     def get_price(self):
-        return self.car_component.get_price() + 10000.00
+        return self.get_price_minor() / 100
     
     def get_description(self):
-        return self.car_component.get_description() + " + Window Tinting"
+        return self.car_component.get_description() + " + " + self.addon.label
+
+# Concrete Decorators
+class WarrantyDecorator(AddOnDecorator):
+    code = 'warranty'
+
+class DashCamDecorator(AddOnDecorator):
+    code = 'dashcam'
+
+class SeatCoversDecorator(AddOnDecorator):
+    code = 'seatcovers'
+
+class WindowTintingDecorator(AddOnDecorator):
+    code = 'tinting'
+
+def decorate(car_model, addons):
+    """BasicCar wrapped in a decorator for each of the AddOns"""
+    component = BasicCar(car_model)
+    for addon in addons:
+        component = AddOnDecorator(component, addon)
+    return component
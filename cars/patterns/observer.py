@@ -1,5 +1,8 @@
 from abc import ABC, abstractmethod
+from django.db import transaction
 from cars.models import Notification
+from cars.coalescing import notify_users, queue_for_digest
+from cars.notification_kinds import NotificationMessage
 
 # Observer
 class Observer(ABC):
@@ -13,8 +16,61 @@ class UserObserver(Observer):
         self.user = user
     
     def update(self, message):
-        # Create a notification in DB
-        Notification.objects.create(user=self.user, message=message)
+        # Create a notification in DB (message is a NotificationMessage)
+        Notification.objects.create(user=self.user, kind=message.kind, params=message.params)
+
+# Concrete Observer for a whole audience at once
+class FollowersObserver(Observer):
+    """
+    Notifies every follower of a car with chunked bulk INSERTs in one
+    transaction, instead of one UserObserver (and one INSERT) per follower.
+    Follower ids are streamed from the database, so memory use stays flat.
+    Repeated alerts are coalesced, and followers who chose the digest get
+    theirs queued for it instead (see cars/coalescing.py).
+    """
+    def __init__(self, car, chunk_size=2000):
+        self.car = car
+        self.chunk_size = chunk_size
+    
+    def followers(self):
+        # (id, wants digest) pairs; followers without a profile get alerts right away
+        return (
+            self.car.followers.values_list('id', 'profile__notification_digest')
+            .order_by().iterator(chunk_size=self.chunk_size)
+        )
+    
+    def update(self, message):
+        with transaction.atomic():
+            chunk = []
+            for follower in self.followers():
+                chunk.append(follower)
+                if len(chunk) == self.chunk_size:
+                    self.notify_chunk(chunk, message)
+                    chunk = []
+            if chunk:
+                self.notify_chunk(chunk, message)
+    
+    def notify_chunk(self, followers, message):
+        now = [user_id for user_id, digest in followers if not digest]
+        later = [user_id for user_id, digest in followers if digest]
+        if now:
+            notify_users(now, message)
+        if later:
+            queue_for_digest(later, message)
+
+# Concrete Observer that defers the fan-out to the outbox worker
+class QueuedFollowersObserver(Observer):
+    """
+    Records one outbox message in the current transaction; the outbox worker
+    then runs FollowersObserver for it, so the request does a single INSERT
+    however many followers the car has.
+    """
+    def __init__(self, car):
+        self.car = car
+    
+    def update(self, message):
+        from cars.outbox import notify_followers
+        notify_followers(self.car, message)
 
 # Subject
 class Subject(ABC):
@@ -49,5 +105,9 @@ class CarPriceSubject(Subject):
         self.car.save()
         
         # Notify all observers through the proper Observer pattern mechanism
-        message = f"The price of {self.car.make} {self.car.model} ({self.car.year}) has changed from ৳{old_price:.0f} to ৳{new_price:.0f}."
+        message = NotificationMessage('price_changed', {
+            'car': f"{self.car.make} {self.car.model} ({self.car.year})",
+            'old_price': f"{old_price:.0f}",
+            'new_price': f"{new_price:.0f}",
+        }, group=f'car:{self.car.pk}:price')
         self.notify(message)
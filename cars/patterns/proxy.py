@@ -1,5 +1,14 @@
 from abc import ABC, abstractmethod
+from functools import wraps
+from django.db import transaction
+from cars import seller_stats
+from cars.facets import invalidate_facets
 from cars.models import Car
+from cars.outbox import notify, notify_each
+from cars.notification_kinds import NotificationMessage, car_name
+from cars.search_cache import search_results
+from cars.signals import bulk_car_delete
+from cars.patterns.unit_of_work import UnitOfWork
 
 class CarAccessInterface(ABC):
     @abstractmethod
@@ -17,12 +26,24 @@ class CarAccessInterface(ABC):
     @abstractmethod
     def reject_car(self, car_id, reason):
         pass
+    
+    @abstractmethod
+    def approve_cars(self, car_ids):
+        pass
+    
+    @abstractmethod
+    def reject_cars(self, car_ids, reason):
+        pass
 
 class RealCarService(CarAccessInterface):
+    def __init__(self, unit_of_work=None):
+        self.unit_of_work = unit_of_work or UnitOfWork()
+    
     def delete_car(self, car_id):
         try:
-            car = Car.objects.get(id=car_id)
+            car = self.unit_of_work.get_car(car_id)
             car.delete()
+            self.unit_of_work.forget(car_id)
             return True, "Car deleted successfully."
         except Car.DoesNotExist:
             return False, "Car not found."
@@ -34,62 +55,106 @@ class RealCarService(CarAccessInterface):
     
     def approve_car(self, car_id):
         try:
-            car = Car.objects.get(id=car_id)
-            car.approval_status = 'approved'
-            car.save()
-            
-            # Notify owner
-            from cars.models import Notification
-            Notification.objects.create(
-                user=car.owner,
-                message=f"Your listing '{car.year} {car.make} {car.model}' has been approved by admin and is now visible to buyers."
-            )
+            car = self.unit_of_work.get_car(car_id)
+            with transaction.atomic():
+                car.approval_status = 'approved'
+                car.save()
+                
+                # Notify owner (delivered by the outbox worker)
+                notify(car.owner_id, NotificationMessage('listing_approved', {'car': car_name(car)}))
             return True, "Car listing approved successfully."
         except Car.DoesNotExist:
             return False, "Car not found."
     
     def reject_car(self, car_id, reason=""):
         try:
-            car = Car.objects.get(id=car_id)
-            
-            # Store car details before deletion
-            car_year = car.year
-            car_make = car.make
-            car_model = car.model
-            car_owner = car.owner
+            car = self.unit_of_work.get_car(car_id)
             
-            # Build notification message
-            from cars.models import Notification
-            message = f"Your car listing '{car_year} {car_make} {car_model}' has been rejected and removed by admin.\n\nReason: {reason}"
+            # Build notification message before deletion
+            car_owner = car.owner_id
+            message = NotificationMessage('listing_rejected', {'car': car_name(car), 'reason': reason})
             
-            Notification.objects.create(
-                user=car_owner,
-                message=message
-            )
-            
-            # Delete the car
-            car.delete()
+            with transaction.atomic():
+                notify(car_owner, message)
+                
+                # Delete the car
+                car.delete()
+            self.unit_of_work.forget(car_id)
             return True, "Car listing rejected and seller notified."
         except Car.DoesNotExist:
             return False, "Car not found."
+    
+    def pending_cars(self, car_ids):
+        # Locked, so a car approved or rejected concurrently is skipped rather than handled twice
+        return list(
+            Car.objects.select_for_update()
+            .filter(id__in=car_ids, approval_status='pending')
+            .only('id', 'year', 'make', 'model', 'status', 'owner_id')
+        )
+    
+    def approve_cars(self, car_ids):
+        with transaction.atomic():
+            cars = self.pending_cars(car_ids)
+            if not cars:
+                return False, "No pending listings selected."
+            Car.objects.filter(id__in=[car.pk for car in cars]).update(approval_status='approved')
+            for car in cars:
+                self.unit_of_work.forget(car.pk)
+            notify_each((car.owner_id, NotificationMessage('listing_approved', {'car': car_name(car)})) for car in cars)
+            # The UPDATE sends no post_save, so do what the signal handlers would once for the batch
+            seller_stats.cars_approved(cars)
+        invalidate_facets()
+        search_results.clear()
+        return True, f"{len(cars)} car listing(s) approved."
+    
+    def reject_cars(self, car_ids, reason=""):
+        with transaction.atomic(), bulk_car_delete():
+            cars = self.pending_cars(car_ids)
+            if not cars:
+                return False, "No pending listings selected."
+            notify_each(
+                (car.owner_id, NotificationMessage('listing_rejected', {'car': car_name(car), 'reason': reason}))
+                for car in cars
+            )
+            Car.objects.filter(id__in=[car.pk for car in cars]).delete()
+            for car in cars:
+                self.unit_of_work.forget(car.pk)
+        return True, f"{len(cars)} car listing(s) rejected and sellers notified."
+
+def profiled(method):
+    """Record the queries of each proxy call in the unit of work"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.unit_of_work.profile(f'CarAccessProxy.{method.__name__}'):
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class CarAccessProxy(CarAccessInterface):
-    def __init__(self, user):
+    def __init__(self, user, unit_of_work=None):
         self.user = user
-        self.real_service = RealCarService()
+        # Pass UnitOfWork.for_request(request) to share loaded cars across the request
+        self.unit_of_work = unit_of_work or UnitOfWork()
+        self.real_service = RealCarService(self.unit_of_work)
+    
+    @property
+    def last_query_count(self):
+        """Queries run by the latest call on this proxy, including the real service's"""
+        return self.unit_of_work.last_query_count
         
+    @profiled
     def delete_car(self, car_id):
         if self.user.is_superuser:
             return self.real_service.delete_car(car_id)
-        # Allow owner to delete their own car
+        # Allow owner to delete their own car; the real service reuses the car loaded here
         try:
-            car = Car.objects.get(id=car_id)
-            if self.user == car.owner:
+            car = self.unit_of_work.get_car(car_id)
+            if self.user.pk == car.owner_id:
                 return self.real_service.delete_car(car_id)
         except Car.DoesNotExist:
             return False, "Car not found."
         return False, "Permission denied: You are not authorized to delete this car."
             
+    @profiled
     def post_car(self, car_data):
         if not self.user.is_authenticated:
             return False, "Permission denied: You must be logged in to post a car."
@@ -97,12 +162,26 @@ class CarAccessProxy(CarAccessInterface):
             return False, "Permission denied: Admin users cannot list cars for sale."
         return self.real_service.post_car(car_data)
     
+    @profiled
     def approve_car(self, car_id):
         if not self.user.is_superuser:
             return False, "Permission denied: Only admin can approve car listings."
         return self.real_service.approve_car(car_id)
     
+    @profiled
     def reject_car(self, car_id, reason=""):
         if not self.user.is_superuser:
             return False, "Permission denied: Only admin can reject car listings."
         return self.real_service.reject_car(car_id, reason)
+    
+    @profiled
+    def approve_cars(self, car_ids):
+        if not self.user.is_superuser:
+            return False, "Permission denied: Only admin can approve car listings."
+        return self.real_service.approve_cars(car_ids)
+    
+    @profiled
+    def reject_cars(self, car_ids, reason=""):
+        if not self.user.is_superuser:
+            return False, "Permission denied: Only admin can reject car listings."
+        return self.real_service.reject_cars(car_ids, reason)
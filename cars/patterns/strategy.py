@@ -1,47 +1,216 @@
+import math
 from abc import ABC, abstractmethod
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from cars.facets import PRICE_BANDS, band_filter
 from cars.models import Car
+from cars.patterns.adapter import CurrencyAdapter
+from cars.search_index import get_search_backend
 
 class SearchStrategy(ABC):
     @abstractmethod
-    def search(self, query):
+    def build_filter(self, query):
+        """Return the Q object for this strategy so several strategies can share one query"""
         pass
 
+    def search(self, query):
+        return Car.objects.filter(self.build_filter(query))
+
+
+def range_filter(field, value_range):
+    # value_range is expected to be a tuple or list: [min_value, max_value]
+    # Either bound may be None, which leaves that side of the range open
+    min_value, max_value = value_range
+    condition = Q()
+    if min_value is not None:
+        condition &= Q(**{f'{field}__gte': min_value})
+    if max_value is not None:
+        condition &= Q(**{f'{field}__lte': max_value})
+    return condition
+
 class PriceSearchStrategy(SearchStrategy):
-    def search(self, price_range):
-        # price_range is expected to be a tuple or list: [min_price, max_price]
-        min_price, max_price = price_range
-        return Car.objects.filter(price__gte=min_price, price__lte=max_price)
+    def build_filter(self, price_range):
+        return range_filter('price', price_range)
+
+class PriceBandSearchStrategy(SearchStrategy):
+    """One of the facet PRICE_BANDS, matched half-open in BDT like the facet counts"""
+    def build_filter(self, band):
+        label, low, high = PRICE_BANDS[band]
+        return band_filter('price', low, high)
 
 class BrandSearchStrategy(SearchStrategy):
-    def search(self, brand_name):
-        return Car.objects.filter(make__icontains=brand_name)
+    def build_filter(self, brand_name):
+        return Q(make__icontains=brand_name)
 
 class ModelSearchStrategy(SearchStrategy):
-    def search(self, model_name):
-        return Car.objects.filter(model__icontains=model_name)
+    def build_filter(self, model_name):
+        return Q(model__icontains=model_name)
 
 class MileageSearchStrategy(SearchStrategy):
-    def search(self, mileage_range):
-        # mileage_range is expected to be a tuple or list: [min_mileage, max_mileage]
-        min_mileage, max_mileage = mileage_range
-        return Car.objects.filter(mileage__gte=min_mileage, mileage__lte=max_mileage)
+    def build_filter(self, mileage_range):
+        return range_filter('mileage', mileage_range)
 
 class TypeSearchStrategy(SearchStrategy):
-    def search(self, car_type):
-        return Car.objects.filter(car_type__iexact=car_type)
+    def build_filter(self, car_type):
+        # Types are stored as lowercase keys (see Car.CAR_TYPES), so a plain equality
+        # match works instead of iexact, which would wrap the column in UPPER()
+        return Q(car_type=car_type.lower())
 
 class YearSearchStrategy(SearchStrategy):
-    def search(self, year_range):
-        # year_range is expected to be a tuple or list: [min_year, max_year]
-        min_year, max_year = year_range
-        return Car.objects.filter(year__gte=min_year, year__lte=max_year)
+    def build_filter(self, year_range):
+        return range_filter('year', year_range)
+
+class FullTextSearchStrategy(SearchStrategy):
+    """
+    Keyword search over make, model and description through the full-text
+    index (see search_index.py) instead of LIKE '%...%' scans.
+    Tokens match as prefixes, and misspelt tokens fall back to close terms.
+    """
+    def __init__(self):
+        self.backend = get_search_backend()
+
+    def match_filter(self, expression):
+        return Q(id__in=RawSQL(self.backend.match_ids_sql(), [expression]))
+
+    def build_filter(self, text):
+        expression = self.backend.match_expression(text)
+        if not expression:
+            return Q()
+        return self.match_filter(expression)
+
+    def search(self, text):
+        # Best matches first
+        expression = self.backend.match_expression(text)
+        if not expression:
+            return Car.objects.none()
+        return self.backend.ranked(Car.objects.all(), expression).order_by('-search_rank', '-created_at', '-id')
+
+
+def finite_float(value):
+    """float() that refuses nan, inf and overflowing values like 1e400, which no column can be compared with"""
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f'{value!r} is not a finite number')
+    return number
+
+def price_band(value):
+    """Index into PRICE_BANDS"""
+    band = int(value)
+    if not 0 <= band < len(PRICE_BANDS):
+        raise ValueError(f'{value!r} is not a price band')
+    return band
+
+# Filters understood by the composite search, with the type each value is cast to
+SEARCH_FILTERS = {
+    'q': str,
+    'make': str,
+    'model': str,
+    'car_type': str,
+    'min_price': finite_float,
+    'max_price': finite_float,
+    'price_band': price_band,
+    'min_year': int,
+    'max_year': int,
+    'min_mileage': int,
+    'max_mileage': int,
+}
+
+def normalize_search_params(params):
+    """
+    Turn request parameters into a canonical filter dict.
+    Unknown keys and unparsable values are dropped, text is lowercased,
+    so two requests for the same search always produce the same dict.
+    """
+    filters = {}
+
+    # Single search bar: search_type + query
+    search_type = params.get('search_type')
+    query = (params.get('query') or '').strip()
+    if query:
+        if search_type == 'keyword':
+            filters['q'] = query
+        elif search_type == 'brand':
+            filters['make'] = query
+        elif search_type == 'model':
+            filters['model'] = query
+        elif search_type == 'type':
+            filters['car_type'] = query
+        elif search_type == 'year':
+            filters['min_year'] = query
+            filters['max_year'] = query
+
+    for name in SEARCH_FILTERS:
+        value = params.get(name)
+        if value not in (None, ''):
+            filters[name] = value
+
+    normalized = {}
+    for name, value in filters.items():
+        try:
+            value = SEARCH_FILTERS[name](str(value).strip())
+        except ValueError:
+            continue
+        if isinstance(value, str):
+            value = value.lower()
+            if not value:
+                continue
+        normalized[name] = value
+    return normalized
+
+class CompositeSearchStrategy(SearchStrategy):
+    """
+    Applies several strategies at once. All conditions, including the
+    approval check, are combined into a single WHERE clause with a stable
+    (created_at, id) ordering.
+    """
+    ORDERING = ('-created_at', '-id')
+
+    def __init__(self, currency='BDT'):
+        # Currency the price filters are entered in
+        self.currency = currency
+
+    def to_bdt(self, amount):
+        if amount is None:
+            return None
+        return CurrencyAdapter.convert_to_bdt_static(amount, self.currency)
+
+    def get_criteria(self, filters):
+        """Map a normalized filter dict to (strategy, query) pairs"""
+        criteria = []
+        if 'q' in filters:
+            criteria.append((FullTextSearchStrategy(), filters['q']))
+        if 'make' in filters:
+            criteria.append((BrandSearchStrategy(), filters['make']))
+        if 'model' in filters:
+            criteria.append((ModelSearchStrategy(), filters['model']))
+        if 'car_type' in filters:
+            criteria.append((TypeSearchStrategy(), filters['car_type']))
+        if 'min_price' in filters or 'max_price' in filters:
+            price_range = [self.to_bdt(filters.get('min_price')), self.to_bdt(filters.get('max_price'))]
+            criteria.append((PriceSearchStrategy(), price_range))
+        if 'price_band' in filters:
+            criteria.append((PriceBandSearchStrategy(), filters['price_band']))
+        if 'min_year' in filters or 'max_year' in filters:
+            criteria.append((YearSearchStrategy(), [filters.get('min_year'), filters.get('max_year')]))
+        if 'min_mileage' in filters or 'max_mileage' in filters:
+            criteria.append((MileageSearchStrategy(), [filters.get('min_mileage'), filters.get('max_mileage')]))
+        return criteria
+
+    def build_filter(self, filters):
+        condition = Q(approval_status='approved')
+        for strategy, query in self.get_criteria(filters):
+            condition &= strategy.build_filter(query)
+        return condition
+
+    def search(self, filters):
+        return Car.objects.filter(self.build_filter(filters)).order_by(*self.ORDERING)
 
 class CarSearchContext:
     def __init__(self, strategy: SearchStrategy):
         self.strategy = strategy
-    
+
     def set_strategy(self, strategy: SearchStrategy):
         self.strategy = strategy
-    
+
     def execute_search(self, query):
         return self.strategy.search(query)
@@ -0,0 +1,67 @@
+"""
+Unit of work for one request: an identity map of the cars it has loaded.
+
+CarAccessProxy checks permissions on a car and RealCarService then acts on
+it; both ask the unit of work, so the car (with its owner) is fetched once per
+request instead of once per layer. Each proxy call is also timed in queries,
+recorded in `calls` and logged at DEBUG level, for profiling.
+"""
+import logging
+from contextlib import contextmanager
+
+from django.db import connection
+
+from cars.models import Car
+
+logger = logging.getLogger(__name__)
+
+# Marks a car id already looked up and not found
+MISSING = object()
+
+
+class UnitOfWork:
+    def __init__(self):
+        self._cars = {}
+        self.calls = []
+
+    @classmethod
+    def for_request(cls, request):
+        """The unit of work shared by everything handling this request"""
+        if not hasattr(request, '_unit_of_work'):
+            request._unit_of_work = cls()
+        return request._unit_of_work
+
+    def get_car(self, car_id):
+        """The car with its owner, loaded at most once; raises Car.DoesNotExist"""
+        car = self._cars.get(car_id)
+        if car is None:
+            car = Car.objects.select_related('owner').filter(id=car_id).first() or MISSING
+            self._cars[car_id] = car
+        if car is MISSING:
+            raise Car.DoesNotExist(f'Car {car_id} not found')
+        return car
+
+    def forget(self, car_id):
+        """Drop a car changed or deleted behind the map's back; it is reloaded if asked for again"""
+        self._cars.pop(car_id, None)
+
+    @contextmanager
+    def profile(self, name):
+        """Count the queries run inside the block as one call named `name`"""
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(count):
+                yield
+        finally:
+            self.calls.append((name, queries))
+            logger.debug('%s ran %s queries', name, queries)
+
+    @property
+    def last_query_count(self):
+        return self.calls[-1][1] if self.calls else None
@@ -1,8 +1,9 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.utils import timezone
-from .models import Order, Notification
+from django.http import HttpResponse
+from .models import Order
+from .payments import METHOD_VALUES, PAYMENT_METHODS, new_key, submit_payment
 
 @login_required
 def initiate_payment(request, order_id):
@@ -19,47 +20,41 @@ def initiate_payment(request, order_id):
         messages.info(request, "This order has already been paid.")
         return redirect('profile')
     
-    # Payment methods
-    payment_methods = [
-        {'value': 'bkash', 'name': 'bKash', 'icon': '📱', 'color': '#E2136E'},
-        {'value': 'nagad', 'name': 'Nagad', 'icon': '📞', 'color': '#ED1C24'},
-        {'value':  'rocket', 'name':  'Rocket', 'icon': '🚀', 'color': '#8B3A9C'},
-        {'value': 'card', 'name': 'Credit/Debit Card', 'icon': '💳', 'color': '#4A90E2'},
-    ]
-    
     return render(request, 'cars/payment/initiate.html', {
         'order':  order,
-        'payment_methods': payment_methods,
+        'payment_methods': PAYMENT_METHODS,
+        # Sent back with the form, so a repeated submission is recognised
+        'idempotency_key': new_key(),
     })
 
 @login_required
 def process_payment(request, order_id):
-    """Process mock payment"""
+    """Process mock payment, at most once per idempotency key"""
     order = get_object_or_404(Order, id=order_id)
     
+    if request.user != order.buyer:
+        messages.error(request, "You are not authorized to pay for this order.")
+        return redirect('home')
+    
     if request.method == 'POST': 
         payment_method = request.POST.get('payment_method')
+        if payment_method not in METHOD_VALUES:
+            messages.error(request, "Please select a payment method.")
+            return redirect('initiate_payment', order_id=order.id)
         
-        # Mock payment processing (instant success)
-        order.status = 'paid'
-        order.payment_method = payment_method
-        order.payment_completed_at = timezone.now()
-        order.save()
-        
-        # Notify seller
-        Notification.objects.create(
-            user=order.car.owner,
-            message=f"💰 Payment Received!  {order.buyer.username} has paid ৳{order.total_price} for your {order.car.year} {order.car.make} {order.car.model}.You can now accept the order."
-        )
+        key = request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key') or new_key()
+        result = submit_payment(request.user, order.id, key[:64], payment_method)
         
-        # Notify buyer
-        Notification.objects.create(
-            user=order.buyer,
-            message=f"✅ Payment successful! You paid ৳{order.total_price} for {order.car.year} {order.car.make} {order.car.model}.Waiting for seller confirmation."
-        )
-        
-        messages.success(request, f"Payment successful! ৳{order.total_price} paid via {payment_method}.")
-        return redirect('payment_success', order_id=order.id)
+        if result.outcome == 'key_conflict':
+            return HttpResponse("This idempotency key was already used for a different order.", status=422)
+        if result.outcome == 'paid':
+            messages.success(request, f"Payment successful! ৳{order.total_price} paid via {result.payment_method}.")
+            return redirect('payment_success', order_id=order.id)
+        if result.outcome == 'already_paid':
+            messages.info(request, "This order has already been paid.")
+            return redirect('payment_success', order_id=order.id)
+        messages.error(request, "This order is no longer open for payment.")
+        return redirect('profile')
     
     return redirect('initiate_payment', order_id=order_id)
 
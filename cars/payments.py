@@ -0,0 +1,110 @@
+"""
+Idempotent payment submissions.
+
+The payment form carries an idempotency key, generated when the form is
+shown (clients may send an Idempotency-Key header instead). The first
+submission with a key pays for the order if it is still pending, under a lock
+on the order row, and records the outcome as a PaymentSubmission. Any
+repeated submission with the key, whether a double click, a retry, or a
+reload, gets that same outcome back without touching the order or notifying
+anyone again. Recent outcomes are also kept in the cache, so most replays
+don't reach the database at all.
+"""
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from . import ledger, outbox
+from .models import Order, PaymentEvent, PaymentSubmission
+from .notification_kinds import NotificationMessage, car_name
+
+PAYMENT_METHODS = [
+    {'value': 'bkash', 'name': 'bKash', 'icon': '📱', 'color': '#E2136E'},
+    {'value': 'nagad', 'name': 'Nagad', 'icon': '📞', 'color': '#ED1C24'},
+    {'value':  'rocket', 'name':  'Rocket', 'icon': '🚀', 'color': '#8B3A9C'},
+    {'value': 'card', 'name': 'Credit/Debit Card', 'icon': '💳', 'color': '#4A90E2'},
+]
+METHOD_VALUES = {method['value'] for method in PAYMENT_METHODS}
+
+# How long outcomes stay in the replay cache; older keys are still answered from the table
+REPLAY_TTL = 60 * 60 * 24
+
+
+class PaymentResult(namedtuple('PaymentResult', ['outcome', 'order_id', 'payment_method', 'replayed'])):
+    """
+    outcome is 'paid' (this submission paid the order), 'already_paid' (it was
+    paid or completed before), 'closed' (the order was cancelled) or
+    'key_conflict' (the key was first used for the order in order_id, another
+    one; nothing was done).
+    """
+
+    def for_order(self, order_id):
+        """This result, or a conflict if it belongs to a different order"""
+        if self.order_id == order_id:
+            return self
+        return self._replace(outcome='key_conflict')
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def replay_cache_key(user_id, key):
+    return f'payment-submission:{user_id}:{key}'
+
+
+def submit_payment(user, order_id, key, payment_method):
+    """Pay for the user's order once per key and return the outcome of the first submission"""
+    cache_key = replay_cache_key(user.pk, key)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return PaymentResult(*cached, replayed=True).for_order(order_id)
+
+    with transaction.atomic():
+        # Submissions for the order queue here, so the key check and the state check below see each other's writes
+        order = Order.objects.select_for_update().get(pk=order_id, buyer=user)
+        previous = PaymentSubmission.objects.filter(user=user, key=key).first()
+        if previous is not None:
+            result = PaymentResult(previous.outcome, previous.order_id, previous.payment_method, replayed=True)
+            if previous.order_id != order.pk:
+                # Keys are per payment: never replay another order's outcome here
+                return result.for_order(order.pk)
+        else:
+            if order.status == 'pending':
+                outcome = 'paid'
+                mark_paid(order, payment_method)
+            elif order.status in ('paid', 'completed'):
+                outcome = 'already_paid'
+            else:
+                outcome = 'closed'
+            PaymentSubmission.objects.create(
+                user=user, key=key, order=order, outcome=outcome, payment_method=payment_method,
+            )
+            result = PaymentResult(outcome, order.pk, payment_method, replayed=False)
+
+    cache.set(cache_key, result[:3], REPLAY_TTL)
+    return result
+
+
+def mark_paid(order, payment_method):
+    # Mock payment processing (instant success)
+    ledger.record(order, PaymentEvent.INITIATED, method=payment_method)
+    ledger.record(order, PaymentEvent.CAPTURED, method=payment_method)
+    order.status = 'paid'
+    order.payment_method = payment_method
+    order.payment_completed_at = timezone.now()
+    order.save(update_fields=['status', 'payment_method', 'payment_completed_at'])
+
+    car = order.car
+    # Notify seller
+    outbox.notify(
+        car.owner_id,
+        NotificationMessage('payment_received', {
+            'buyer': order.buyer.username, 'amount': str(order.total_price), 'car': car_name(car),
+        })
+    )
+    # Notify buyer
+    outbox.notify(order.buyer_id, NotificationMessage('payment_sent', {'amount': str(order.total_price), 'car': car_name(car)}))
@@ -0,0 +1,106 @@
+"""
+Pricing of a car with optional add-ons.
+
+The add-on catalogue (code, label, price, and the Order flag it sets) lives
+here instead of in each view. Set CAR_ADDONS in settings to change it, as
+[{'code': ..., 'label': ..., 'price': '50000', 'order_field': 'has_warranty'}, ...]
+with prices in taka.
+
+Totals are computed in integer poisha, so they are exact; only the displayed
+amounts in other currencies are converted to floats. A quote covers the car
+price, the selected add-ons and the price of every add-on in the display
+currency, converted in one call. Quotes are memoized per (price, add-ons,
+currency, rates snapshot), so car_detail and buy_car share the same path.
+"""
+from collections import namedtuple
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+
+from .exchange_rates import current_rates
+from .patterns.adapter import CurrencyAdapter
+
+AddOn = namedtuple('AddOn', ['code', 'label', 'price', 'order_field'])
+
+DEFAULT_ADDONS = (
+    AddOn('warranty', 'Extended Warranty', 5000000, 'has_warranty'),
+    AddOn('dashcam', 'Dash Cam', 1500000, 'has_dashcam'),
+    AddOn('seatcovers', 'Custom Seat Covers', 2000000, 'has_seatcovers'),
+    AddOn('tinting', 'Window Tinting', 1000000, 'has_tinting'),
+)
+
+QUOTE_CACHE_SIZE = 4096
+
+
+def to_minor(amount):
+    """Taka (Decimal, str or int) to integer poisha"""
+    return int(Decimal(str(amount)) * 100)
+
+
+def from_minor(amount):
+    """Integer poisha to a Decimal amount in taka"""
+    return Decimal(amount) / 100
+
+
+def get_catalogue():
+    configured = getattr(settings, 'CAR_ADDONS', None)
+    if configured is None:
+        return DEFAULT_ADDONS
+    return tuple(
+        AddOn(item['code'], item['label'], to_minor(item['price']), item.get('order_field'))
+        for item in configured
+    )
+
+
+def get_addon(code):
+    for addon in get_catalogue():
+        if addon.code == code:
+            return addon
+    raise KeyError(code)
+
+
+class Quote(namedtuple('Quote', [
+    'base', 'total', 'addons', 'currency', 'symbol', 'display_base', 'display_total', 'addon_prices',
+])):
+    """
+    base and total are in BDT poisha, addons the selected AddOns. The display_*
+    amounts and addon_prices (code -> price) are in the quote's currency.
+    """
+
+    @property
+    def total_price(self):
+        """The total in taka, as stored on an Order"""
+        return from_minor(self.total)
+
+
+def quote(price, addons=(), currency='BDT'):
+    """Price a car (price in taka) with the add-on codes selected in `addons`"""
+    catalogue = get_catalogue()
+    selected = tuple(addon for addon in catalogue if addon.code in addons)
+    return _quote(to_minor(price), selected, currency, catalogue, current_rates())
+
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def _quote(base, selected, currency, catalogue, snapshot):
+    # A refreshed rates snapshot is a new key, so stale conversions are never returned
+    total = base + sum(addon.price for addon in selected)
+    adapter = CurrencyAdapter(snapshot)
+    display_base, display_total, *display_addons = adapter.convert_many_from_bdt(
+        [base / 100, total / 100] + [addon.price / 100 for addon in catalogue], currency,
+    )
+    return Quote(
+        base=base,
+        total=total,
+        addons=selected,
+        currency=currency,
+        symbol=adapter.get_currency_symbol(currency),
+        display_base=display_base,
+        display_total=display_total,
+        addon_prices={addon.code: price for addon, price in zip(catalogue, display_addons)},
+    )
+
+
+def selected_addons(data):
+    """Add-on codes switched on in a request's GET or POST data"""
+    return {addon.code for addon in get_catalogue() if data.get(addon.code) in ('true', 'on', '1')}
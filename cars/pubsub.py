@@ -0,0 +1,216 @@
+"""
+Publish/subscribe for pushing events to open streams (see notification_stream).
+
+LocalBroker delivers messages to subscribers in the same process, which is
+enough when everything that publishes runs in the one ASGI worker.
+DatabaseBroker (the default) goes through a BrokerMessage table instead, so
+messages published by the outbox worker or another web worker reach every
+process: one poller thread per process reads new rows every
+NOTIFICATION_BROKER_POLL seconds and hands them to its local subscribers.
+That is one query per process per interval however many streams are open.
+Pollers advertise the channels they have streams for in BrokerListener, and
+publishers only write rows for those, so a fan-out to thousands of users
+without an open stream writes nothing. Publishers also prune old rows.
+A Broker subclass backed by e.g. Redis pub/sub can replace it.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """Messages for one channel, read by one stream on its event loop"""
+
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def deliver(self, message):
+        # Publishers run in request threads, so hand the message over to the stream's loop
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        if self.queue.full():
+            # A slow reader loses the oldest message; every message carries the current count anyway
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Next message, or None if nothing arrived within timeout seconds"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    def publish(self, channel, message):
+        raise NotImplementedError
+
+    def publish_many(self, messages):
+        """Publish (channel, message) pairs; brokers that can batch them override this"""
+        for channel, message in messages:
+            self.publish(channel, message)
+
+    def subscribe(self, channel):
+        """Must be called from the event loop that will read the subscription"""
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class LocalBroker(Broker):
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.deliver(message)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, self.queue_size)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+
+class DatabaseBroker(LocalBroker):
+    # How long published messages are kept for pollers that fall behind
+    RETENTION = timedelta(minutes=5)
+    # How long a process's interest in a channel stays advertised without being renewed
+    LISTENER_TTL = timedelta(seconds=30)
+    PRUNE_EVERY = timedelta(minutes=1)
+    # Channels looked up per query when publishing a batch
+    BATCH_SIZE = 500
+
+    def __init__(self, queue_size=100, interval=None):
+        super().__init__(queue_size)
+        self.interval = interval if interval is not None else getattr(settings, 'NOTIFICATION_BROKER_POLL', 1.0)
+        self._poller = None
+        self._pruned_at = None
+
+    def publish(self, channel, message):
+        self.publish_many([(channel, message)])
+
+    def publish_many(self, messages):
+        """
+        Store the messages whose channel some process is listening on (see
+        BrokerListener), with one lookup and one INSERT per BATCH_SIZE messages.
+        Most channels of a large fan-out have no open stream, so nothing is written for them.
+        """
+        from .models import BrokerListener, BrokerMessage
+        messages = list(messages)
+        now = timezone.now()
+        for start in range(0, len(messages), self.BATCH_SIZE):
+            batch = messages[start:start + self.BATCH_SIZE]
+            listened = set(BrokerListener.objects.filter(
+                channel__in={channel for channel, _ in batch}, expires_at__gt=now,
+            ).values_list('channel', flat=True))
+            rows = [BrokerMessage(channel=channel, payload=message, created_at=now) for channel, message in batch if channel in listened]
+            if rows:
+                BrokerMessage.objects.bulk_create(rows)
+        self.prune(now)
+
+    def prune(self, now=None):
+        """Delete old messages and expired listeners, at most once per PRUNE_EVERY in this process"""
+        from .models import BrokerListener, BrokerMessage
+        now = now or timezone.now()
+        if self._pruned_at is not None and now - self._pruned_at < self.PRUNE_EVERY:
+            return
+        self._pruned_at = now
+        BrokerMessage.objects.filter(created_at__lt=now - self.RETENTION).delete()
+        BrokerListener.objects.filter(expires_at__lte=now).delete()
+
+    def subscribe(self, channel):
+        subscription = super().subscribe(channel)
+        with self._lock:
+            if self._poller is None:
+                # Messages published from now on; runs outside the event loop, which can't use the ORM
+                self._poller = threading.Thread(
+                    target=self._poll, args=(timezone.now(),), name='broker-poller', daemon=True,
+                )
+                self._poller.start()
+        return subscription
+
+    def _advertise(self, channels, now):
+        from .models import BrokerListener
+        # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+        target = ['channel'] if connection.features.supports_update_conflicts_with_target else None
+        BrokerListener.objects.bulk_create(
+            [BrokerListener(channel=channel, expires_at=now + self.LISTENER_TTL) for channel in channels],
+            update_conflicts=True, unique_fields=target, update_fields=['expires_at'],
+        )
+
+    def _poll(self, since):
+        from .models import BrokerMessage
+        last_id = None
+        advertised = set()
+        renew_at = None
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                channels = set(self._subscribers)
+            if not channels:
+                continue
+            try:
+                close_old_connections()
+                now = timezone.now()
+                if renew_at is None or now >= renew_at or not channels <= advertised:
+                    self._advertise(channels, now)
+                    renew_at = now + self.LISTENER_TTL / 3
+                    # Publishers skipped these channels until now, so their streams re-read the state
+                    for channel in channels - advertised:
+                        super().publish(channel, {'type': 'listening'})
+                    advertised = channels
+                new = BrokerMessage.objects.order_by('id')
+                new = new.filter(created_at__gte=since) if last_id is None else new.filter(id__gt=last_id)
+                for pk, channel, payload in new.values_list('id', 'channel', 'payload'):
+                    last_id = pk
+                    super().publish(channel, payload)
+            except Exception:
+                logger.exception('Polling for broker messages failed')
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'NOTIFICATION_BROKER', 'cars.pubsub.LocalBroker'))()
+    return _broker
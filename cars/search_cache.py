@@ -0,0 +1,138 @@
+"""
+Result cache in front of the composite search.
+
+Popular searches (a brand, a common price band) are answered from an
+in-process LRU of result keys, so a page only loads its own rows by id
+instead of re-running the search query. Each entry holds the (created_at, id)
+keys of the first MAX_KEYS results, which covers the first pages; deeper
+pages fall back to the normal keyset query.
+
+The handlers in signals.py drop entries when a change to a car could alter
+a result set. Each worker process has its own cache, so entries also expire
+after ENTRY_TTL seconds to bound staleness from saves in other processes.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Car fields each search filter reads, used to find the entries a change can affect
+FILTER_FIELDS = {
+    'q': {'make', 'model', 'description'},
+    'make': {'make'},
+    'model': {'model'},
+    'car_type': {'car_type'},
+    'min_price': {'price'},
+    'max_price': {'price'},
+    'price_band': {'price'},
+    'min_year': {'year'},
+    'max_year': {'year'},
+    'min_mileage': {'mileage'},
+    'max_mileage': {'mileage'},
+}
+
+MAX_ENTRIES = 256
+MAX_KEYS = 24 * 20
+ENTRY_TTL = 60 * 5
+
+
+class SearchCacheEntry:
+    def __init__(self, filters, keys, complete, expires_at):
+        self.keys = keys
+        self.complete = complete
+        self.ids = {pk for _, pk in keys}
+        self.fields = set()
+        for name in filters:
+            self.fields |= FILTER_FIELDS.get(name, set())
+        self.expires_at = expires_at
+
+
+class SearchResultCache:
+    def __init__(self, max_entries=MAX_ENTRIES, max_keys=MAX_KEYS, ttl=ENTRY_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped by every invalidation, so a load that raced with one is not stored
+        self._generation = 0
+
+    def make_key(self, filters, currency, rates_version):
+        # Currency only matters through the price filters, so other searches share one entry
+        if 'min_price' in filters or 'max_price' in filters:
+            return json.dumps([filters, currency, rates_version], sort_keys=True)
+        return json.dumps([filters], sort_keys=True)
+
+    def get(self, filters, currency, rates_version, load_keys):
+        """
+        The entry for a search, calling load_keys(limit) on a miss.
+        load_keys must return the first `limit` (created_at, id) keys in page order.
+        """
+        key = self.make_key(filters, currency, rates_version)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            generation = self._generation
+
+        # Load outside the lock; a concurrent miss for the same search just loads it twice
+        keys = load_keys(self.max_keys + 1)
+        entry = SearchCacheEntry(filters, keys[:self.max_keys], len(keys) <= self.max_keys, now + self.ttl)
+        with self._lock:
+            if generation != self._generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def _drop(self, predicate):
+        with self._lock:
+            self._generation += 1
+            for key in [key for key, entry in self._entries.items() if predicate(entry)]:
+                del self._entries[key]
+
+    def car_added(self, car_id):
+        """A car became searchable (approved); it may match any search"""
+        self.clear()
+
+    def car_removed(self, car_id):
+        """A car stopped being searchable (unapproved or deleted)"""
+        self._drop(lambda entry: car_id in entry.ids)
+
+    def car_changed(self, car_id, fields):
+        """
+        A searchable car changed. Only searches filtering on a changed field can
+        gain or lose it; the ordering keys never change. Fields no filter reads,
+        like status, leave every result set as it was.
+        """
+        fields = set(fields)
+        self._drop(lambda entry: entry.fields & fields)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+search_results = SearchResultCache()
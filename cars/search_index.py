@@ -0,0 +1,179 @@
+"""
+Full-text search over car make, model and description.
+
+SQLite (the default database) uses an FTS5 virtual table that is kept in sync
+with Car by the handlers in signals.py. MySQL (USE_MYSQL=True) uses a native
+FULLTEXT index on cars_car, which the database maintains itself. Both tables
+are created by migration 0015.
+"""
+import difflib
+import re
+
+from django.db import connection
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class SearchBackend:
+    # Minimum similarity for a vocabulary term to be accepted as a typo correction
+    TYPO_CUTOFF = 0.75
+
+    def index(self, car):
+        """Add or refresh a car in the index"""
+        pass
+
+    def remove(self, car_id):
+        """Drop a car from the index"""
+        pass
+
+    def remove_many(self, car_ids):
+        for car_id in car_ids:
+            self.remove(car_id)
+
+    def rebuild(self):
+        """Re-index every car, e.g. after bulk_create which sends no signals"""
+        pass
+
+    def has_prefix(self, token):
+        raise NotImplementedError
+
+    def vocabulary(self, first_letter):
+        """Indexed terms starting with first_letter, used for typo correction"""
+        raise NotImplementedError
+
+    def expand(self, text):
+        """
+        Split text into tokens and pair each with its alternatives.
+        A token that matches nothing in the index is paired with the closest
+        indexed terms, so 'toyta' still finds 'toyota'.
+        """
+        expanded = []
+        for token in tokenize(text):
+            corrections = []
+            if not self.has_prefix(token):
+                corrections = difflib.get_close_matches(token, self.vocabulary(token[0]), n=3, cutoff=self.TYPO_CUTOFF)
+            expanded.append((token, corrections))
+        return expanded
+
+    def match_expression(self, text):
+        raise NotImplementedError
+
+    def match_ids_sql(self):
+        """SQL returning the ids of matching cars; takes the match expression as its only parameter"""
+        raise NotImplementedError
+
+    def ranked(self, queryset, expression):
+        """Restrict queryset to matching cars and annotate a search_rank (higher is better)"""
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(SearchBackend):
+    TABLE = 'cars_car_fts'
+    VOCAB_TABLE = 'cars_car_fts_vocab'
+
+    def index(self, car):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE} WHERE rowid = %s', [car.pk])
+            cursor.execute(
+                f'INSERT INTO {self.TABLE} (rowid, make, model, description) VALUES (%s, %s, %s, %s)',
+                [car.pk, car.make, car.model, car.description or ''],
+            )
+
+    def remove(self, car_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE} WHERE rowid = %s', [car_id])
+
+    def remove_many(self, car_ids):
+        car_ids = list(car_ids)
+        if car_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.TABLE} WHERE rowid IN ({", ".join(["%s"] * len(car_ids))})', car_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.TABLE}')
+            cursor.execute(
+                f'INSERT INTO {self.TABLE} (rowid, make, model, description) '
+                "SELECT id, make, model, COALESCE(description, '') FROM cars_car"
+            )
+
+    def has_prefix(self, token):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM {self.VOCAB_TABLE} WHERE term >= %s AND term < %s LIMIT 1', [token, token + '\uffff'])
+            return cursor.fetchone() is not None
+
+    def vocabulary(self, first_letter):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT term FROM {self.VOCAB_TABLE} WHERE term >= %s AND term < %s', [first_letter, first_letter + '\uffff'])
+            return [row[0] for row in cursor.fetchall()]
+
+    def match_expression(self, text):
+        # Every token must match, either as a prefix or through one of its corrections
+        groups = []
+        for token, corrections in self.expand(text):
+            options = [f'"{token}"*'] + [f'"{term}"' for term in corrections]
+            groups.append('(' + ' OR '.join(options) + ')')
+        return ' AND '.join(groups)
+
+    def match_ids_sql(self):
+        return f'SELECT rowid FROM {self.TABLE} WHERE {self.TABLE} MATCH %s'
+
+    def ranked(self, queryset, expression):
+        # Join the FTS table so bm25 is computed once per match by the MATCH scan itself.
+        # Its rank column is configured with the column weights in migration 0015 and is
+        # lower for better matches, so negate it.
+        return queryset.extra(
+            select={'search_rank': f'-{self.TABLE}.rank'},
+            tables=[self.TABLE],
+            where=[f'{self.TABLE}.rowid = cars_car.id', f'{self.TABLE} MATCH %s'],
+            params=[expression],
+        )
+
+
+class MySQLSearchBackend(SearchBackend):
+    MATCH = 'MATCH (make, model, description) AGAINST (%s IN BOOLEAN MODE)'
+
+    def has_prefix(self, token):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT 1 FROM cars_car WHERE {self.MATCH} LIMIT 1', [f'{token}*'])
+            return cursor.fetchone() is not None
+
+    def vocabulary(self, first_letter):
+        # Make and model words are a small, low-cardinality vocabulary
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT DISTINCT make FROM cars_car WHERE make LIKE %s '
+                'UNION SELECT DISTINCT model FROM cars_car WHERE model LIKE %s',
+                [f'{first_letter}%', f'{first_letter}%'],
+            )
+            terms = set()
+            for (value,) in cursor.fetchall():
+                terms.update(tokenize(value))
+            return sorted(terms)
+
+    def match_expression(self, text):
+        groups = []
+        for token, corrections in self.expand(text):
+            groups.append('+(' + ' '.join([f'{token}*'] + corrections) + ')')
+        return ' '.join(groups)
+
+    def match_ids_sql(self):
+        return f'SELECT id FROM cars_car WHERE {self.MATCH}'
+
+    def ranked(self, queryset, expression):
+        return queryset.extra(
+            select={'search_rank': self.MATCH},
+            select_params=[expression],
+            where=[self.MATCH],
+            params=[expression],
+        )
+
+
+def get_search_backend():
+    if connection.vendor == 'mysql':
+        return MySQLSearchBackend()
+    return SQLiteSearchBackend()
@@ -0,0 +1,118 @@
+"""
+Materialized per-seller statistics.
+
+The handlers in signals.py work out how much a saved or deleted car or order
+adds to its seller's totals before and after the change, and apply the
+difference with a single UPDATE ... SET x = x + n. Saves that don't touch the
+counted fields cost nothing. Changes that bypass signals (queryset.update(),
+raw SQL) are covered by `manage.py rebuild_seller_stats`, which recomputes
+every row from one grouped aggregate.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Car, SellerStats
+from .pricing import to_minor
+
+COUNTERS = ('listings', 'available', 'sold', 'sales', 'revenue', 'seconds_to_sell')
+
+
+def car_counts(values):
+    """What a car with these field values (by attname) adds to its seller's totals"""
+    if values is None or values['approval_status'] != 'approved':
+        return {}
+    return {
+        'listings': 1,
+        'available': int(values['status'] == 'available'),
+        'sold': int(values['status'] == 'sold'),
+    }
+
+
+def order_counts(values, car):
+    """What an order with these field values adds to the totals of the car's seller"""
+    if values is None or values['status'] != 'completed':
+        return {}
+    completed_at = values['completed_at'] or values['payment_completed_at'] or values['created_at']
+    return {
+        'sales': 1,
+        'revenue': to_minor(values['total_price']),
+        'seconds_to_sell': max(int((completed_at - car.created_at).total_seconds()), 0),
+    }
+
+
+def apply_change(seller_id, before, after):
+    """Add the difference between two count dicts to the seller's row"""
+    deltas = {name: after.get(name, 0) - before.get(name, 0) for name in COUNTERS}
+    deltas = {name: delta for name, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    changes = {name: F(name) + delta for name, delta in deltas.items()}
+    if SellerStats.objects.filter(seller_id=seller_id).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            SellerStats.objects.create(seller_id=seller_id, **deltas)
+    except IntegrityError:
+        # Created by a concurrent request in the meantime
+        SellerStats.objects.filter(seller_id=seller_id).update(**changes)
+
+
+def cars_approved(cars):
+    """Count cars approved with queryset.update(), which sends no post_save, with one UPDATE per seller"""
+    totals = {}
+    for car in cars:
+        seller = totals.setdefault(car.owner_id, dict.fromkeys(COUNTERS, 0))
+        for name, count in car_counts({'approval_status': 'approved', 'status': car.status}).items():
+            seller[name] += count
+    for seller_id, counts in totals.items():
+        apply_change(seller_id, {}, counts)
+
+
+def current_values(instance):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+def get_stats(seller):
+    """The seller's row, or an unsaved empty one for sellers with nothing counted yet"""
+    return SellerStats.objects.filter(seller=seller).first() or SellerStats(seller=seller)
+
+
+def rebuild(batch_size=1000):
+    """Recompute every seller's row from one grouped aggregate over cars and their completed orders"""
+    approved = Q(approval_status='approved')
+    completed = Q(orders__status='completed')
+    completed_at = Coalesce('orders__completed_at', 'orders__payment_completed_at', 'orders__created_at')
+    rows = (
+        Car.objects.order_by('owner_id').values('owner_id').annotate(
+            listings_count=Count('id', filter=approved, distinct=True),
+            available_count=Count('id', filter=approved & Q(status='available'), distinct=True),
+            sold_count=Count('id', filter=approved & Q(status='sold'), distinct=True),
+            sales_count=Count('orders', filter=completed),
+            revenue_total=Sum('orders__total_price', filter=completed),
+            time_to_sell=Sum(
+                ExpressionWrapper(completed_at - F('created_at'), output_field=DurationField()), filter=completed,
+            ),
+        )
+    )
+    rebuilt = 0
+    with transaction.atomic():
+        SellerStats.objects.all().delete()
+        batch = []
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(SellerStats(
+                seller_id=row['owner_id'],
+                listings=row['listings_count'],
+                available=row['available_count'],
+                sold=row['sold_count'],
+                sales=row['sales_count'],
+                revenue=to_minor(row['revenue_total'] or 0),
+                seconds_to_sell=max(int(row['time_to_sell'].total_seconds()), 0) if row['time_to_sell'] else 0,
+            ))
+            if len(batch) >= batch_size:
+                SellerStats.objects.bulk_create(batch)
+                rebuilt += len(batch)
+                batch = []
+        SellerStats.objects.bulk_create(batch)
+        rebuilt += len(batch)
+    return rebuilt
@@ -0,0 +1,202 @@
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .models import Car, CarImage, Notification, Order
+from .search_index import get_search_backend
+from .facets import FACET_FIELDS, invalidate_facets
+from .search_cache import search_results
+from .notifications import add_unread, publish_notification, remove_unread
+from . import dashboard, seller_stats
+
+# Bulk deletes
+
+_bulk = threading.local()
+
+@contextmanager
+def bulk_car_delete():
+    """
+    Within the block, the search index, dashboard counter and seller stats updates
+    for deleted cars are collected and applied once on exit (seller stats once per
+    seller), so deleting many cars with one
+    queryset.delete() costs a fixed number of queries (see RealCarService.reject_cars).
+    """
+    _bulk.deleted = []
+    try:
+        yield
+        deleted = _bulk.deleted
+    finally:
+        del _bulk.deleted
+    if deleted:
+        get_search_backend().remove_many(values['id'] for values in deleted)
+        totals = Counter()
+        for values in deleted:
+            totals.update(dashboard.car_counts(values))
+        dashboard.apply_change(totals, {})
+        sellers = {}
+        for values in deleted:
+            sellers.setdefault(values['owner_id'], Counter()).update(seller_stats.car_counts(values))
+        for seller_id, counts in sellers.items():
+            seller_stats.apply_change(seller_id, counts, {})
+
+def in_bulk_delete():
+    return getattr(_bulk, 'deleted', None) is not None
+
+@receiver(post_delete, sender=Car)
+def queue_bulk_deleted_car(sender, instance, **kwargs):
+    if in_bulk_delete():
+        _bulk.deleted.append(seller_stats.current_values(instance))
+
+# Cover image
+
+@receiver(post_save, sender=CarImage)
+def set_cover_image(sender, instance, created, **kwargs):
+    """The first image uploaded for a car becomes its cover"""
+    if created:
+        Car.objects.filter(id=instance.car_id, cover_image__isnull=True).update(cover_image=instance)
+
+@receiver(post_delete, sender=CarImage)
+def replace_cover_image(sender, instance, **kwargs):
+    """When the cover is deleted (the FK is already nulled), promote the next oldest image"""
+    if in_bulk_delete():
+        # Its car is being deleted too
+        return
+    next_image = CarImage.objects.filter(car_id=instance.car_id).order_by('id').first()
+    if next_image:
+        Car.objects.filter(id=instance.car_id, cover_image__isnull=True).update(cover_image=next_image)
+
+# Full-text index
+
+SEARCH_FIELDS = {'make', 'model', 'description'}
+
+@receiver(post_save, sender=Car)
+def index_car(sender, instance, update_fields=None, **kwargs):
+    # Saves that only touch e.g. price or status don't change the indexed text
+    if update_fields is not None and not SEARCH_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().index(instance)
+
+@receiver(post_delete, sender=Car)
+def unindex_car(sender, instance, **kwargs):
+    if not in_bulk_delete():
+        get_search_backend().remove(instance.pk)
+
+# Facet cache
+
+@receiver(post_save, sender=Car)
+def car_saved_invalidate_facets(sender, instance, created, **kwargs):
+    # Only approved cars are counted, so a change matters if the car is (or just stopped being) approved
+    if created:
+        if instance.approval_status == 'approved':
+            invalidate_facets()
+        return
+    changed = instance.changed_fields()
+    if 'approval_status' in changed or (instance.approval_status == 'approved' and FACET_FIELDS & changed):
+        invalidate_facets()
+
+@receiver(post_delete, sender=Car)
+def car_deleted_invalidate_facets(sender, instance, **kwargs):
+    if instance.approval_status == 'approved':
+        invalidate_facets()
+
+# Search result cache
+
+@receiver(post_save, sender=Car)
+def car_saved_invalidate_search_results(sender, instance, created, **kwargs):
+    approved = instance.approval_status == 'approved'
+    if created:
+        if approved:
+            search_results.car_added(instance.pk)
+        return
+    changed = instance.changed_fields()
+    if 'approval_status' in changed:
+        if approved:
+            search_results.car_added(instance.pk)
+        else:
+            search_results.car_removed(instance.pk)
+    elif approved and changed:
+        search_results.car_changed(instance.pk, changed)
+
+@receiver(post_delete, sender=Car)
+def car_deleted_invalidate_search_results(sender, instance, **kwargs):
+    if instance.approval_status == 'approved':
+        search_results.car_removed(instance.pk)
+
+# Unread notification counter
+
+@receiver(post_save, sender=Notification)
+def notification_created(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        add_unread(instance.user_id)
+        publish_notification(instance)
+
+@receiver(post_delete, sender=Notification)
+def notification_deleted(sender, instance, **kwargs):
+    if not instance.is_read:
+        remove_unread(instance.user_id, 1)
+
+# Seller statistics
+
+@receiver(post_save, sender=Car)
+def car_saved_update_seller_stats(sender, instance, created, **kwargs):
+    before = seller_stats.car_counts(None if created else instance.previous_values())
+    seller_stats.apply_change(instance.owner_id, before, seller_stats.car_counts(seller_stats.current_values(instance)))
+
+@receiver(post_delete, sender=Car)
+def car_deleted_update_seller_stats(sender, instance, **kwargs):
+    if not in_bulk_delete():
+        seller_stats.apply_change(instance.owner_id, seller_stats.car_counts(seller_stats.current_values(instance)), {})
+
+@receiver(post_save, sender=Order)
+def order_saved_update_seller_stats(sender, instance, created, **kwargs):
+    previous = None if created else instance.previous_values()
+    # Only a completed order counts, so most saves return before loading the car
+    if instance.status != 'completed' and (previous is None or previous['status'] != 'completed'):
+        return
+    car = instance.car
+    before = seller_stats.order_counts(previous, car)
+    seller_stats.apply_change(car.owner_id, before, seller_stats.order_counts(seller_stats.current_values(instance), car))
+
+@receiver(post_delete, sender=Order)
+def order_deleted_update_seller_stats(sender, instance, **kwargs):
+    if instance.status == 'completed':
+        car = Car.objects.filter(pk=instance.car_id).first()
+        if car is not None:
+            seller_stats.apply_change(car.owner_id, seller_stats.order_counts(seller_stats.current_values(instance), car), {})
+
+
+# Admin dashboard counters
+
+@receiver(post_save, sender=Car)
+def car_saved_update_dashboard(sender, instance, created, **kwargs):
+    before = dashboard.car_counts(None if created else instance.previous_values())
+    dashboard.apply_change(before, dashboard.car_counts(seller_stats.current_values(instance)))
+
+@receiver(post_delete, sender=Car)
+def car_deleted_update_dashboard(sender, instance, **kwargs):
+    if not in_bulk_delete():
+        dashboard.apply_change(dashboard.car_counts(seller_stats.current_values(instance)), {})
+
+@receiver(pre_save, sender=User)
+def remember_superuser_flag(sender, instance, update_fields=None, **kwargs):
+    # Saves that can't change the flag (e.g. last_login on every login) skip the lookup
+    if instance.pk is None or (update_fields is not None and 'is_superuser' not in update_fields):
+        return
+    instance._stored_is_superuser = User.objects.filter(pk=instance.pk).values_list('is_superuser', flat=True).first()
+
+@receiver(post_save, sender=User)
+def user_saved_update_dashboard(sender, instance, created, **kwargs):
+    if created:
+        before = {}
+    elif hasattr(instance, '_stored_is_superuser'):
+        before = dashboard.user_counts(instance.__dict__.pop('_stored_is_superuser'))
+    else:
+        return
+    dashboard.apply_change(before, dashboard.user_counts(instance.is_superuser))
+
+@receiver(post_delete, sender=User)
+def user_deleted_update_dashboard(sender, instance, **kwargs):
+    dashboard.apply_change(dashboard.user_counts(instance.is_superuser), {})
@@ -1,11 +1,11 @@
 from django.template import Library
-from ..models import Notification
+from ..notifications import unread_count
 
 register = Library()
 
 @register.simple_tag(takes_context=True)
 def unread_notifications_count(context):
     request = context.get('request')
-    if request and request.user.is_authenticated:
-        return Notification.objects.filter(user=request.user, is_read=False).count()
+    if request:
+        return unread_count(request)
     return 0
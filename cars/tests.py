@@ -1,3 +1,1274 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import QueryDict
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .exchange_rates import DEFAULT_RATES, HTTPRateProvider, RateCache, RateSnapshot
+from .facets import compute_facets, get_facets
+from .ledger import Mismatch, reconcile
+from .coalescing import send_digests
+from .models import (
+    ArchivedNotification, BrokerListener, BrokerMessage, Car, CarImage, DashboardCounter, DigestItem, Notification, NotificationCounter, Order, OutboxMessage,
+    PaymentEvent, PaymentSubmission, SellerStats, UserProfile,
+)
+from .notification_kinds import NotificationMessage
+from .notifications import archive_read, event_stream, unread_count
+from .pagination import KeysetPaginator
+from . import dashboard, outbox, pricing, seller_stats
+from .pubsub import DatabaseBroker, LocalBroker
+from .patterns.adapter import CurrencyAdapter
+from .patterns.observer import CarPriceSubject, FollowersObserver, QueuedFollowersObserver
+from .patterns.proxy import CarAccessProxy
+from .patterns.strategy import (
+    SEARCH_FILTERS, CompositeSearchStrategy, FullTextSearchStrategy, normalize_search_params, range_filter,
+)
+from .patterns.unit_of_work import UnitOfWork
+from .search_cache import FILTER_FIELDS, SearchResultCache, search_results
+from .signals import bulk_car_delete
+from .views import _facet_links
+
+
+def create_car(owner, **fields):
+    values = {
+        'make': 'Toyota', 'model': 'Corolla', 'year': 2020, 'price': 2500000,
+        'mileage': 30000, 'car_type': 'sedan', 'approval_status': 'approved',
+    }
+    values.update(fields)
+    return Car.objects.create(owner=owner, **values)
+
+
+class CoverImageTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyer = User.objects.create_user('buyer', password='pass')
+
+    def add_listings(self, count):
+        for _ in range(count):
+            car = create_car(self.seller)
+            CarImage.objects.create(car=car, image='car_images/front.jpg')
+            CarImage.objects.create(car=car, image='car_images/back.jpg')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_first_image_becomes_cover(self):
+        car = create_car(self.seller)
+        first = CarImage.objects.create(car=car, image='car_images/front.jpg')
+        CarImage.objects.create(car=car, image='car_images/back.jpg')
+        car.refresh_from_db()
+        self.assertEqual(car.cover_image, first)
+
+    def test_deleting_cover_promotes_next_image(self):
+        car = create_car(self.seller)
+        first = CarImage.objects.create(car=car, image='car_images/front.jpg')
+        second = CarImage.objects.create(car=car, image='car_images/back.jpg')
+        first.delete()
+        car.refresh_from_db()
+        self.assertEqual(car.cover_image, second)
+
+    def test_home_query_count_does_not_grow_with_cards(self):
+        self.client.force_login(self.buyer)
+        self.add_listings(2)
+        few = self.count_queries(reverse('home'))
+        self.add_listings(10)
+        many = self.count_queries(reverse('home'))
+        self.assertEqual(few, many)
+
+    def test_seller_profile_query_count_does_not_grow_with_cards(self):
+        self.client.force_login(self.buyer)
+        url = reverse('seller_profile', args=[self.seller.id])
+        self.add_listings(2)
+        few = self.count_queries(url)
+        self.add_listings(10)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+
+class FullTextSearchTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.strategy = FullTextSearchStrategy()
+
+    def test_index_follows_saves_and_deletes(self):
+        car = create_car(self.seller, make='Honda', model='Civic')
+        self.assertEqual(list(self.strategy.search('civic')), [car])
+
+        car.model = 'Accord'
+        car.save()
+        self.assertEqual(list(self.strategy.search('civic')), [])
+        self.assertEqual(list(self.strategy.search('accord')), [car])
+
+        car.delete()
+        self.assertEqual(list(self.strategy.search('accord')), [])
+
+    def test_prefix_and_typo_matching(self):
+        corolla = create_car(self.seller, make='Toyota', model='Corolla')
+        create_car(self.seller, make='Honda', model='Civic')
+        self.assertEqual(list(self.strategy.search('coro')), [corolla])
+        self.assertEqual(list(self.strategy.search('toyta')), [corolla])
+
+    def test_make_matches_rank_above_description_matches(self):
+        in_description = create_car(self.seller, make='Nissan', model='Sunny', description='Cheaper than a Toyota')
+        by_make = create_car(self.seller, make='Toyota', model='Premio')
+        self.assertEqual(list(self.strategy.search('toyota')), [by_make, in_description])
+
+
+class CompositeSearchTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.corolla = create_car(self.seller, make='Toyota', model='Corolla', year=2018, price=2000000, mileage=40000)
+        self.premio = create_car(self.seller, make='Toyota', model='Premio', car_type='suv', year=2021, price=3500000, mileage=10000)
+        self.civic = create_car(self.seller, make='Honda', model='Civic', year=2020, price=2500000, mileage=20000)
+        create_car(self.seller, make='Toyota', approval_status='pending')
+
+    def search(self, params, currency='BDT'):
+        return list(CompositeSearchStrategy(currency).search(normalize_search_params(params)))
+
+    def test_params_are_normalized(self):
+        self.assertEqual(
+            normalize_search_params({'make': ' Toyota ', 'min_price': '1000', 'max_year': '2020', 'sort': 'price'}),
+            {'make': 'toyota', 'min_price': 1000.0, 'max_year': 2020},
+        )
+        self.assertEqual(normalize_search_params({'search_type': 'year', 'query': '2019'}), {'min_year': 2019, 'max_year': 2019})
+
+    def test_garbage_and_non_finite_values_are_dropped(self):
+        params = {
+            'min_price': 'inf', 'max_price': '1e400', 'min_year': 'nan', 'max_year': '20x',
+            'min_mileage': '', 'make': '   ', 'car_type': 'sedan',
+        }
+        self.assertEqual(normalize_search_params(params), {'car_type': 'sedan'})
+        self.assertEqual(normalize_search_params({'max_price': '-nan'}), {})
+        self.client.force_login(self.seller)
+        self.assertEqual(self.client.get(reverse('home_cars_api'), {'min_price': 'inf'}).status_code, 200)
+
+    def test_filters_are_combined(self):
+        self.assertEqual(self.search({'make': 'toyota'}), [self.premio, self.corolla])
+        self.assertEqual(self.search({'make': 'toyota', 'car_type': 'SUV'}), [self.premio])
+        self.assertEqual(self.search({'make': 'toyota', 'max_mileage': '30000'}), [self.premio])
+        self.assertEqual(self.search({'q': 'civic', 'min_year': '2019', 'max_price': '3000000'}), [self.civic])
+        self.assertEqual(self.search({'make': 'honda', 'min_year': '2021'}), [])
+
+    def test_range_bounds_are_inclusive_and_optional(self):
+        self.assertEqual(self.search({'min_price': '2000000', 'max_price': '2500000'}), [self.civic, self.corolla])
+        self.assertEqual(self.search({'min_year': '2021'}), [self.premio])
+        self.assertEqual(self.search({'max_year': '2018'}), [self.corolla])
+        self.assertEqual(range_filter('year', [None, None]), Q())
+        self.assertEqual(range_filter('year', [2010, None]), Q(year__gte=2010))
+
+    def test_price_filters_are_in_the_selected_currency(self):
+        usd = DEFAULT_RATES['USD']
+        self.assertEqual(self.search({'max_price': str(2100000 / usd)}, 'USD'), [self.corolla])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create_user('seller', password='pass')
+        create_car(self.seller, make='Toyota', car_type='sedan', year=2021, price=1500000)
+        create_car(self.seller, make='Toyota', car_type='suv', year=2012, price=6000000)
+        create_car(self.seller, make='Honda', car_type='sedan', year=2016, price=800000)
+
+    def get_facets(self, filters):
+        cars = CompositeSearchStrategy('BDT').search(filters)
+        return get_facets(cars, filters, 'BDT')
+
+    def counts(self, facets, name):
+        return {option['label']: option['count'] for option in facets[name]}
+
+    def test_all_facets_in_one_query(self):
+        with self.assertNumQueries(1):
+            facets = compute_facets(Car.objects.filter(approval_status='approved'))
+        self.assertEqual(self.counts(facets, 'make'), {'Toyota': 2, 'Honda': 1})
+        self.assertEqual(self.counts(facets, 'car_type'), {'Sedan': 2, 'SUV': 1})
+        self.assertEqual(self.counts(facets, 'year'), {'2020 & newer': 1, '2015 - 2019': 1, '2010 - 2014': 1})
+        self.assertEqual(self.counts(facets, 'price'), {'Under 10 Lakh': 1, '10 - 25 Lakh': 1, '50 Lakh - 1 Crore': 1})
+
+    def test_band_edges_fall_into_exactly_one_band(self):
+        create_car(self.seller, make='Suzuki', year=2019, price=Decimal('999999.50'))
+        create_car(self.seller, make='Suzuki', year=2020, price=1000000)
+        facets = _facet_links(self.get_facets({'make': 'suzuki'}), {'make': 'suzuki'})
+        self.assertEqual(self.counts(facets, 'price'), {'Under 10 Lakh': 1, '10 - 25 Lakh': 1})
+        self.assertEqual(self.counts(facets, 'year'), {'2020 & newer': 1, '2015 - 2019': 1})
+
+        # Following a facet link finds exactly the cars it counted
+        for option in facets['price'] + facets['year']:
+            filters = normalize_search_params(QueryDict(option['query']))
+            self.assertEqual(CompositeSearchStrategy('USD').search(filters).count(), option['count'])
+
+    def test_counts_narrow_with_filters(self):
+        facets = self.get_facets({'car_type': 'sedan'})
+        self.assertEqual(self.counts(facets, 'make'), {'Toyota': 1, 'Honda': 1})
+
+    def test_cached_until_a_listing_is_approved(self):
+        self.get_facets({})
+        with self.assertNumQueries(0):
+            self.get_facets({})
+
+        pending = create_car(self.seller, make='Nissan', approval_status='pending')
+        with self.assertNumQueries(0):
+            self.get_facets({})
+
+        pending.approval_status = 'approved'
+        pending.save()
+        self.assertEqual(self.counts(self.get_facets({}), 'make'), {'Toyota': 2, 'Honda': 1, 'Nissan': 1})
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class RateServer(HTTPServer):
+    """Local stand-in for a rates API"""
+
+    def __init__(self):
+        self.rates = {'USD': 110.0}
+        self.fail = False
+        self.release = threading.Event()
+        self.release.set()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.release.wait(5)
+                if server.fail:
+                    self.send_error(503)
+                    return
+                body = json.dumps({'rates': server.rates}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        super().__init__(('127.0.0.1', 0), Handler)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}/rates'
+
+
+class ExchangeRateTests(SimpleTestCase):
+    def setUp(self):
+        self.server = RateServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.clock = FakeClock()
+        self.rates = RateCache(HTTPRateProvider(self.server.url), ttl=60, retry_after=10, clock=self.clock)
+
+    def test_first_read_does_not_wait_for_the_provider(self):
+        self.server.release.clear()
+        snapshot = self.rates.get()
+        self.assertEqual(snapshot.rate('USD'), DEFAULT_RATES['USD'])
+
+        self.server.release.set()
+        self.rates.wait(5)
+        self.assertEqual(self.rates.get().rate('USD'), 110.0)
+
+    def test_stale_rates_are_served_while_refreshing(self):
+        self.rates.refresh()
+        first = self.rates.get()
+
+        self.server.rates = {'USD': 115.0}
+        self.server.release.clear()
+        self.clock.now = 61
+        self.assertIs(self.rates.get(), first)
+
+        self.server.release.set()
+        self.rates.wait(5)
+        second = self.rates.get()
+        self.assertEqual(second.rate('USD'), 115.0)
+        self.assertNotEqual(second.version, first.version)
+
+    def test_failed_refresh_keeps_last_good_rates(self):
+        self.rates.refresh()
+        self.server.fail = True
+        self.clock.now = 61
+        with self.assertLogs('cars.exchange_rates', 'ERROR'):
+            self.rates.get()
+            self.rates.wait(5)
+        self.assertEqual(self.rates.get().rate('USD'), 110.0)
+
+    def test_adapter_converts_with_one_snapshot(self):
+        self.rates.refresh()
+        adapter = CurrencyAdapter(self.rates.get())
+        self.assertEqual(adapter.convert_from_bdt(220, 'USD'), 2.0)
+        self.assertEqual(adapter.convert_many_from_bdt([110, 330], 'USD'), [1.0, 3.0])
+
+
+class CurrencyAdapterTests(TestCase):
+    def setUp(self):
+        # Rates that don't divide prices evenly
+        self.adapter = CurrencyAdapter(RateSnapshot({'BDT': 1.0, 'USD': 119.37, 'EUR': 3.0}, fetched_at=0))
+        seller = User.objects.create_user('seller', password='pass')
+        for price in (Decimal('999999.50'), 2500000, Decimal('1234567.89'), Decimal('0.01')):
+            create_car(seller, price=price)
+
+    def test_batch_conversion_rounds_like_single_conversions(self):
+        amounts = [Decimal('100'), Decimal('200'), Decimal('999999.50')]
+        converted = self.adapter.convert_many_from_bdt(amounts, 'EUR')
+        self.assertEqual(converted, [self.adapter.convert_from_bdt(amount, 'EUR') for amount in amounts])
+        self.assertEqual([round(price, 2) for price in converted], [33.33, 66.67, 333333.17])
+        self.assertEqual(self.adapter.convert_many_from_bdt([], 'USD'), [])
+
+    def test_database_and_batch_conversion_agree(self):
+        for currency in ('BDT', 'USD', 'EUR'):
+            cars = list(self.adapter.annotate_from_bdt(Car.objects.order_by('id'), currency))
+            batch = self.adapter.convert_many_from_bdt([car.price for car in cars], currency)
+            for car, price in zip(cars, batch):
+                self.assertAlmostEqual(car.display_price, price, places=6)
+                self.assertEqual(round(car.display_price, 2), round(price, 2))
+
+    def test_listing_shows_batch_converted_prices(self):
+        buyer = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(buyer)
+        with mock.patch('cars.views.CurrencyAdapter', return_value=self.adapter):
+            response = self.client.get(reverse('home_cars_api'), {'currency': 'USD'})
+        listed = {car['id']: car['display_price'] for car in response.json()['cars']}
+        expected = {car.id: round(float(car.price) / 119.37, 2) for car in Car.objects.all()}
+        self.assertEqual(listed, expected)
+
+
+class SearchResultCacheTests(TestCase):
+    def setUp(self):
+        search_results.clear()
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyer = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(self.buyer)
+        self.toyota = create_car(self.seller, make='Toyota', price=1500000)
+        self.honda = create_car(self.seller, make='Honda', price=3000000)
+
+    def listed(self, **params):
+        response = self.client.get(reverse('home_cars_api'), {'currency': 'BDT', **params})
+        return [car['id'] for car in response.json()['cars']]
+
+    def test_repeated_search_is_a_hit(self):
+        self.listed(make='toyota')
+        hits = search_results.hits
+        self.assertEqual(self.listed(make='toyota'), [self.toyota.id])
+        self.assertEqual(search_results.hits, hits + 1)
+
+    def test_price_change_only_drops_price_searches(self):
+        self.assertEqual(self.listed(max_price=2000000), [self.toyota.id])
+        self.listed(make='honda')
+
+        self.honda.price = 1800000
+        self.honda.save()
+        misses = search_results.misses
+        self.assertEqual(self.listed(make='honda'), [self.honda.id])
+        self.assertEqual(search_results.misses, misses)
+        self.assertEqual(self.listed(max_price=2000000), [self.honda.id, self.toyota.id])
+        self.assertEqual(search_results.misses, misses + 1)
+
+    def test_price_change_drops_price_band_searches(self):
+        self.assertEqual(self.listed(price_band=1), [self.toyota.id])
+        self.toyota.price = 3000000
+        self.toyota.save()
+        self.assertEqual(self.listed(price_band=1), [])
+
+    def test_every_search_filter_names_its_fields(self):
+        self.assertEqual(set(FILTER_FIELDS), set(SEARCH_FILTERS))
+
+    def test_approval_and_delete_change_results(self):
+        self.assertEqual(self.listed(), [self.honda.id, self.toyota.id])
+        pending = create_car(self.seller, approval_status='pending')
+        self.assertEqual(self.listed(), [self.honda.id, self.toyota.id])
+
+        pending.approval_status = 'approved'
+        pending.save()
+        self.assertEqual(self.listed(), [pending.id, self.honda.id, self.toyota.id])
+
+        self.honda.delete()
+        self.assertEqual(self.listed(), [pending.id, self.toyota.id])
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SearchResultCache(max_entries=2)
+        load = lambda limit: []
+        cache.get({'make': 'a'}, 'BDT', None, load)
+        cache.get({'make': 'b'}, 'BDT', None, load)
+        cache.get({'make': 'a'}, 'BDT', None, load)
+        cache.get({'make': 'c'}, 'BDT', None, load)
+        self.assertEqual(cache.evictions, 1)
+        cache.get({'make': 'a'}, 'BDT', None, load)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(self.user)
+
+    def api_count(self):
+        return self.client.get(reverse('notification_count_api')).json()['count']
+
+    def test_counter_follows_creates_and_mark_all_read(self):
+        for _ in range(3):
+            Notification.objects.create(user=self.user, message='Price dropped')
+        self.assertEqual(self.api_count(), 3)
+
+        self.client.post(reverse('mark_all_read'))
+        self.assertEqual(Notification.objects.filter(user=self.user, is_read=False).count(), 0)
+        self.assertEqual(self.api_count(), 0)
+
+        Notification.objects.create(user=self.user, message='Order accepted')
+        self.assertEqual(self.api_count(), 1)
+
+    def test_count_is_read_once_per_request(self):
+        Notification.objects.create(user=self.user, message='Price dropped')
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(1):
+            self.assertEqual(unread_count(request), 1)
+            self.assertEqual(unread_count(request), 1)
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        # The database broker's poller can't see the uncommitted test transaction
+        patcher = mock.patch('cars.pubsub._broker', LocalBroker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def notify(self, message):
+        # Messages are published on commit, which the test transaction never does
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, message=message)
+
+    async def test_stream_pushes_new_notifications(self):
+        stream = event_stream(self.user.pk)
+        self.assertTrue((await anext(stream)).startswith('retry:'))
+        self.assertIn('"count": 0', await anext(stream))
+
+        await sync_to_async(self.notify)('Price dropped')
+        event = await anext(stream)
+        self.assertTrue(event.startswith('event: unread'))
+        self.assertIn('"count": 1', event)
+        self.assertIn('Price dropped', event)
+        await stream.aclose()
+
+    async def test_publish_from_another_thread(self):
+        broker = LocalBroker()
+        subscription = broker.subscribe('channel')
+        thread = threading.Thread(target=broker.publish, args=('channel', {'type': 'read'}))
+        thread.start()
+        self.assertEqual(await subscription.get(5), {'type': 'read'})
+        subscription.close()
+        self.assertEqual(broker._subscribers, {})
+
+    async def test_idle_stream_only_sends_keep_alives(self):
+        stream = event_stream(self.user.pk)
+        await anext(stream)
+        await anext(stream)
+        with mock.patch('cars.notifications.STREAM_KEEPALIVE', 0.01), \
+                mock.patch('cars.notifications.aunread_count', side_effect=AssertionError('counter read')):
+            self.assertEqual(await anext(stream), ': keep-alive\n\n')
+        await stream.aclose()
+
+    def test_wsgi_clients_fall_back_to_polling(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('notification_stream'))
+        self.assertEqual(response.status_code, 204)
+
+
+class FollowerFanOutTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.car = create_car(self.seller)
+
+    def add_followers(self, count):
+        start = User.objects.count()
+        users = [User.objects.create_user(f'follower{start + i}') for i in range(count)]
+        self.car.followers.add(*users)
+        return users
+
+    def change_price(self, price):
+        subject = CarPriceSubject(self.car)
+        subject.attach(FollowersObserver(self.car, chunk_size=4))
+        # Including the on-commit callbacks that publish to the live streams
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            subject.change_price(price)
+        return len(queries)
+
+    def test_every_follower_is_notified_once(self):
+        followers = self.add_followers(10)
+        Notification.objects.create(user=followers[0], message='Earlier notification')
+        self.change_price(2400000)
+        self.assertEqual(Notification.objects.filter(kind='price_changed', params__new_price='2400000').count(), 10)
+        counters = dict(NotificationCounter.objects.values_list('user_id', 'unread'))
+        self.assertEqual(counters, {user.id: 2 if user == followers[0] else 1 for user in followers})
+
+    def test_repeated_price_changes_update_the_unread_notification(self):
+        followers = self.add_followers(3)
+        self.change_price(2400000)
+        Notification.objects.filter(user=followers[0]).update(is_read=True)
+        self.change_price(2300000)
+        self.change_price(2200000)
+
+        unread = Notification.objects.filter(is_read=False, kind='price_changed')
+        self.assertEqual(unread.count(), 3)
+        self.assertEqual(
+            unread.get(user=followers[1]).text,
+            'The price of Toyota Corolla (2020) has changed from ৳2500000 to ৳2200000.',
+        )
+        self.assertEqual(unread.get(user=followers[0]).params['old_price'], '2400000')
+        counters = dict(NotificationCounter.objects.filter(user__in=followers[1:]).values_list('user_id', 'unread'))
+        self.assertEqual(counters, {user.id: 1 for user in followers[1:]})
+
+    def test_digest_users_get_one_notification_per_digest(self):
+        digest_user, other = self.add_followers(2)
+        UserProfile.objects.create(user=digest_user, notification_digest=True)
+        self.change_price(2400000)
+        self.change_price(2300000)
+        self.assertFalse(Notification.objects.filter(user=digest_user).exists())
+        self.assertEqual(DigestItem.objects.get(user=digest_user).params['old_price'], '2500000')
+
+        self.assertEqual(send_digests(), 1)
+        digest = Notification.objects.get(user=digest_user)
+        self.assertEqual(digest.text.splitlines()[0], '1 updates on cars you follow:')
+        self.assertIn('from ৳2500000 to ৳2300000', digest.text)
+        self.assertFalse(DigestItem.objects.exists())
+        self.assertEqual(Notification.objects.filter(user=other).count(), 1)
+
+    def test_queries_grow_per_chunk_not_per_follower(self):
+        self.add_followers(4)
+        one_chunk = self.change_price(2400000)
+        self.add_followers(4)
+        two_chunks = self.change_price(2300000)
+        self.assertLessEqual(two_chunks - one_chunk, 4)
+
+    def test_only_followers_with_an_open_stream_get_broker_rows(self):
+        followers = self.add_followers(40)
+        BrokerListener.objects.create(channel=f'notifications:{followers[3].id}', expires_at=timezone.now() + timedelta(seconds=30))
+        with mock.patch('cars.pubsub._broker', DatabaseBroker()):
+            self.change_price(2400000)
+        self.assertEqual(list(BrokerMessage.objects.values_list('channel', flat=True)), [f'notifications:{followers[3].id}'])
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyer = User.objects.create_user('buyer', password='pass')
+        self.car = create_car(self.seller)
+
+    def test_price_change_queues_one_message_for_all_followers(self):
+        followers = [User.objects.create_user(f'follower{i}') for i in range(5)]
+        self.car.followers.add(*followers)
+        subject = CarPriceSubject(self.car)
+        subject.attach(QueuedFollowersObserver(self.car))
+        subject.change_price(2400000)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertEqual(Notification.objects.count(), 0)
+
+        outbox.run_batch()
+        self.assertEqual(Notification.objects.filter(user__in=followers).count(), 5)
+        self.assertEqual(OutboxMessage.objects.get().status, 'done')
+
+    def test_old_handled_messages_are_purged(self):
+        for i in range(3):
+            outbox.notify(self.buyer, NotificationMessage('order_rejected', {'car': f'Car {i}'}))
+        outbox.run_batch()
+        failed = outbox.enqueue('missing_topic', 'user:1', {})
+        OutboxMessage.objects.filter(pk=failed.pk).update(status='failed')
+        self.assertEqual(outbox.purge_done(), 0)
+
+        OutboxMessage.objects.update(processed_at=timezone.now() - timedelta(hours=25))
+        self.assertEqual(outbox.purge_done(batch_size=2), 3)
+        self.assertEqual(list(OutboxMessage.objects.values_list('status', flat=True)), ['failed'])
+
+    def test_failed_message_is_retried_before_later_ones_for_the_user(self):
+        calls = []
+
+        def flaky(payload):
+            calls.append(payload['n'])
+            if len(calls) == 1:
+                raise RuntimeError('provider down')
+        outbox.HANDLERS['test'] = flaky
+        self.addCleanup(outbox.HANDLERS.pop, 'test')
+
+        first = outbox.enqueue('test', 'user:1', {'n': 1})
+        outbox.enqueue('test', 'user:1', {'n': 2})
+        outbox.notify(self.buyer, NotificationMessage('order_accepted', {'car': '2020 Toyota Corolla'}))
+        with self.assertLogs('cars.outbox', 'ERROR'):
+            outbox.run_batch()
+        self.assertEqual(calls, [1])
+        self.assertEqual(Notification.objects.filter(user=self.buyer).count(), 1)
+
+        # Not due yet, so the user's second message waits too
+        outbox.run_batch()
+        self.assertEqual(calls, [1])
+
+        OutboxMessage.objects.filter(pk=first.pk).update(available_at=first.created_at)
+        outbox.run_batch()
+        self.assertEqual(calls, [1, 1, 2])
+        self.assertEqual(OutboxMessage.objects.get(pk=first.pk).attempts, 1)
+
+    def test_key_waiting_for_a_retry_does_not_fill_the_batch(self):
+        outbox.HANDLERS['test'] = lambda payload: None
+        self.addCleanup(outbox.HANDLERS.pop, 'test')
+        waiting = outbox.enqueue('test', 'user:1', {'n': 0})
+        OutboxMessage.objects.filter(pk=waiting.pk).update(available_at=timezone.now() + timedelta(minutes=5))
+        OutboxMessage.objects.bulk_create([OutboxMessage(topic='test', key='user:1', payload={'n': n}) for n in range(150)])
+        other = outbox.notify(self.buyer, NotificationMessage('order_accepted', {'car': '2020 Toyota Corolla'}))
+
+        self.assertEqual(outbox.run_batch(100), 1)
+        self.assertEqual(OutboxMessage.objects.get(pk=other.pk).status, 'done')
+        self.assertEqual(OutboxMessage.objects.filter(key='user:1', status='pending').count(), 151)
+
+    def test_message_is_not_finished_after_losing_its_lease(self):
+        message = outbox.notify(self.buyer, NotificationMessage('order_accepted', {'car': '2020 Toyota Corolla'}))
+        token, groups = outbox.claim(10)
+        self.assertEqual(groups, [[message.pk]])
+        # The lease expired and another worker took the message over
+        OutboxMessage.objects.filter(pk=message.pk).update(claimed_by='other-worker')
+        with self.assertLogs('cars.outbox', 'WARNING'):
+            self.assertFalse(outbox.process_message(message.pk, token))
+        self.assertEqual(Notification.objects.filter(user=self.buyer).count(), 0)
+        self.assertEqual(OutboxMessage.objects.get(pk=message.pk).status, 'processing')
+
+
+class DatabaseBrokerTests(TransactionTestCase):
+    async def test_messages_published_elsewhere_reach_local_streams(self):
+        broker = DatabaseBroker(interval=0.05)
+        subscription = broker.subscribe('notifications:1')
+        # The stream is told once its channel is advertised to publishers
+        self.assertEqual(await subscription.get(5), {'type': 'listening'})
+        # Stands in for the outbox worker, which is another process with its own broker
+        await sync_to_async(DatabaseBroker().publish)('notifications:1', {'type': 'read'})
+        self.assertEqual(await subscription.get(5), {'type': 'read'})
+        subscription.close()
+
+    def test_fan_out_only_writes_rows_for_listened_channels(self):
+        broker = DatabaseBroker()
+        broker.prune()
+        messages = [(f'notifications:{user_id}', {'type': 'read'}) for user_id in range(300)]
+        with self.assertNumQueries(1):
+            broker.publish_many(messages)
+        self.assertFalse(BrokerMessage.objects.exists())
+
+        BrokerListener.objects.create(channel='notifications:7', expires_at=timezone.now() + timedelta(seconds=30))
+        BrokerListener.objects.create(channel='notifications:8', expires_at=timezone.now() - timedelta(seconds=1))
+        with CaptureQueriesContext(connection) as queries:
+            broker.publish_many(messages)
+        statements = [query['sql'].split()[0] for query in queries if query['sql'] not in ('BEGIN IMMEDIATE', 'COMMIT')]
+        self.assertEqual(statements, ['SELECT', 'INSERT'])
+        self.assertEqual(list(BrokerMessage.objects.values_list('channel', flat=True)), ['notifications:7'])
+
+    def test_publishers_prune_old_messages_and_listeners(self):
+        old = timezone.now() - DatabaseBroker.RETENTION - timedelta(seconds=1)
+        BrokerMessage.objects.create(channel='notifications:1', payload={}, created_at=old)
+        BrokerListener.objects.create(channel='notifications:1', expires_at=old)
+        DatabaseBroker().publish('notifications:2', {'type': 'read'})
+        self.assertFalse(BrokerMessage.objects.exists())
+        self.assertFalse(BrokerListener.objects.exists())
+
+
+class NotificationKindTests(SimpleTestCase):
+    def test_message_is_rendered_from_kind_and_params(self):
+        notification = Notification(kind='order_rejected', params={'car': '2020 Toyota Corolla'})
+        self.assertEqual(notification.text, 'Your buy request for 2020 Toyota Corolla was rejected by the seller.')
+        self.assertEqual(Notification(message='Welcome!').text, 'Welcome!')
+
+    def test_backfill_recovers_params_from_stored_sentences(self):
+        migration = importlib.import_module('cars.migrations.0020_notification_kind')
+        params = {'car': "2019 Honda Civic", 'reason': 'Blurry photos.\nPlease retake them.'}
+        message = migration.TEMPLATES['listing_rejected'].format(**params)
+        matches = [(kind, pattern.match(message)) for kind, pattern in migration.PATTERNS]
+        self.assertEqual([(kind, match.groupdict()) for kind, match in matches if match], [('listing_rejected', params)])
+
+
+class NotificationInboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(self.user)
+
+    def add_notifications(self, count, days_old=0, is_read=False):
+        created_at = timezone.now() - timedelta(days=days_old)
+        for i in range(count):
+            notification = Notification.objects.create(user=self.user, message=f'Update {i}', is_read=is_read)
+            Notification.objects.filter(pk=notification.pk).update(created_at=created_at + timedelta(seconds=i))
+
+    def test_inbox_is_paginated_newest_first(self):
+        self.add_notifications(25)
+        response = self.client.get(reverse('notifications'))
+        first_page = response.context['notifications']
+        self.assertEqual(len(first_page), 20)
+        self.assertEqual(first_page[0].message, 'Update 24')
+
+        response = self.client.get(f"{reverse('notifications')}?{response.context['next_query']}")
+        self.assertEqual([n.message for n in response.context['notifications']], [f'Update {i}' for i in range(4, -1, -1)])
+        self.assertIsNone(response.context['next_query'])
+
+    def test_old_read_notifications_are_archived(self):
+        self.add_notifications(3, days_old=120, is_read=True)
+        self.add_notifications(2, days_old=120)
+        self.add_notifications(2, days_old=1, is_read=True)
+
+        moved = archive_read(timezone.now() - timedelta(days=90), batch_size=2)
+        self.assertEqual(moved, 3)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(ArchivedNotification.objects.filter(user=self.user).count(), 3)
+
+        response = self.client.get(reverse('notifications'))
+        self.assertTrue(response.context['has_archive'])
+        response = self.client.get(reverse('notifications'), {'archived': '1'})
+        self.assertEqual(len(response.context['notifications']), 3)
+
+
+def hammer(requests):
+    """POST (user, url[, data]) requests from parallel threads at once and return the responses in order"""
+    barrier = threading.Barrier(len(requests))
+    responses = [None] * len(requests)
+
+    def run(index, user, url, data=None):
+        client = Client()
+        client.force_login(user)
+        barrier.wait()
+        try:
+            responses[index] = client.post(url, data or {})
+        finally:
+            connection.close()
+    threads = [threading.Thread(target=run, args=(index, *request)) for index, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return responses
+
+
+class AcceptOrderConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.car = create_car(self.seller)
+        self.buyers = [User.objects.create_user(f'buyer{i}', password='pass') for i in range(6)]
+        self.orders = [Order.objects.create(buyer=buyer, car=self.car, status='paid') for buyer in self.buyers[:4]]
+
+    def test_accepting_needs_a_post(self):
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('accept_order', args=[self.orders[0].pk]))
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Order.objects.filter(status='completed').exists())
+
+    def test_unpaid_order_cannot_be_accepted(self):
+        pending = Order.objects.create(buyer=self.buyers[4], car=self.car, status='pending')
+        self.client.force_login(self.seller)
+        self.client.post(reverse('accept_order', args=[pending.pk]))
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'pending')
+        self.assertFalse(Order.objects.filter(status='completed').exists())
+
+        self.client.post(reverse('accept_order', args=[self.orders[0].pk]))
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, 'cancelled')
+
+    def test_parallel_accepts_and_buys_complete_one_order(self):
+        requests = [(self.seller, reverse('accept_order', args=[order.pk])) for order in self.orders]
+        requests += [(buyer, reverse('buy_car', args=[self.car.pk])) for buyer in self.buyers[4:]]
+        hammer(requests)
+
+        completed = Order.objects.filter(status='completed')
+        self.assertEqual(completed.count(), 1)
+        self.assertFalse(Order.objects.filter(status__in=['pending', 'paid'], created_at__lte=completed.get().created_at).exists())
+        self.car.refresh_from_db()
+        self.assertEqual(self.car.status, 'sold')
+        # The winner and every cancelled buyer are told once
+        winner = completed.get().buyer_id
+        queued = sorted(m.payload['user_id'] for m in OutboxMessage.objects.filter(topic='notification', payload__kind__in=['order_accepted', 'order_cancelled']))
+        cancelled = sorted(Order.objects.filter(status='cancelled').values_list('buyer_id', flat=True))
+        self.assertEqual(queued, sorted(cancelled + [winner]))
+
+
+class PaymentIdempotencyTests(TransactionTestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyer = User.objects.create_user('buyer', password='pass')
+        self.order = Order.objects.create(buyer=self.buyer, car=create_car(self.seller), total_price=2500000)
+        self.url = reverse('process_payment', args=[self.order.pk])
+        cache.clear()
+
+    def pay(self, key, method='bkash'):
+        self.client.force_login(self.buyer)
+        response = self.client.post(self.url, {'payment_method': method, 'idempotency_key': key}, follow=True)
+        return [str(message) for message in response.context['messages']]
+
+    def test_repeated_key_replays_the_first_outcome(self):
+        self.assertEqual(self.pay('k1'), ['Payment successful! ৳2500000.00 paid via bkash.'])
+        cache.clear()
+        self.assertEqual(self.pay('k1', 'nagad'), ['Payment successful! ৳2500000.00 paid via bkash.'])
+        self.assertEqual(self.pay('k2'), ['This order has already been paid.'])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_method, 'bkash')
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+    def test_key_of_another_order_is_rejected(self):
+        other = Order.objects.create(buyer=self.buyer, car=create_car(self.seller), total_price=1000000)
+        self.assertEqual(self.pay('k1'), ['Payment successful! ৳2500000.00 paid via bkash.'])
+        for replay_cache in ('warm', 'cleared'):
+            response = self.client.post(
+                reverse('process_payment', args=[other.pk]), {'payment_method': 'bkash'}, HTTP_IDEMPOTENCY_KEY='k1',
+            )
+            self.assertEqual(response.status_code, 422, replay_cache)
+            cache.clear()
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'pending')
+        self.assertEqual(PaymentSubmission.objects.count(), 1)
+
+    def test_only_the_buyer_can_pay(self):
+        self.client.force_login(self.seller)
+        self.client.post(self.url, {'payment_method': 'bkash', 'idempotency_key': 'k1'})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_concurrent_submissions_pay_once(self):
+        # Half are double submits of one form, half are separate forms
+        data = [{'payment_method': 'bkash', 'idempotency_key': 'same' if i % 2 else f'key{i}'} for i in range(100)]
+        responses = hammer([(self.buyer, self.url, d) for d in data])
+
+        success = reverse('payment_success', args=[self.order.pk])
+        self.assertEqual({response.url for response in responses}, {success})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+        self.assertEqual(PaymentSubmission.objects.filter(outcome='paid').count(), 1)
+        self.assertEqual(PaymentSubmission.objects.count(), 51)
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+
+
+class PaymentLedgerTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyers = [User.objects.create_user(f'buyer{i}', password='pass') for i in range(2)]
+        self.car = create_car(self.seller)
+        self.orders = [Order.objects.create(buyer=buyer, car=self.car, total_price='2550000.50') for buyer in self.buyers]
+        cache.clear()
+
+    def pay(self, order):
+        self.client.force_login(order.buyer)
+        self.client.post(reverse('process_payment', args=[order.pk]), {'payment_method': 'bkash', 'idempotency_key': 'k'})
+
+    def test_payments_and_refunds_reconcile(self):
+        for order in self.orders:
+            self.pay(order)
+        self.client.force_login(self.seller)
+        self.client.post(reverse('accept_order', args=[self.orders[0].pk]))
+
+        kinds = list(PaymentEvent.objects.order_by('id').values_list('order_id', 'kind', 'amount'))
+        first, second = (order.pk for order in self.orders)
+        self.assertEqual(kinds, [
+            (first, PaymentEvent.INITIATED, 255000050), (first, PaymentEvent.CAPTURED, 255000050),
+            (second, PaymentEvent.INITIATED, 255000050), (second, PaymentEvent.CAPTURED, 255000050),
+            (second, PaymentEvent.REFUNDED, 255000050),
+        ])
+        self.assertEqual(list(reconcile(chunk_size=1)), [])
+        with self.assertRaises(TypeError):
+            PaymentEvent.objects.filter(order_id=first).delete()
+
+    def test_rejecting_only_refunds_captured_payments(self):
+        paid, unpaid = self.orders
+        self.pay(paid)
+        Order.objects.filter(pk=unpaid.pk).update(status='completed')
+        self.client.force_login(self.seller)
+        for order in self.orders:
+            self.client.post(reverse('reject_order', args=[order.pk]))
+
+        refunds = PaymentEvent.objects.filter(kind=PaymentEvent.REFUNDED)
+        self.assertEqual(list(refunds.values_list('order_id', 'amount')), [(paid.pk, 255000050)])
+        self.assertEqual(list(reconcile()), [])
+
+    def test_mismatches_are_reported(self):
+        Order.objects.filter(pk=self.orders[0].pk).update(status='paid')
+        PaymentEvent.objects.create(order_id=self.orders[1].pk, kind=PaymentEvent.CAPTURED, amount=100)
+        PaymentEvent.objects.create(order_id=999, kind=PaymentEvent.CAPTURED, amount=100)
+        stats = {}
+        self.assertEqual(list(reconcile(stats=stats)), [
+            Mismatch(self.orders[0].pk, 'paid', 255000050, 0),
+            Mismatch(self.orders[1].pk, 'pending', 0, 100),
+            Mismatch(999, None, 0, 100),
+        ])
+        self.assertEqual(stats, {'orders': 2, 'mismatches': 3})
+        with self.assertRaisesMessage(CommandError, '3 of 2 orders do not match the ledger.'):
+            call_command('reconcile_payments', stdout=io.StringIO())
+
+
+class PricingTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyer = User.objects.create_user('buyer', password='pass')
+        self.car = create_car(self.seller, price='2500000.10')
+
+    def test_totals_are_exact_and_quotes_memoized(self):
+        price_quote = pricing.quote(self.car.price, {'warranty', 'tinting'})
+        self.assertEqual(price_quote.total, 256000010)
+        self.assertEqual(price_quote.total_price, Decimal('2560000.10'))
+        self.assertEqual([addon.code for addon in price_quote.addons], ['warranty', 'tinting'])
+        self.assertEqual(price_quote.addon_prices, {'warranty': 50000, 'dashcam': 15000, 'seatcovers': 20000, 'tinting': 10000})
+        self.assertIs(pricing.quote(Decimal('2500000.10'), ['tinting', 'warranty']), price_quote)
+
+    def test_buy_car_and_detail_use_the_catalogue(self):
+        catalogue = [{'code': 'dashcam', 'label': 'Dash Cam', 'price': '12500.50', 'order_field': 'has_dashcam'}]
+        self.client.force_login(self.buyer)
+        with self.settings(CAR_ADDONS=catalogue):
+            response = self.client.get(reverse('car_detail', args=[self.car.pk]), {'dashcam': '1', 'currency': 'BDT'})
+            self.assertEqual(response.context['final_price'], 2512500.60)
+            self.assertEqual(response.context['description'], '2020 Toyota Corolla + Dash Cam')
+            self.client.post(reverse('buy_car', args=[self.car.pk]), {'dashcam': 'true', 'warranty': 'true'})
+        order = Order.objects.get()
+        self.assertEqual((order.total_price, order.has_dashcam, order.has_warranty), (Decimal('2512500.60'), True, False))
+
+
+class ProfileQueryBudgetTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        UserProfile.objects.create(user=self.seller, whatsapp_number='+8801700000000')
+        self.client.force_login(self.seller)
+
+    def add_orders(self, count):
+        start = User.objects.count()
+        for i in range(count):
+            buyer = User.objects.create_user(f'buyer{start + i}')
+            UserProfile.objects.create(user=buyer, whatsapp_number='+8801700000001')
+            car = create_car(self.seller)
+            CarImage.objects.create(car=car, image='car_images/a.jpg')
+            Order.objects.create(buyer=buyer, car=car, status=['pending', 'paid', 'completed'][i % 3])
+            # The seller buys too
+            Order.objects.create(buyer=self.seller, car=create_car(buyer), status=['completed', 'cancelled'][i % 2])
+
+    def profile_queries(self, query=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'), query or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_orders(self):
+        self.add_orders(3)
+        # Session, user, own profile, unread badge, then one query per list; sold and
+        # bought are split out of the incoming and purchase lists
+        few, response = self.profile_queries()
+        self.assertEqual(few, 7)
+        self.assertEqual(len(response.context['sold_cars'].items), 1)
+        self.assertEqual(len(response.context['bought_cars'].items), 2)
+
+        self.add_orders(40)
+        # More than a page: sold and bought get one query each
+        many, response = self.profile_queries()
+        self.assertEqual(many, 9)
+        requests_section = response.context['buy_requests']
+        self.assertEqual(len(requests_section.items), 12)
+        self.assertEqual(requests_section.next_query, 'requests_page=2')
+
+        last, response = self.profile_queries({'requests_page': 4, 'cars_page': 2})
+        self.assertLessEqual(last, 9)
+        self.assertEqual(len(response.context['buy_requests'].items), 43 - 36)
+        self.assertEqual(response.context['buy_requests'].previous_query, 'requests_page=3&cars_page=2')
+        self.assertIsNone(response.context['buy_requests'].next_query)
+
+
+class SellerStatsTests(TestCase):
+    def setUp(self):
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.buyers = [User.objects.create_user(f'buyer{i}', password='pass') for i in range(2)]
+
+    def stats(self):
+        return SellerStats.objects.filter(seller=self.seller).values_list(
+            'listings', 'available', 'sold', 'sales', 'revenue',
+        ).first()
+
+    def test_signals_match_rebuild(self):
+        sold = create_car(self.seller, price='1000000.50')
+        create_car(self.seller)
+        pending = create_car(self.seller, approval_status='pending')
+        orders = [Order.objects.create(buyer=buyer, car=sold, total_price='1000000.50', status='paid') for buyer in self.buyers]
+        self.assertEqual(self.stats(), (2, 2, 0, 0, 0))
+
+        self.client.force_login(self.seller)
+        self.client.post(reverse('accept_order', args=[orders[0].pk]))
+        pending.approval_status = 'approved'
+        pending.save()
+        expected = (3, 2, 1, 1, 100000050)
+        self.assertEqual(self.stats(), expected)
+
+        # Session, user, seller, the stats row, unread badge, listings
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('seller_profile', args=[self.seller.pk]))
+        self.assertEqual((response.context['total_listings'], response.context['sold_count']), (3, 1))
+
+        seconds = SellerStats.objects.get(seller=self.seller).seconds_to_sell
+        SellerStats.objects.all().delete()
+        self.assertEqual(seller_stats.rebuild(), 1)
+        self.assertEqual(self.stats(), expected)
+        self.assertEqual(SellerStats.objects.get(seller=self.seller).seconds_to_sell, seconds)
+
+        sold.refresh_from_db()
+        sold.delete()
+        self.assertEqual(self.stats(), (2, 2, 0, 0, 0))
+
+
+    def test_bulk_delete_updates_each_seller_once(self):
+        other = self.buyers[0]
+        for status in ('available', 'available', 'sold'):
+            create_car(self.seller, status=status)
+        create_car(other)
+        create_car(other, approval_status='pending')
+        self.assertEqual(self.stats(), (3, 2, 1, 0, 0))
+
+        with CaptureQueriesContext(connection) as queries:
+            with bulk_car_delete():
+                Car.objects.all().delete()
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "cars_sellerstats"')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(self.stats(), (0, 0, 0, 0, 0))
+        self.assertEqual(SellerStats.objects.get(seller=other).listings, 0)
+
+class AdminDashboardTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pass')
+        self.client.force_login(self.admin)
+        cache.clear()
+
+    def add_activity(self, count):
+        start = User.objects.count()
+        for i in range(count):
+            seller = User.objects.create_user(f'seller{start + i}')
+            car = create_car(seller, status=['available', 'sold'][i % 2])
+            Order.objects.create(buyer=self.admin, car=car, status=['pending', 'paid'][i % 2])
+
+    def dashboard_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_counters_and_snapshot(self):
+        self.add_activity(3)
+        few, response = self.dashboard_queries()
+        self.assertEqual(
+            [response.context[name] for name in ('total_users', 'total_cars', 'available_cars', 'sold_cars', 'pending_orders', 'paid_orders')],
+            [3, 3, 2, 1, 2, 1],
+        )
+        self.assertEqual([row['car_count'] for row in response.context['recent_users']], [1, 1, 1])
+        cached, _ = self.dashboard_queries()
+        self.assertLess(cached, few)
+
+        self.add_activity(20)
+        Car.objects.filter(owner__username='seller1').get().delete()
+        User.objects.filter(username='seller2').update(is_superuser=True)
+        dashboard.invalidate_snapshot()
+        many, response = self.dashboard_queries()
+        self.assertEqual(many, few)
+        self.assertEqual((response.context['total_cars'], response.context['sold_cars']), (22, 11))
+
+        # The update above skipped the signals, so the user count only catches up on a rebuild
+        self.assertEqual(response.context['total_users'], 23)
+        self.assertEqual(dashboard.rebuild_counters()['total_users'], 22)
+        self.assertEqual(DashboardCounter.objects.get(name='total_cars').value, 22)
+
+
+    def test_approving_a_car_refreshes_the_recent_cars(self):
+        car = create_car(User.objects.create_user('seller'), approval_status='pending')
+        _, response = self.dashboard_queries()
+        self.assertEqual([recent.approval_status for recent in response.context['recent_cars']], ['pending'])
+        self.client.post(reverse('approve_car', args=[car.pk]))
+        _, response = self.dashboard_queries()
+        self.assertEqual([recent.approval_status for recent in response.context['recent_cars']], ['approved'])
+
+class ModerationQueueTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pass')
+        self.sellers = [User.objects.create_user(f'seller{i}', password='pass') for i in range(2)]
+        self.cars = [create_car(self.sellers[i % 2], approval_status='pending') for i in range(16)]
+        for car in self.cars:
+            CarImage.objects.create(car=car, image='car_images/a.jpg')
+        self.client.force_login(self.admin)
+
+    def moderate(self, cars, action, **data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('moderate_cars'), {'car_ids': [car.pk for car in cars], 'action': action, **data})
+        self.assertRedirects(response, reverse('moderation_queue'), fetch_redirect_response=False)
+        return len(queries)
+
+    def test_batch_queries_do_not_grow_with_selection(self):
+        response = self.client.get(reverse('moderation_queue'))
+        self.assertEqual(len(response.context['page'].items), 16)
+
+        # The first approval of each seller's cars also creates their stats row
+        self.moderate(self.cars[:2], 'approve')
+        few = self.moderate(self.cars[2:4], 'approve')
+        many = self.moderate(self.cars[4:10], 'approve')
+        self.assertEqual(few, many)
+        self.assertEqual(Car.objects.filter(approval_status='approved').count(), 10)
+        self.assertEqual(SellerStats.objects.get(seller=self.sellers[0]).listings, 5)
+        self.assertEqual(OutboxMessage.objects.filter(payload__kind='listing_approved').count(), 10)
+
+        few = self.moderate(self.cars[10:12], 'reject', reason='Blurry photos')
+        many = self.moderate(self.cars[12:] + self.cars[:1], 'reject', reason='Blurry photos')
+        self.assertEqual(few, many)
+        # The approved car in the second batch is no longer pending, so it is left alone
+        self.assertEqual(Car.objects.count(), 10)
+        self.assertEqual(CarImage.objects.count(), 10)
+        self.assertEqual(DashboardCounter.objects.get(name='total_cars').value, 10)
+        self.assertEqual(OutboxMessage.objects.filter(payload__kind='listing_rejected').count(), 6)
+
+    def test_requires_admin(self):
+        self.client.force_login(self.sellers[0])
+        self.moderate(self.cars, 'approve')
+        self.assertFalse(Car.objects.filter(approval_status='approved').exists())
+        self.assertEqual(self.client.get(reverse('moderation_queue')).status_code, 302)
+
+
+class UnitOfWorkTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pass')
+        self.seller = User.objects.create_user('seller', password='pass')
+        self.car = create_car(self.seller)
+
+    def car_selects(self, queries):
+        return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and 'FROM "cars_car"' in query['sql']]
+
+    def test_owner_delete_loads_the_car_once(self):
+        proxy = CarAccessProxy(self.seller)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(proxy.delete_car(self.car.pk), (True, "Car deleted successfully."))
+        self.assertEqual(len(self.car_selects(queries)), 1)
+        self.assertEqual(proxy.last_query_count, len(queries))
+        self.assertEqual(proxy.delete_car(self.car.pk), (False, "Car not found."))
+
+    def test_calls_share_the_unit_of_work(self):
+        unit_of_work = UnitOfWork()
+        unit_of_work.get_car(self.car.pk)
+        proxy = CarAccessProxy(self.admin, unit_of_work)
+        with CaptureQueriesContext(connection) as queries:
+            proxy.reject_car(self.car.pk, 'Blurry photos')
+        # Neither the car nor its owner is fetched again
+        self.assertEqual(self.car_selects(queries), [])
+        self.assertFalse(any('FROM "auth_user"' in query['sql'] for query in queries))
+        self.assertEqual([name for name, _ in unit_of_work.calls], ['CarAccessProxy.reject_car'])
+        self.assertFalse(Car.objects.filter(pk=self.car.pk).exists())
+
+
+class KeysetCursorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='pass')
+        self.client.force_login(self.user)
+        seller = User.objects.create_user('seller', password='pass')
+        self.cars = [create_car(seller) for _ in range(3)]
+        search_results.clear()
+
+    def make_listing(self, count=60):
+        """`count` cars in two groups with tied created_at, so pages end inside a tie"""
+        seller = User.objects.get(username='seller')
+        Car.objects.all().delete()
+        ids = [create_car(seller).id for _ in range(count)]
+        now = timezone.now()
+        Car.objects.filter(id__in=ids[:count // 2]).update(created_at=now - timedelta(days=1))
+        Car.objects.filter(id__in=ids[count // 2:]).update(created_at=now)
+        search_results.clear()
+        return list(Car.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def walk_api(self):
+        ids, url, pages = [], reverse('home_cars_api'), 0
+        while url:
+            data = self.client.get(url).json()
+            ids += [car['id'] for car in data['cars']]
+            url = data['next_url']
+            pages += 1
+            self.assertLess(pages, 10)
+        return ids, pages
+
+    def walk_home(self):
+        ids, query, pages = [], '', 0
+        while query is not None:
+            response = self.client.get(f"{reverse('home')}?{query}")
+            ids += [car.id for car in response.context['cars']]
+            query = response.context['next_query']
+            pages += 1
+            self.assertLess(pages, 10)
+        return ids, pages
+
+    def test_next_cursors_walk_every_car_once(self):
+        expected = self.make_listing()
+        for walk in (self.walk_api, self.walk_home):
+            self.assertEqual(walk(), (expected, 3), walk.__name__)
+
+    def test_walk_continues_past_the_cached_keys(self):
+        expected = self.make_listing()
+        # Page 1 comes from the cached keys, the rest from range scans
+        with mock.patch.object(search_results, 'max_keys', 30):
+            for walk in (self.walk_api, self.walk_home):
+                search_results.clear()
+                self.assertEqual(walk(), (expected, 3), walk.__name__)
+
+    def test_cursor_of_a_deleted_car_still_continues_after_it(self):
+        expected = self.make_listing()
+        first = self.client.get(reverse('home_cars_api')).json()
+        Car.objects.filter(id=first['cars'][-1]['id']).delete()
+        second = self.client.get(reverse('home_cars_api'), {'cursor': first['next_cursor']}).json()
+        self.assertEqual([car['id'] for car in second['cars']], expected[24:48])
+
+    def test_cursor_past_the_last_car_is_an_empty_last_page(self):
+        expected = self.make_listing()
+        oldest = Car.objects.get(id=expected[-1])
+        cursor = KeysetPaginator(Car.objects.all()).encode_cursor(oldest)
+        data = self.client.get(reverse('home_cars_api'), {'cursor': cursor}).json()
+        self.assertEqual((data['cars'], data['next_cursor'], data['next_url']), ([], None, None))
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        naive = base64.urlsafe_b64encode(b'2020-01-01T00:00:00|5').decode().rstrip('=')
+        for cursor in (naive, 'not-a-cursor'):
+            for url in (reverse('home'), reverse('home_cars_api')):
+                # home caches the result keys, so later requests search them with the cursor
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 200, (url, cursor))
+        self.assertEqual(len(response.json()['cars']), 3)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+class IndexUsageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('seller', password='pass')
+        self.car = create_car(self.user)
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_per_user_queries_use_the_composite_indexes(self):
+        self.assertUsesIndex(Car.objects.filter(owner=self.user).order_by('-created_at'), 'car_owner_recent_idx')
+        self.assertUsesIndex(Car.objects.filter(owner=self.user, status='sold'), 'car_owner_status_idx')
+        self.assertUsesIndex(Notification.objects.filter(user=self.user).order_by('-created_at', '-id'), 'notif_user_recent_idx')
+        self.assertUsesIndex(Order.objects.filter(buyer=self.user).order_by('-created_at', '-id'), 'order_buyer_recent_idx')
+        self.assertUsesIndex(Order.objects.filter(car=self.car, status='paid').order_by('created_at'), 'order_car_status_idx')
+
+    def test_foreign_keys_have_no_separate_index(self):
+        # The composites above start with the FK column, so its own index would be a duplicate
+        with connection.cursor() as cursor:
+            for model, column in ((Car, 'owner_id'), (Notification, 'user_id'), (Order, 'buyer_id'), (Order, 'car_id')):
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                single = [name for name, info in constraints.items() if info['index'] and info['columns'] == [column]]
+                self.assertEqual(single, [], column)
@@ -8,12 +8,14 @@ from .  import payment_views
 urlpatterns = [
     path('', views.welcome, name='welcome'),
     path('home/', views.home, name='home'),
+    path('api/cars/', views.home_cars_api, name='home_cars_api'),
     path('car/<int:car_id>/', views.car_detail, name='car_detail'),
     path('create/', views.create_car, name='create_car'),
     path('delete/<int:car_id>/', views.delete_car, name='delete_car'),
     path('update/<int:car_id>/', views. update_car, name='update_car'),
     path('notifications/', views.notifications, name='notifications'),
     path('api/notifications/count/', views.notification_count_api, name='notification_count_api'),
+    path('api/notifications/stream/', views.notification_stream, name='notification_stream'),
     path('signup/', views.signup, name='signup'),
     path('login/', views. custom_login, name='login'),
     path('logout/', views. custom_logout, name='logout'),
@@ -30,6 +32,8 @@ urlpatterns = [
     path('admin-dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('approve-car/<int:car_id>/', views.approve_car, name='approve_car'),
     path('reject-car/<int:car_id>/', views.reject_car, name='reject_car'),
+    path('admin-dashboard/pending/', views.moderation_queue, name='moderation_queue'),
+    path('admin-dashboard/pending/moderate/', views.moderate_cars, name='moderate_cars'),
     # Payment URLs
     path('payment/initiate/<int:order_id>/', payment_views.initiate_payment, name='initiate_payment'),
     path('payment/process/<int:order_id>/', payment_views.process_payment, name='process_payment'),
@@ -1,17 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, logout
-from .models import Car, Notification, Order, CarImage
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .models import Car, Notification, ArchivedNotification, Order, CarImage
 from .patterns.factory import SedanFactory, SUVFactory, TruckFactory, CoupeFactory
-from .patterns.strategy import CarSearchContext, PriceSearchStrategy, BrandSearchStrategy, MileageSearchStrategy, TypeSearchStrategy, YearSearchStrategy
-from .patterns.decorator import BasicCar, WarrantyDecorator, DashCamDecorator, SeatCoversDecorator, WindowTintingDecorator
+from .patterns.strategy import CarSearchContext, CompositeSearchStrategy, normalize_search_params
+from .patterns.decorator import decorate
 from .patterns.proxy import CarAccessProxy
-from .patterns.observer import CarPriceSubject, UserObserver
+from .patterns.unit_of_work import UnitOfWork
+from .patterns.observer import CarPriceSubject, QueuedFollowersObserver
 from .patterns.singleton import DatabaseConfigManager
 from .patterns.adapter import CurrencyAdapter
+from .pagination import KeysetPaginator
+from .facets import get_facets
+from .search_cache import search_results
+from . import notifications as notification_counts
+from . import dashboard, ledger, outbox, pricing, seller_stats
+from .notification_kinds import NotificationMessage, car_name
 from .forms import SignUpForm, EditProfileForm, validate_email_domain, validate_whatsapp_number
 import re
 
@@ -100,40 +114,32 @@ def buy_car(request, car_id):
         messages.warning(request, "You have already sent a buy request for this car.")
         return redirect('car_detail', car_id=car.id)
     
-    # Get optional features from POST data
-    has_warranty = request.POST.get('warranty') == 'true'
-    has_dashcam = request.POST.get('dashcam') == 'true'
-    has_seatcovers = request.POST.get('seatcovers') == 'true'
-    has_tinting = request.POST.get('tinting') == 'true'
-    
-    # Calculate total price based on car price and selected features
-    from decimal import Decimal
-    total_price = Decimal(str(car.price))
-    if has_warranty:
-        total_price += Decimal('50000')
-    if has_dashcam:
-        total_price += Decimal('15000')
-    if has_seatcovers:
-        total_price += Decimal('20000')
-    if has_tinting:
-        total_price += Decimal('10000')
-        
-    # Create Order with optional features
-    order = Order.objects.create(
-        buyer=request.user, 
-        car=car,
-        has_warranty=has_warranty,
-        has_dashcam=has_dashcam,
-        has_seatcovers=has_seatcovers,
-        has_tinting=has_tinting,
-        total_price=total_price
-    )
+    # Price the car with the optional features selected in the POST data
+    price_quote = pricing.quote(car.price, pricing.selected_addons(request.POST))
     
-    # Notify Owner
-    Notification.objects.create(
-        user=car.owner, 
-        message=f"New Buy Request: {request.user.username} wants to buy your {car.year} {car.make} {car.model}."
-    )
+    # Create Order with optional features
+    with transaction.atomic():
+        # Re-check under the car's lock, so the car can't be sold in the meantime
+        car = Car.objects.select_for_update().get(pk=car.pk)
+        if car.status != 'available':
+            messages.error(request, "This car is no longer available.")
+            return redirect('car_detail', car_id=car.id)
+        if Order.objects.filter(buyer=request.user, car=car, status='pending').exists():
+            messages.warning(request, "You have already sent a buy request for this car.")
+            return redirect('car_detail', car_id=car.id)
+        
+        order = Order.objects.create(
+            buyer=request.user, 
+            car=car,
+            total_price=price_quote.total_price,
+            **{addon.order_field: True for addon in price_quote.addons if addon.order_field}
+        )
+        
+        # Notify Owner (delivered by the outbox worker)
+        outbox.notify(
+            car.owner_id, 
+            NotificationMessage('buy_request', {'buyer': request.user.username, 'car': car_name(car)})
+        )
     
     messages.success(request, "Buy request sent!  Proceed to payment.")
      
@@ -157,39 +163,50 @@ def update_car_status(request, car_id):
             
     return redirect('car_detail', car_id=car.id)
 
+# Orders still competing for a car
+OPEN_ORDER_STATUSES = ('pending', 'paid')
+
 @login_required
+@require_POST
 def accept_order(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+    order = get_object_or_404(Order.objects.select_related('car'), id=order_id)
     car = order.car
     
     if request.user != car.owner:
         messages.error(request, "You are not authorized to perform this action.")
         return redirect('profile')
         
-    # 1. Mark this order as completed
-    order.status = 'completed'
-    order.save()
-    
-    # 2. Mark car as sold
-    car.status = 'sold'
-    car.save()
-    
-    # 3. Cancel other pending orders for this car
-    other_orders = Order.objects.filter(car=car, status='pending').exclude(id=order.id)
-    for other_order in other_orders:
-        other_order.status = 'cancelled'
-        other_order.save()
-        # Notify rejected buyer
-        Notification.objects.create(
-            user=other_order.buyer,
-            message=f"Your buy request for {car.year} {car.make} {car.model} was cancelled because the car was sold to another buyer."
-        )
+    with transaction.atomic():
+        # Lock the car so a concurrent accept or buy request waits for this one
+        car = Car.objects.select_for_update().get(pk=car.pk)
+        order = Order.objects.select_for_update().get(pk=order.pk)
+        # Only a paid order has a captured payment to complete the sale with
+        if order.status == 'pending':
+            messages.error(request, "This order hasn't been paid yet.")
+            return redirect('profile')
+        if order.status != 'paid':
+            messages.error(request, "This order can no longer be accepted.")
+            return redirect('profile')
         
-    # 4. Notify accepted buyer
-    Notification.objects.create(
-        user=order.buyer,
-        message=f"Congratulations! Your buy request for {car.year} {car.make} {car.model} has been accepted!"
-    )
+        # 1. Mark this order as completed
+        order.status = 'completed'
+        order.completed_at = timezone.now()
+        order.save(update_fields=['status', 'completed_at'])
+        
+        # 2. Mark car as sold
+        car.status = 'sold'
+        car.save()
+        
+        # 3. Cancel the other open orders for this car with one UPDATE
+        other_orders = Order.objects.filter(car=car, status__in=OPEN_ORDER_STATUSES).exclude(id=order.id)
+        others = list(other_orders.only('id', 'buyer_id', 'status', 'total_price', 'payment_method'))
+        other_orders.update(status='cancelled')
+        ledger.record_refunds([other for other in others if other.status == 'paid'])
+        other_buyers = {other.buyer_id for other in others}
+        
+        # Notify cancelled buyers and the accepted buyer
+        outbox.notify_many(other_buyers - {order.buyer_id}, NotificationMessage('order_cancelled', {'car': car_name(car)}))
+        outbox.notify(order.buyer_id, NotificationMessage('order_accepted', {'car': car_name(car)}))
     
     messages.success(request, f"Order accepted! Car marked as sold and other requests cancelled.")
     return redirect('profile')
@@ -204,20 +221,95 @@ def reject_order(request, order_id):
         return redirect('profile')
     
     if request.method == 'POST':
-        # 1. Mark order as cancelled
-        order.status = 'cancelled'
-        order.save()
-        
-        # 2. Notify buyer
-        Notification.objects.create(
-            user=order.buyer,
-            message=f"Your buy request for {car.year} {car.make} {car.model} was rejected by the seller."
-        )
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(pk=order.pk)
+            if order.status in ('paid', 'completed'):
+                # Return whatever was captured; an order that was never paid gets nothing back
+                ledger.record_refunds([order])
+            
+            # 1. Mark order as cancelled
+            order.status = 'cancelled'
+            order.save()
+            
+            # 2. Notify buyer
+            outbox.notify(order.buyer_id, NotificationMessage('order_rejected', {'car': car_name(car)}))
         
         messages.success(request, f"Order rejected successfully.")
     
     return redirect('profile')
 
+HOME_PAGE_SIZE = 24
+
+def _search_cars(request):
+    """Approved cars matching the request filters, plus the currency and normalized filters used"""
+    # Currency Handling
+    currency = request.GET.get('currency', request.session.get('currency', 'BDT'))
+    request.session['currency'] = currency
+    
+    # Strategy Pattern: every filter in the request is combined into one query
+    # over approved cars (see CompositeSearchStrategy)
+    filters = normalize_search_params(request.GET)
+    context = CarSearchContext(CompositeSearchStrategy(currency))
+    cars = context.execute_search(filters)
+    return cars, currency, filters
+
+def _listing_page(request, cars, currency, filters):
+    """Shared by home and home_cars_api: one page of the search results"""
+    # Adapter Pattern: display prices for the page are converted in one batch with
+    # a single rate lookup, and the symbol is looked up once for the whole page
+    adapter = CurrencyAdapter()
+    currency_symbol = adapter.get_currency_symbol(currency)
+    rows = Car.objects.select_related('cover_image')
+    
+    # Keyset pagination on (created_at, id). The result keys of popular searches are
+    # cached (see search_cache.py), so only the rows on this page are loaded.
+    paginator = KeysetPaginator(cars.select_related('cover_image'), HOME_PAGE_SIZE)
+    cursor = request.GET.get('cursor')
+    results = search_results.get(filters, currency, adapter.rates_version, paginator.keys)
+    page = paginator.get_page_from_keys(results.keys, results.complete, rows, cursor)
+    if page is None:
+        # Deeper than the cached keys
+        page = paginator.get_page(cursor)
+    display_prices = adapter.convert_many_from_bdt([car.price for car in page], currency)
+    for car, display_price in zip(page, display_prices):
+        car.display_price = display_price
+        car.currency_symbol = currency_symbol
+    
+    # Query string for the next page keeps the current filters
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_query = params.urlencode()
+    
+    return page, next_query
+
+def _facet_links(facets, filters):
+    """Attach to every facet option the query string that applies it on top of the current filters"""
+    from urllib.parse import urlencode
+    for facet, options in facets.items():
+        for option in options:
+            applied = dict(filters)
+            if facet in ('car_type', 'make'):
+                applied[facet] = option['value']
+            elif facet == 'price':
+                # Bands are half-open and in BDT, so they are applied by index rather
+                # than as inclusive min/max prices in the selected currency
+                applied.pop('min_price', None)
+                applied.pop('max_price', None)
+                applied['price_band'] = option['value']
+            else:
+                # Years are whole numbers, so year < high is year <= high - 1
+                low, high = option['value']
+                applied.pop('min_year', None)
+                applied.pop('max_year', None)
+                if low is not None:
+                    applied['min_year'] = low
+                if high is not None:
+                    applied['max_year'] = high - 1
+            option['query'] = urlencode(applied)
+    return facets
+
 @login_required
 def home(request):
     # Require authentication for home page
@@ -231,88 +323,11 @@ def home(request):
     # Singleton usage (just for demo)
     db_config = DatabaseConfigManager().get_config()
     
-    # Only show approved cars
-    cars = Car.objects.filter(approval_status='approved')
-    
-    # Strategy Pattern
-    search_type = request.GET.get('search_type')
-    query = request.GET.get('query')
-    
-    from .patterns.strategy import ModelSearchStrategy
-    
-    if search_type:
-        context = None
-        if search_type == 'price':
-            min_price = request.GET.get('min_price')
-            max_price = request.GET.get('max_price')
-            if min_price and max_price:
-                try:
-                    # Get current currency
-                    currency = request.GET.get('currency', request.session.get('currency', 'BDT'))
-                    
-                    # Convert input prices (in selected currency) to BDT
-                    min_price_bdt = CurrencyAdapter.convert_to_bdt_static(float(min_price), currency)
-                    max_price_bdt = CurrencyAdapter.convert_to_bdt_static(float(max_price), currency)
-                    
-                    context = CarSearchContext(PriceSearchStrategy())
-                    cars = context.execute_search([min_price_bdt, max_price_bdt])
-                    # Filter to only approved cars
-                    cars = cars.filter(approval_status='approved')
-                except ValueError:
-                    pass
-        elif search_type == 'brand':
-            query = request.GET.get('query')
-            if query:
-                context = CarSearchContext(BrandSearchStrategy())
-                cars = context.execute_search(query)
-                # Filter to only approved cars
-                cars = cars.filter(approval_status='approved')
-        elif search_type == 'model':
-            query = request.GET.get('query')
-            if query:
-                context = CarSearchContext(ModelSearchStrategy())
-                cars = context.execute_search(query)
-                # Filter to only approved cars
-                cars = cars.filter(approval_status='approved')
-        elif search_type == 'mileage':
-            min_mileage = request.GET.get('min_mileage')
-            max_mileage = request.GET.get('max_mileage')
-            if min_mileage and max_mileage:
-                try:
-                    context = CarSearchContext(MileageSearchStrategy())
-                    cars = context.execute_search([int(min_mileage), int(max_mileage)])
-                    # Filter to only approved cars
-                    cars = cars.filter(approval_status='approved')
-                except ValueError:
-                    pass
-        elif search_type == 'type':
-            query = request.GET.get('query')
-            if query:
-                context = CarSearchContext(TypeSearchStrategy())
-                cars = context.execute_search(query)
-                # Filter to only approved cars
-                cars = cars.filter(approval_status='approved')
-        elif search_type == 'year':
-            query = request.GET.get('query')
-            if query:
-                try:
-                    # Single year selection
-                    context = CarSearchContext(YearSearchStrategy())
-                    cars = context.execute_search([int(query), int(query)])
-                    # Filter to only approved cars
-                    cars = cars.filter(approval_status='approved')
-                except ValueError:
-                    pass
+    cars, currency, filters = _search_cars(request)
+    page, next_query = _listing_page(request, cars, currency, filters)
     
-    # Currency Handling
-    currency = request.GET.get('currency', request.session.get('currency', 'BDT'))
-    request.session['currency'] = currency
-    
-    # Adapt prices for display
-    for car in cars:
-        adapter = CurrencyAdapter()
-        car.display_price = adapter.convert_from_bdt(car.price, currency)
-        car.currency_symbol = CurrencyAdapter.get_symbol(currency)
+    # Facet counts for the filter panel (cached per normalized filter set)
+    facets = _facet_links(get_facets(cars, filters, currency), filters)
     
     # Generate year list for dropdown (e.g., 1990 to current year)
     from datetime import datetime
@@ -320,9 +335,40 @@ def home(request):
     years = list(range(current_year, 1989, -1))
             
     return render(request, 'cars/home.html', {
-        'cars': cars, 
+        'cars': page.items, 
+        'next_query': next_query,
         'current_currency': currency,
-        'years': years
+        'years': years,
+        'filters': filters,
+        'facets': facets,
+    })
+
+@login_required
+def home_cars_api(request):
+    """JSON variant of the home grid, used for infinite scrolling"""
+    cars, currency, filters = _search_cars(request)
+    page, next_query = _listing_page(request, cars, currency, filters)
+    
+    cars_data = []
+    for car in page:
+        cars_data.append({
+            'id': car.id,
+            'year': car.year,
+            'make': car.make,
+            'model': car.model,
+            'mileage': car.mileage,
+            'car_type': car.get_car_type_display(),
+            'status': car.status,
+            'display_price': round(car.display_price, 2),
+            'currency_symbol': car.currency_symbol,
+            'image_url': car.cover_image.image.url if car.cover_image else None,
+            'detail_url': reverse('car_detail', args=[car.id]),
+        })
+    
+    return JsonResponse({
+        'cars': cars_data,
+        'next_cursor': page.next_cursor,
+        'next_url': f"{reverse('home_cars_api')}?{next_query}" if next_query else None,
     })
 
 def car_detail(request, car_id):
@@ -337,52 +383,33 @@ def car_detail(request, car_id):
         messages.error(request, "This car listing is not available.")
         return redirect('home')
     
-    # Decorator Pattern
-    car_component = BasicCar(car)
-    
-    if request.GET.get('warranty'):
-        car_component = WarrantyDecorator(car_component)
-    if request.GET.get('dashcam'):
-        car_component = DashCamDecorator(car_component)
-    if request.GET.get('seatcovers'):
-        car_component = SeatCoversDecorator(car_component)
-    if request.GET.get('tinting'):
-        car_component = WindowTintingDecorator(car_component)
-        
-    final_price_bdt = car_component.get_price()
-    description = car_component.get_description()
-    
     # Currency Handling
     currency = request.GET.get('currency', request.session.get('currency', 'BDT'))
     request.session['currency'] = currency
     
-    adapter = CurrencyAdapter()
-    display_price = adapter.convert_from_bdt(final_price_bdt, currency)
-    currency_symbol = CurrencyAdapter.get_symbol(currency)
+    # One memoized quote gives the total and every add-on price in the selected currency
+    price_quote = pricing.quote(car.price, pricing.selected_addons(request.GET), currency)
     
-    # Calculate add-on prices in selected currency
-    adapter = CurrencyAdapter()
-    warranty_price = adapter.convert_from_bdt(50000, currency)
-    dashcam_price = adapter.convert_from_bdt(15000, currency)
-    seatcovers_price = adapter.convert_from_bdt(20000, currency)
-    tinting_price = adapter.convert_from_bdt(10000, currency)
+    # Decorator Pattern
+    description = decorate(car, price_quote.addons).get_description()
     
     return render(request, 'cars/detail.html', {
         'car': car,
-        'final_price': display_price,
-        'currency_symbol': currency_symbol,
+        'final_price': price_quote.display_total,
+        'base_price': price_quote.display_base,
+        'currency_symbol': price_quote.symbol,
         'current_currency': currency,
         'description': description,
-        'warranty_price': warranty_price,
-        'dashcam_price': dashcam_price,
-        'seatcovers_price': seatcovers_price,
-        'tinting_price': tinting_price,
+        'addons': [
+            (addon, price_quote.addon_prices[addon.code], addon in price_quote.addons)
+            for addon in pricing.get_catalogue()
+        ],
     })
 
 @login_required
 def create_car(request):
     # Proxy Pattern check
-    proxy = CarAccessProxy(request.user)
+    proxy = CarAccessProxy(request.user, UnitOfWork.for_request(request))
     allowed, msg = proxy.post_car({})
     if not allowed:
         messages.error(request, msg)
@@ -498,10 +525,12 @@ def create_car(request):
 @login_required
 def delete_car(request, car_id):
     # Proxy Pattern
-    proxy = CarAccessProxy(request.user)
+    proxy = CarAccessProxy(request.user, UnitOfWork.for_request(request))
     success, msg = proxy.delete_car(car_id)
     
     if success:
+        if request.user.is_superuser:
+            dashboard.invalidate_snapshot()
         messages.success(request, msg)
     else:
         messages.error(request, msg)
@@ -610,13 +639,13 @@ def update_car(request, car_id):
             # Create subject with the car (car has old price from DB)
             subject = CarPriceSubject(car)
             
-            # Attach all followers as observers (proper Observer pattern)
-            for follower in car.followers.all():
-                observer = UserObserver(follower)
-                subject.attach(observer)
+            # One observer stands for all followers; the outbox worker notifies them in bulk
+            subject.attach(QueuedFollowersObserver(car))
             
-            # Change price and notify all attached observers
-            subject.change_price(new_price_bdt)
+            # Change price and notify all attached observers; the new price and
+            # the notifications are committed together
+            with transaction.atomic():
+                subject.change_price(new_price_bdt)
             
         messages.success(request, "Car details updated successfully!")
         return redirect('car_detail', car_id=car.id)
@@ -626,21 +655,91 @@ def update_car(request, car_id):
     year_range = range(current_year, 1939, -1)
     return render(request, 'cars/update.html', {'car': car, 'year_range': year_range})
 
+PROFILE_PAGE_SIZE = 12
+
+class ProfileSection:
+    """
+    One page of a profile section, paginated by its own ?<param>=N. Pages are
+    read with one extra row to know if there is a next one, so no COUNT query.
+    """
+    def __init__(self, request, param, page_size=PROFILE_PAGE_SIZE):
+        self.param = param
+        self.page_size = page_size
+        self.query = request.GET
+        try:
+            self.number = max(int(request.GET.get(param, 1)), 1)
+        except ValueError:
+            self.number = 1
+        self.items = []
+        self.has_next = False
+    
+    def load(self, rows):
+        """Take this page out of a queryset or a list holding the whole section"""
+        start = (self.number - 1) * self.page_size
+        rows = list(rows[start:start + self.page_size + 1])
+        self.items, self.has_next = rows[:self.page_size], len(rows) > self.page_size
+        return self
+    
+    @property
+    def is_complete(self):
+        """True if the whole section fits on this (first) page"""
+        return self.number == 1 and not self.has_next
+    
+    def page_query(self, number):
+        # Keep the other sections on their current page
+        query = self.query.copy()
+        query[self.param] = number
+        return query.urlencode()
+    
+    @property
+    def previous_query(self):
+        return self.page_query(self.number - 1) if self.number > 1 else None
+    
+    @property
+    def next_query(self):
+        return self.page_query(self.number + 1) if self.has_next else None
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __bool__(self):
+        return bool(self.items)
+
 @login_required
 def profile(request):
-    my_cars = Car.objects.filter(owner=request.user).order_by('-created_at')
+    user = request.user
+    
+    my_cars = ProfileSection(request, 'cars_page').load(
+        Car.objects.filter(owner=user).select_related('cover_image').order_by('-created_at', '-id')
+    )
     
     # Get incoming buy requests for user's cars (as seller)
-    buy_requests = Order.objects.filter(car__owner=request.user).order_by('-created_at')
+    buy_requests = ProfileSection(request, 'requests_page').load(
+        Order.objects.filter(car__owner=user).select_related('car__cover_image', 'buyer__profile').order_by('-created_at', '-id')
+    )
     
     # Get buy requests made by this user (as buyer)
-    my_purchase_requests = Order.objects.filter(buyer=request.user).order_by('-created_at')
+    my_purchase_requests = ProfileSection(request, 'purchases_page').load(
+        Order.objects.filter(buyer=user).select_related('car__cover_image', 'car__owner').order_by('-created_at', '-id')
+    )
     
-    # Get cars sold by this user
-    sold_cars = Order.objects.filter(car__owner=request.user, status='completed').order_by('-created_at')
+    # Cars sold and bought are the completed orders of the two sections above. Usually
+    # those fit on one page and are split out of it; power users' get their own query.
+    sold_cars = ProfileSection(request, 'sold_page')
+    if buy_requests.is_complete:
+        sold_cars.load([order for order in buy_requests if order.status == 'completed'])
+    else:
+        sold_cars.load(
+            Order.objects.filter(car__owner=user, status='completed').select_related('car__cover_image', 'buyer').order_by('-created_at', '-id')
+        )
     
-    # Get cars bought by this user
-    bought_cars = Order.objects.filter(buyer=request.user, status='completed').order_by('-created_at')
+    bought_cars = ProfileSection(request, 'bought_page')
+    if my_purchase_requests.is_complete:
+        bought_cars.load([order for order in my_purchase_requests if order.status == 'completed'])
+    else:
+        bought_cars.load(
+            Order.objects.filter(buyer=user, status='completed').select_related('car__cover_image', 'car__owner').order_by('-created_at', '-id')
+        )
     
     return render(request, 'cars/profile.html', {
         'my_cars': my_cars, 
@@ -659,21 +758,22 @@ def seller_profile(request, user_id):
     
     # Get seller's cars (only approved ones for non-owners)
     if request.user == seller or (request.user.is_authenticated and request.user.is_superuser):
-        seller_cars = Car.objects.filter(owner=seller).order_by('-created_at')
+        seller_cars = Car.objects.filter(owner=seller).select_related('cover_image').order_by('-created_at')
     else:
-        seller_cars = Car.objects.filter(owner=seller, approval_status='approved').order_by('-created_at')
+        seller_cars = Car.objects.filter(owner=seller, approval_status='approved').select_related('cover_image').order_by('-created_at')
     
-    # Get statistics
-    total_listings = seller_cars.count()
-    sold_count = seller_cars.filter(status='sold').count()
-    available_count = seller_cars.filter(status='available').count()
+    # Statistics of approved listings, kept up to date by signals (see seller_stats.py)
+    stats = seller_stats.get_stats(seller)
     
     return render(request, 'cars/seller_profile.html', {
         'seller': seller,
         'seller_cars': seller_cars,
-        'total_listings': total_listings,
-        'sold_count': sold_count,
-        'available_count': available_count,
+        'stats': stats,
+        'total_listings': stats.listings,
+        'sold_count': stats.sold,
+        'available_count': stats.available,
+        'show_revenue': request.user == seller or request.user.is_superuser,
+        'revenue': pricing.from_minor(stats.revenue),
     })
 
 
@@ -716,20 +816,47 @@ def delete_account(request):
         return redirect('home')
     return redirect('profile')
 
+NOTIFICATIONS_PAGE_SIZE = 20
+
+def _admin_contact():
+    """(email, whatsapp) of the site admin, cached since it rarely changes"""
+    contact = cache.get('admin_contact')
+    if contact is None:
+        admin_user = User.objects.filter(is_superuser=True).select_related('profile').first()
+        admin_email = admin_user.email if admin_user else None
+        admin_whatsapp = admin_user.profile.whatsapp_number if admin_user and hasattr(admin_user, 'profile') else None
+        contact = (admin_email, admin_whatsapp)
+        cache.set('admin_contact', contact, 60 * 10)
+    return contact
+
 def notifications(request):
     if not request.user.is_authenticated:
         return redirect('login')
-    notifs = Notification.objects.filter(user=request.user).order_by('-created_at')
-    unread_count = notifs.filter(is_read=False).count()
     
-    # Get admin contact info
-    admin_user = User.objects.filter(is_superuser=True).first()
-    admin_email = admin_user.email if admin_user else None
-    admin_whatsapp = admin_user.profile.whatsapp_number if admin_user and hasattr(admin_user, 'profile') else None
+    # Newest first, one page at a time; ?archived=1 shows the archive instead
+    archived = request.GET.get('archived') == '1'
+    source = ArchivedNotification if archived else Notification
+    page = KeysetPaginator(source.objects.filter(user=request.user), NOTIFICATIONS_PAGE_SIZE).get_page(request.GET.get('cursor'))
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_query = params.urlencode()
+    
+    # The archive link is offered once the last page of current notifications is reached
+    has_archive = not archived and not page.has_next and ArchivedNotification.objects.filter(user=request.user).exists()
+    
+    # Admin contact info, only needed for rejected listings
+    admin_email = admin_whatsapp = None
+    if any(notif.kind == 'listing_rejected' or 'rejected and removed by admin' in notif.message for notif in page):
+        admin_email, admin_whatsapp = _admin_contact()
     
     return render(request, 'cars/notifications.html', {
-        'notifications': notifs,
-        'unread_count': unread_count,
+        'notifications': page.items,
+        'next_query': next_query,
+        'archived': archived,
+        'has_archive': has_archive,
+        'unread_count': notification_counts.unread_count(request),
         'admin_email': admin_email,
         'admin_whatsapp': admin_whatsapp
     })
@@ -737,18 +864,27 @@ def notifications(request):
 @login_required
 def mark_all_read(request):
     if request.method == 'POST':
-        Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+        notification_counts.mark_all_read(request.user)
         messages.success(request, "All notifications marked as read.")
     return redirect('notifications')
 
-from django.http import JsonResponse
-
 def notification_count_api(request):
     if not request.user.is_authenticated:
         return JsonResponse({'count': 0})
     
-    count = Notification.objects.filter(user=request.user, is_read=False).count()
-    return JsonResponse({'count': count})
+    return JsonResponse({'count': notification_counts.unread_count(request)})
+
+async def notification_stream(request):
+    """Server-sent events with the unread count, pushed as notifications arrive"""
+    user = await request.auser()
+    # 204 tells EventSource to stop reconnecting, and base.html falls back to polling.
+    # Streams need the ASGI server (car_hub/asgi.py); under WSGI they would hold a worker thread.
+    if not user.is_authenticated or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    response = StreamingHttpResponse(notification_counts.event_stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 @login_required
 def follow_car(request, car_id):
@@ -768,41 +904,57 @@ def admin_dashboard(request):
         messages.error(request, "You do not have permission to access the admin dashboard.")
         return redirect('home')
     
-    # Get statistics
-    from django.db.models import Count
-    total_users = User.objects.filter(is_superuser=False).count()
-    total_cars = Car.objects.count()
-    available_cars = Car.objects.filter(status='available').count()
-    sold_cars = Car.objects.filter(status='sold').count()
-    pending_orders = Order.objects.filter(status='pending').count()
+    # Counters and recent activity come from a short-lived cached snapshot (see dashboard.py)
+    return render(request, 'cars/admin_dashboard.html', dashboard.get_snapshot())
+
+MODERATION_PAGE_SIZE = 50
+
+@login_required
+def moderation_queue(request):
+    """Listings waiting for approval, newest first"""
+    if not request.user.is_superuser:
+        messages.error(request, "You do not have permission to access the admin dashboard.")
+        return redirect('home')
     
-    # Get recent users with their car count (exclude superusers)
-    recent_users = User.objects.filter(is_superuser=False).annotate(car_count=Count('car')).order_by('-date_joined')[:10]
-    recent_users_data = [{'user': user, 'car_count': user.car_count} for user in recent_users]
+    pending = Car.objects.filter(approval_status='pending').select_related('owner', 'cover_image')
+    page = KeysetPaginator(pending, MODERATION_PAGE_SIZE).get_page(request.GET.get('cursor'))
+    next_query = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_query = params.urlencode()
     
-    # Get recent cars
-    recent_cars = Car.objects.all().order_by('-created_at')[:10]
+    return render(request, 'cars/moderation_queue.html', {'page': page, 'next_query': next_query})
+
+@login_required
+def moderate_cars(request):
+    """Approve or reject the listings ticked in the moderation queue in one go"""
+    if request.method != 'POST':
+        return redirect('moderation_queue')
+    
+    car_ids = [int(car_id) for car_id in request.POST.getlist('car_ids') if car_id.isdigit()]
+    proxy = CarAccessProxy(request.user, UnitOfWork.for_request(request))
+    if request.POST.get('action') == 'approve':
+        success, msg = proxy.approve_cars(car_ids)
+    else:
+        success, msg = proxy.reject_cars(car_ids, request.POST.get('reason', ''))
     
-    # Get recent orders
-    recent_orders = Order.objects.all().order_by('-created_at')[:10]
+    if success:
+        dashboard.invalidate_snapshot()
+        messages.success(request, msg)
+    else:
+        messages.error(request, msg)
     
-    return render(request, 'cars/admin_dashboard.html', {
-        'total_users': total_users,
-        'total_cars': total_cars,
-        'available_cars': available_cars,
-        'sold_cars': sold_cars,
-        'pending_orders': pending_orders,
-        'recent_users': recent_users_data,
-        'recent_cars': recent_cars,
-        'recent_orders': recent_orders,
-    })
+    return redirect('moderation_queue')
 
 @login_required
 def approve_car(request, car_id):
-    proxy = CarAccessProxy(request.user)
+    proxy = CarAccessProxy(request.user, UnitOfWork.for_request(request))
     success, msg = proxy.approve_car(car_id)
     
     if success:
+        # The dashboard's recent cars list shows the approval status
+        dashboard.invalidate_snapshot()
         messages.success(request, msg)
     else:
         messages.error(request, msg)
@@ -811,11 +963,13 @@ def approve_car(request, car_id):
 
 @login_required
 def reject_car(request, car_id):
-    proxy = CarAccessProxy(request.user)
+    proxy = CarAccessProxy(request.user, UnitOfWork.for_request(request))
     reason = request.POST.get('reason', '') if request.method == 'POST' else ''
     success, msg = proxy.reject_car(car_id, reason)
     
     if success:
+        # The admin is sent back to the dashboard, which should show the change
+        dashboard.invalidate_snapshot()
         messages.success(request, msg)
     else:
         messages.error(request, msg)